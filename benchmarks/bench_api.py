@@ -0,0 +1,185 @@
+"""Load test for the HTTP API: requests per second and latency per endpoint.
+
+Seeds a catalog of --books titles and --users readers, starts teakapi.py in
+its own process on a free port and lets --clients keep-alive clients loose on
+it for --seconds.  Each client picks searches, book lookups and borrow cycles
+(borrow, list the reader's loans, return) in the --mix proportions.  409s for
+a book with no copies left are part of the workload; 5xx responses and
+connection errors are counted as errors and fail the run.
+
+    python benchmarks/bench_api.py --clients 32 --seconds 20
+    python benchmarks/bench_api.py --mysql   # LIBRARY_DB_*; use a scratch database, rows are added
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from teakcore import encrypt_password, open_store
+from teakstore import SQLiteStore
+
+WORDS = ["river", "stone", "winter", "garden", "shadow", "letters", "harbor", "silver", "forest", "night",
+         "empire", "orchard", "signal", "lantern", "desert", "voyage", "glass", "engine", "meadow", "crown"]
+
+
+def seed(store, books, users, tag, rng):
+    """Titles and readers for the run; returns (book ids, reader emails)"""
+    catalog = [(f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {tag} {n}", f"Author {n % 500}",
+                f"Category {n % 25}", rng.randint(1, 3)) for n in range(books)]
+    for start in range(0, books, 1000):
+        store.import_books(catalog[start:start + 1000])
+    book_ids = [row[0] for row in store._fetchall("SELECT book_id FROM books WHERE title LIKE %s",
+                                                  (f"% {tag} %",))]
+    emails = [f"reader-{tag}-{n}@example.com" for n in range(users)]
+    password = encrypt_password("x")  # Hashing is slow on purpose; the readers can share one
+    for n, email in enumerate(emails):
+        store.create_user(f"Reader {n}", email, password)
+    return book_ids, emails
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(env, port):
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "teakapi.py"), "--port", str(port), "--quiet"],
+                              env=env, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    if not line.startswith("Serving"):
+        server.kill()
+        sys.exit(f"API server did not start: {line.strip()}")
+    return server
+
+
+class Client:
+    """One keep-alive connection issuing requests and timing each one"""
+
+    def __init__(self, port, latencies, statuses, lock):
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        self.latencies = latencies
+        self.statuses = statuses
+        self.lock = lock
+
+    def request(self, name, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if data else {}
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, data, headers)
+            response = self.conn.getresponse()
+            payload = json.loads(response.read())
+            status = response.status
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            self.conn.close()
+            payload, status = None, type(e).__name__
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.latencies[name].append(elapsed)
+            self.statuses[status] += 1
+        return status, payload
+
+
+def run_client(client, deadline, mix, book_ids, emails, rng):
+    while time.perf_counter() < deadline:
+        pick = rng.random()
+        if pick < mix[0]:
+            client.request("search", "GET", f"/books?q={rng.choice(WORDS)}+{rng.choice(WORDS)[:3]}&limit=20")
+        elif pick < mix[0] + mix[1]:
+            client.request("book", "GET", f"/books/{rng.choice(book_ids)}")
+        else:
+            # Each client has readers of its own, so a reader has at most this one loan open
+            email = rng.choice(emails)
+            status, _ = client.request("borrow", "POST", "/loans", {"user": email, "book_id": rng.choice(book_ids)})
+            if status != 201:
+                continue
+            status, payload = client.request("loans", "GET", f"/users/{email}/loans")
+            if status == 200:
+                for loan in payload["loans"]:
+                    if loan["status"] != "Returned":
+                        client.request("return", "POST", f"/loans/{loan['borrow_id']}/return")
+
+
+def percentile(samples, fraction):
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=640)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--pool", type=int, default=8, help="database connections of the server")
+    parser.add_argument("--mix", default="60,25,15", help="percent of searches, book lookups and borrow cycles")
+    parser.add_argument("--mysql", action="store_true", help="use the MySQL database from LIBRARY_DB_*")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    mix = [int(part) / 100 for part in args.mix.split(",")]
+    rng = random.Random(args.seed)
+    tag = f"api{os.getpid()}x{int(time.time())}"
+    env = dict(os.environ, LIBRARY_DB_POOL_SIZE=str(args.pool))
+    env.pop("LIBRARY_API_TOKEN", None)
+    if args.mysql:
+        store = open_store("mysql")
+        env["LIBRARY_DB_BACKEND"] = "mysql"
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "bench_api.db")
+        store = SQLiteStore(path)
+        env.update(LIBRARY_DB_BACKEND="sqlite", LIBRARY_SQLITE_PATH=path)
+    start = time.perf_counter()
+    book_ids, emails = seed(store, args.books, args.users, tag, rng)
+    store.close()
+    print(f"seeded {len(book_ids):,} books and {len(emails):,} readers in {time.perf_counter() - start:.1f}s")
+
+    port = free_port()
+    server = start_server(env, port)
+    latencies, statuses, lock = defaultdict(list), Counter(), threading.Lock()
+    try:
+        deadline = time.perf_counter() + args.seconds
+        threads = [threading.Thread(target=run_client, args=(
+            Client(port, latencies, statuses, lock), deadline, mix, book_ids, emails[n::args.clients],
+            random.Random(args.seed + n))) for n in range(args.clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{'endpoint':<10}{'requests':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    everything = []
+    for name, samples in sorted(latencies.items()):
+        samples.sort()
+        everything.extend(samples)
+        print(f"{name:<10}{len(samples):>10,}{percentile(samples, 0.5):>10.1f}{percentile(samples, 0.99):>10.1f}"
+              f"{samples[-1]:>10.1f}")
+    everything.sort()
+    print(f"{'all':<10}{len(everything):>10,}{percentile(everything, 0.5):>10.1f}"
+          f"{percentile(everything, 0.99):>10.1f}{everything[-1]:>10.1f}")
+    print(f"{len(everything) / elapsed:,.0f} requests/s with {args.clients} clients over {elapsed:.1f}s; "
+          f"responses {dict(statuses)}")
+    errors = sum(count for status, count in statuses.items() if not isinstance(status, int) or status >= 500)
+    if errors:
+        print(f"FAIL    {errors} requests failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
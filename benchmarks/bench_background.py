@@ -0,0 +1,64 @@
+"""Cost of showing the background on a page change, before and after the image cache.
+
+Writes a synthetic --width x --height PNG and times the old per-page pipeline
+(open, decode, LANCZOS resize) against ScaledImage lookups of a cached size
+and the preview resample used while a window is dragged.  The PhotoImage
+conversion is left out so no display is needed; it was paid on every page
+before and is cached along with the scaled image now.
+
+    python benchmarks/bench_background.py
+    python benchmarks/bench_background.py --image library.png
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from teakimage import ScaledImage
+
+
+def timed(label, call, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<22} median {statistics.median(samples):9.3f} ms   max {max(samples):9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image", help="source image (default: a synthetic PNG)")
+    parser.add_argument("--width", type=int, default=2560)
+    parser.add_argument("--height", type=int, default=1600)
+    parser.add_argument("--window", default="1000x700", help="window size to scale to")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    path = args.image
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "background.png")
+        Image.effect_mandelbrot((args.width, args.height), (-2.2, -1.3, 0.8, 1.3), 100).convert("RGB").save(path)
+    size = tuple(int(n) for n in args.window.split("x"))
+
+    def uncached():
+        image = Image.open(path)
+        image.resize(size, Image.Resampling.LANCZOS)
+
+    timed("open + LANCZOS", uncached, args.runs)
+    cache = ScaledImage(path, make_photo=lambda image: image)
+    start = time.perf_counter()
+    cache.photo(*size)
+    print(f"{'first ScaledImage':<22} {(time.perf_counter() - start) * 1000:16.3f} ms (decode once + scale)")
+    timed("cached size", lambda: cache.photo(*size), args.runs)
+    timed("drag preview", lambda: cache.photo(size[0] + 13, size[1] + 7, preview=True), args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Catalog onboarding speed: one add_book() per title versus the bulk importer.
+
+Writes a synthetic CSV of --books titles over --categories categories, adds
+the first --single of them one by one through LibraryStore.add_book() (what
+the Add Book form does) and imports the whole file into a second database
+through teakimport.CatalogImport, then prints the rate of each.
+
+    python benchmarks/bench_import.py --books 50000
+    python benchmarks/bench_import.py --mysql   # LIBRARY_DB_*; use a scratch database, rows are added
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from teakimport import CatalogImport
+from teakschema import migrate
+from teakstore import SQLiteStore, open_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=50000)
+    parser.add_argument("--categories", type=int, default=40)
+    parser.add_argument("--single", type=int, default=2000, help="titles added one by one for comparison")
+    parser.add_argument("--mysql", action="store_true", help="use the MySQL database from LIBRARY_DB_*")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    tag = f"{os.getpid()}-{int(time.time())}"
+    path = os.path.join(directory, "catalog.csv")
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["title", "author", "category", "copies"])
+        for n in range(args.books):
+            writer.writerow([f"Import Title {tag} {n:07d}", f"Author {n % 997}", f"Import Category {n % args.categories}",
+                             n % 4 + 1])
+
+    def new_store(name):
+        if args.mysql:
+            store = open_store("mysql")
+            migrate(store)
+            return store
+        return SQLiteStore(os.path.join(directory, name))
+
+    store = new_store("single.db")
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))[:args.single]
+    start = time.perf_counter()
+    for row in rows:
+        store.add_book(row["title"] + " single", row["author"], row["category"], int(row["copies"]))
+    elapsed = time.perf_counter() - start
+    print(f"add_book   {len(rows):>8,} titles in {elapsed:7.2f}s  {len(rows) / elapsed:10,.0f} titles/s")
+    store.close()
+
+    store = new_store("bulk.db")
+    job = CatalogImport(store, path)
+    start = time.perf_counter()
+    for _ in job.run():
+        pass
+    elapsed = time.perf_counter() - start
+    print(f"import     {job.imported:>8,} titles in {elapsed:7.2f}s  {job.imported / elapsed:10,.0f} titles/s"
+          f"  ({job.rejected} rejected)")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Login throughput: what the password hash costs, and what sessions save.
+
+For each scrypt cost in --costs (log2 n, see teakcore.PASSWORD_COST) it
+times one hash, then lets --threads threads log in as random readers of a
+scratch SQLite database for --seconds: logins per second and latency,
+including the users lookup.  The session phase then times the check a
+request with a session token makes instead.  The default cost should leave
+a single login well under the time a reader notices (a few hundred ms) while
+one core still manages a handful of logins a second; the first login of a
+reader with an old SHA-256 hash pays one extra hash to upgrade it.
+
+    python benchmarks/bench_login.py --costs 14,15,16 --threads 4
+"""
+import argparse
+import hashlib
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import teakcore
+from teakcore import SessionStore, encrypt_password, login
+from teakstore import SQLiteStore
+
+
+def seed(store, users):
+    """Readers with an old SHA-256 hash, as a database from before scrypt has them"""
+    legacy = hashlib.sha256(b"secret").hexdigest()
+    emails = [f"login-reader-{n}@example.com" for n in range(users)]
+    for n, email in enumerate(emails):
+        store.create_user(f"Reader {n}", email, legacy)
+    return emails
+
+
+def percentile(samples, fraction):
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def hammer(seconds, threads, work):
+    """Run work(rng) from several threads for a while; returns (calls/s, sorted latencies in ms)"""
+    latencies, lock = [], threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(n):
+        rng, own = random.Random(n), []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            work(rng)
+            own.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(own)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    latencies.sort()
+    return len(latencies) / (time.perf_counter() - start), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--costs", default=f"{teakcore.PASSWORD_COST - 1},{teakcore.PASSWORD_COST},"
+                                           f"{teakcore.PASSWORD_COST + 1}", help="scrypt costs to try (log2 n)")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'cost':<6}{'hash ms':>9}{'upgrade ms':>12}{'logins/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    for cost in [int(part) for part in args.costs.split(",")]:
+        teakcore.PASSWORD_COST = cost  # What login() rehashes to
+        store = SQLiteStore(os.path.join(tempfile.mkdtemp(), "bench_login.db"))
+        emails = seed(store, args.users)
+
+        hashes = []
+        for _ in range(3):
+            start = time.perf_counter()
+            encrypt_password("secret")
+            hashes.append((time.perf_counter() - start) * 1000)
+        # First logins verify the old hash and store a new one
+        upgrades = []
+        for email in emails:
+            start = time.perf_counter()
+            if login(store, email, "secret") is None:
+                sys.exit(f"login failed for {email}")
+            upgrades.append((time.perf_counter() - start) * 1000)
+
+        rate, latencies = hammer(args.seconds, args.threads, lambda rng: login(store, rng.choice(emails), "secret"))
+        print(f"{cost:<6}{statistics.median(hashes):>9.1f}{statistics.median(upgrades):>12.1f}{rate:>10.1f}"
+              f"{percentile(latencies, 0.5):>9.1f}{percentile(latencies, 0.99):>9.1f}")
+        store.close()
+
+    sessions = SessionStore()
+    tokens = [sessions.open((n, "user", f"Reader {n}")) for n in range(args.users)]
+    rate, latencies = hammer(args.seconds, args.threads, lambda rng: sessions.get(rng.choice(tokens)))
+    print(f"session checks: {rate:,.0f}/s, p99 {percentile(latencies, 0.99) * 1000:.1f} µs "
+          f"with {args.threads} threads")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Per-operation latency of connect-per-call versus the connection pool.
+
+By default a simulated server is used whose handshake costs --handshake-ms,
+so the benchmark runs anywhere.  Pass --mysql to measure a real server with
+the same connection settings teaklib uses.
+
+    python benchmarks/bench_pool.py
+    python benchmarks/bench_pool.py --mysql --host localhost --user root
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from teakpool import ConnectionPool
+
+
+# SIMULATED SERVER
+class FakeCursor:
+    def __init__(self, query_s):
+        self.query_s = query_s
+
+    def execute(self, sql, params=None):
+        time.sleep(self.query_s)
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, handshake_s, query_s):
+        time.sleep(handshake_s)
+        self.query_s = query_s
+
+    def cursor(self):
+        return FakeCursor(self.query_s)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def run(label, open_conn, operations):
+    samples = []
+    for _ in range(operations):
+        start = time.perf_counter()
+        db = open_conn()
+        cur = db.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchall()
+        cur.close()
+        db.close()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<12} mean {statistics.mean(samples):8.3f} ms   "
+          f"median {statistics.median(samples):8.3f} ms   p95 {p95:8.3f} ms")
+    return statistics.mean(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--operations", type=int, default=200)
+    parser.add_argument("--handshake-ms", type=float, default=5.0)
+    parser.add_argument("--query-ms", type=float, default=0.2)
+    parser.add_argument("--mysql", action="store_true", help="benchmark a real MySQL server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--database", default="library_system")
+    args = parser.parse_args()
+
+    if args.mysql:
+        import mysql.connector
+
+        def connect():
+            return mysql.connector.connect(host=args.host, user=args.user, password=args.password,
+                                           database=args.database, consume_results=True)
+    else:
+        def connect():
+            return FakeConnection(args.handshake_ms / 1000, args.query_ms / 1000)
+
+    pool = ConnectionPool(connect, size=2)
+    unpooled = run("unpooled", connect, args.operations)
+    pooled = run("pooled", pool.connect, args.operations)
+    pool.close_all()
+    print(f"speedup      {unpooled / pooled:.1f}x   pool stats {pool.stats}")
+
+
+if __name__ == "__main__":
+    main()
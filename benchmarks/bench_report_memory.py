@@ -0,0 +1,82 @@
+"""Peak memory of the borrowing report, loaded whole versus streamed.
+
+Seeds --loans loans of one book into a scratch SQLite file, then reads the
+book's history once with fetchall() (the old book_borrowings path) and once
+through stream_book_borrowings() keeping only a StreamingReport-sized window
+of rows, and prints the tracemalloc peak of each.  The streamed peak should
+stay flat as --loans grows.
+
+    python benchmarks/bench_report_memory.py --loans 200000
+    python benchmarks/bench_report_memory.py --mysql   # LIBRARY_DB_*; use a scratch database, rows are added
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from teakschema import migrate
+from teakstore import STREAM_BATCH, SQLiteStore, open_store
+
+SHOWN_ROWS = 5000  # REPORT_MAX_ROWS in teaklib.py
+
+
+def seed(store, loans):
+    book_id = store.add_book(f"Report Title {os.getpid()}", "Report Author", "Reports", 1)
+    user_id = store.create_user("Report Reader", f"report-{os.getpid()}-{int(time.time())}@example.com", "x")
+    today = date.today()
+    with store.transaction() as cur:
+        for start in range(0, loans, 10000):
+            cur.executemany("INSERT INTO borrowed (user_id, book_id, borrow_date, due_date, return_date) "
+                            "VALUES (%s, %s, %s, %s, %s)",
+                            [(user_id, book_id, today - timedelta(days=n % 3000),
+                              today - timedelta(days=n % 3000 - 14), today)
+                             for n in range(start, min(start + 10000, loans))])
+    return book_id
+
+
+def measure(label, call):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = call()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<10} {rows:>9,} rows in {elapsed:6.2f}s   peak {peak / 2 ** 20:8.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--loans", type=int, default=200000)
+    parser.add_argument("--batch", type=int, default=STREAM_BATCH)
+    parser.add_argument("--mysql", action="store_true", help="use the MySQL database from LIBRARY_DB_*")
+    args = parser.parse_args()
+
+    if args.mysql:
+        store = open_store("mysql")
+        migrate(store)
+    else:
+        store = SQLiteStore(os.path.join(tempfile.mkdtemp(), "report.db"))
+    book_id = seed(store, args.loans)
+
+    def whole():
+        return len(store.book_borrowings(book_id))
+
+    def streamed():
+        shown, rows = [], 0
+        for batch in store.stream_book_borrowings(book_id, args.batch):
+            rows += len(batch)
+            shown.extend(batch[:SHOWN_ROWS - len(shown)])
+        return rows
+
+    measure("fetchall", whole)
+    measure("streamed", streamed)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Desk scan latency: checking a copy out and back in by its barcode.
+
+Seeds --books titles with --copies copies each, then scans random copies out
+to random readers and back in again, one at a time as a desk would, timing
+every borrow_copy and return_copy.  A scan is a unique-index lookup of the
+barcode plus a handful of primary-key writes, so its latency should not
+depend on the size of the catalog; the run fails (exit status 1) if the p99
+of either scan exceeds --budget ms.  The batch phase then checks piles of
+--batch copies out and in with borrow_copies / return_copies, one transaction
+a pile, next to the same pile scanned one copy at a time.
+
+    python benchmarks/bench_scan.py --books 20000 --copies 3
+    python benchmarks/bench_scan.py --mysql    # LIBRARY_DB_* settings, cleans up after itself
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from teakschema import copy_barcode
+from teakstore import SQLiteStore, open_store
+
+
+def percentile(samples, fraction):
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def timed(samples, call, *args):
+    start = time.perf_counter()
+    result = call(*args)
+    samples.append((time.perf_counter() - start) * 1000)
+    return result
+
+
+def summary(name, samples):
+    samples.sort()
+    return (f"{name:<10}{len(samples):>7,} scans   p50 {percentile(samples, 0.5):6.2f} ms   "
+            f"p99 {percentile(samples, 0.99):6.2f} ms   max {samples[-1]:6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--copies", type=int, default=3)
+    parser.add_argument("--readers", type=int, default=200)
+    parser.add_argument("--scans", type=int, default=2000, help="copies checked out and back in")
+    parser.add_argument("--budget", type=float, default=10, help="fail if a scan's p99 is slower (ms)")
+    parser.add_argument("--batch", type=int, default=15, help="copies per pile in the batch phase")
+    parser.add_argument("--piles", type=int, default=100, help="piles checked out and in by the batch phase")
+    parser.add_argument("--mysql", action="store_true", help="run against the MySQL database from LIBRARY_DB_*")
+    args = parser.parse_args()
+
+    if args.mysql:
+        store = open_store("mysql")
+    else:
+        store = SQLiteStore(os.path.join(tempfile.mkdtemp(), "bench_scan.db"))
+
+    tag = f"scan-{os.getpid()}-{int(time.time())}"
+    store.import_books([(f"{tag} Title {n}", "Scan Author", "Scan Tests", args.copies) for n in range(args.books)])
+    book_ids = [row[0] for row in store._fetchall("SELECT book_id FROM books WHERE title LIKE %s", (f"{tag} %",))]
+    readers = [store.create_user(f"Reader {n}", f"{tag}-{n}@example.com", "x") for n in range(args.readers)]
+    failures = []
+    try:
+        rng = random.Random(0)
+        checkouts, checkins = [], []
+        for _ in range(args.scans):
+            barcode = copy_barcode(rng.choice(book_ids), rng.randint(1, args.copies))
+            timed(checkouts, store.borrow_copy, rng.choice(readers), barcode)
+            timed(checkins, store.return_copy, barcode)
+
+        print(f"{args.books:,} books with {args.copies} copies each")
+        for name, samples in (("check out", checkouts), ("check in", checkins)):
+            print(summary(name, samples))
+            if percentile(samples, 0.99) > args.budget:
+                failures.append(f"{name} p99 {percentile(samples, 0.99):.2f} ms, budget {args.budget:.0f} ms")
+        available = store._fetchone("SELECT SUM(available_copies) FROM books WHERE title LIKE %s", (f"{tag} %",))[0]
+        if available != args.books * args.copies:
+            failures.append(f"{available} copies available after every scan was returned, "
+                            f"expected {args.books * args.copies}")
+        print(f"median scan pair {statistics.median(a + b for a, b in zip(checkouts, checkins)):.2f} ms")
+
+        singles, batches = [], []
+        for _ in range(args.piles):
+            reader = rng.choice(readers)
+            pile = [copy_barcode(book_id, 1) for book_id in rng.sample(book_ids, args.batch)]
+            start = time.perf_counter()
+            for barcode in pile:
+                store.borrow_copy(reader, barcode)
+            for barcode in pile:
+                store.return_copy(barcode)
+            singles.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            lent = store.borrow_copies(reader, pile)
+            returned = store.return_copies(pile)
+            batches.append((time.perf_counter() - start) * 1000)
+            refused = [error for _, _, error in lent + returned if error]
+            if refused:
+                failures.append(f"batch refused {len(refused)} items: {refused[0]}")
+                break
+        print(f"pile of {args.batch} out and back in: one at a time {statistics.median(singles):6.2f} ms, "
+              f"batched {statistics.median(batches):6.2f} ms (medians of {len(batches)})")
+    finally:
+        with store.transaction() as cur:
+            for book_id in book_ids:
+                cur.execute("DELETE FROM borrowed WHERE book_id = %s", (book_id,))
+                cur.execute("DELETE FROM copies WHERE book_id = %s", (book_id,))
+                cur.execute("DELETE FROM books WHERE book_id = %s", (book_id,))
+            cur.executemany("DELETE FROM users WHERE user_id = %s", [(user_id,) for user_id in readers])
+        store.close()
+
+    for failure in failures:
+        print(f"FAIL    {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
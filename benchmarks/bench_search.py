@@ -0,0 +1,105 @@
+"""Catalog search latency on a synthetic catalog, full-text index versus LIKE.
+
+Builds (or reuses) an SQLite catalog of --books titles and times ranked
+prefix searches through LibraryStore.search_books, then a handful of the
+leading-wildcard LIKE scans the search replaced.
+
+    python benchmarks/bench_search.py --books 500000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from teakstore import SQLiteStore
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "ten", "sor", "vel", "an", "dro", "qui", "bel", "nor",
+             "es", "tu", "fin", "gal", "ho", "ri", "zan", "mor", "el", "ith", "por", "sa"]
+
+
+def make_vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def populate(store, books, rng):
+    vocabulary = make_vocabulary(rng, 20000)
+    surnames = make_vocabulary(rng, 3000)
+    categories = [f"{word.title()} Studies" for word in rng.sample(vocabulary, 60)]
+    with store.transaction() as cur:
+        cur.executemany("INSERT INTO categories (category_name) VALUES (%s)", [(name,) for name in categories])
+        batch = []
+        for book_id in range(1, books + 1):
+            title = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(2, 6))).title() + f" {book_id}"
+            author = f"{rng.choice(surnames).title()} {rng.choice(surnames).title()}"
+            copies = rng.randint(1, 4)
+            batch.append((title, author, rng.randint(1, len(categories)), copies, rng.randint(0, copies)))
+            if len(batch) == 10000:
+                cur.executemany("INSERT INTO books (title, author, category_id, total_copies, available_copies) "
+                                "VALUES (%s, %s, %s, %s, %s)", batch)
+                batch = []
+        if batch:
+            cur.executemany("INSERT INTO books (title, author, category_id, total_copies, available_copies) "
+                            "VALUES (%s, %s, %s, %s, %s)", batch)
+    return vocabulary
+
+
+def timed(samples):
+    samples.sort()
+    return (f"median {statistics.median(samples):7.2f} ms   p95 {samples[int(len(samples) * 0.95) - 1]:7.2f} ms   "
+            f"max {samples[-1]:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--db", help="catalog file to build or reuse (default: a temporary file)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench_search.db")
+    store = SQLiteStore(path)
+    if store.count_books() < args.books:
+        start = time.perf_counter()
+        vocabulary = populate(store, args.books - store.count_books(), rng)
+        print(f"built {args.books} books in {time.perf_counter() - start:.1f}s at {path}")
+    else:
+        vocabulary = make_vocabulary(rng, 20000)
+
+    queries = []
+    for _ in range(args.queries):
+        words = rng.sample(vocabulary, rng.randint(1, 2))
+        queries.append(" ".join(word[:rng.randint(3, len(word))] for word in words))
+
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        store.search_books(query, limit=50)
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"full-text   {timed(samples)}")
+
+    samples = []
+    for query in queries[:10]:
+        start = time.perf_counter()
+        store._fetchall("""
+            SELECT b.book_id, b.title, b.author, c.category_name, b.available_copies
+            FROM books b JOIN categories c ON b.category_id = c.category_id
+            WHERE b.available_copies > 0 AND (b.title LIKE %s OR b.author LIKE %s OR c.category_name LIKE %s)
+            ORDER BY b.title LIMIT 50
+        """, (f"%{query}%",) * 3)
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"LIKE scan   {timed(samples)}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Startup time of the window: import time and time to the first drawn page.
+
+Each run starts a fresh interpreter against a scratch SQLite database.  The
+import phase times "import teaklib" with -X importtime and lists the slowest
+modules; it fails if a module that should only load on demand (Pillow, the
+MySQL driver, the bulk import/export and fines code) has been imported
+eagerly again, or if --import-budget is exceeded.  The frame phase needs a display (run
+under xvfb-run on a server): it times creating the window until the main
+menu has been drawn, and until the background image has followed.
+
+    python benchmarks/bench_startup.py --runs 10
+    xvfb-run python benchmarks/bench_startup.py --frame-budget 400
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules teaklib must not import until they are needed
+ON_DEMAND = ["PIL", "mysql", "teakimport", "teakexport", "teakfines"]
+
+IMPORT_SCRIPT = """
+import json, sys
+sys.path.insert(0, {root!r})
+import teaklib
+print(json.dumps([name for name in {on_demand!r} if name in sys.modules]))
+"""
+
+FRAME_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import teaklib
+imported = time.perf_counter()
+teaklib.background.path = {image!r}
+marks = {{}}
+
+def drawn():
+    marks.setdefault("frame", time.perf_counter())
+
+window = teaklib.start()
+# Redraws run as idle callbacks after an Expose; one queued behind them runs once drawn
+window.bind("<Expose>", lambda event: window.after_idle(drawn), add="+")
+deadline = time.perf_counter() + 20
+while time.perf_counter() < deadline:
+    window.update()
+    if "background" not in marks and teaklib.bg_label is not None:
+        marks["background"] = time.perf_counter()
+    if len(marks) == 2:
+        break
+    time.sleep(0.001)
+teaklib.tasks.shutdown()
+window.destroy()
+print(json.dumps({{"import": imported - start, "frame": marks.get("frame", float("nan")) - imported,
+                  "background": marks.get("background", float("nan")) - imported}}))
+"""
+
+
+def run(script, env, *flags):
+    result = subprocess.run([sys.executable, *flags, "-c", script], env=env, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return result
+
+
+def import_times(stderr):
+    """{module: (self µs, cumulative µs)} from -X importtime output"""
+    times = {}
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            own, cumulative, name = line[len("import time:"):].split("|")
+            if own.strip().isdigit():
+                times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def summary(samples):
+    return f"median {statistics.median(samples):7.1f} ms   max {max(samples):7.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--image", help="background image for the frame phase (default: a synthetic PNG)")
+    parser.add_argument("--import-budget", type=float, help="fail if importing teaklib takes longer (ms, median)")
+    parser.add_argument("--frame-budget", type=float, help="fail if the first page takes longer (ms, median)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    env = dict(os.environ, LIBRARY_DB_BACKEND="sqlite", LIBRARY_SQLITE_PATH=os.path.join(directory, "startup.db"))
+    failures = []
+
+    samples, slowest = [], {}
+    for _ in range(args.runs):
+        result = run(IMPORT_SCRIPT.format(root=ROOT, on_demand=ON_DEMAND), env, "-X", "importtime")
+        times = import_times(result.stderr)
+        samples.append(times["teaklib"][1] / 1000)
+        for name, (own, _) in times.items():
+            slowest[name] = slowest.get(name, 0) + own / args.runs
+    eager = json.loads(result.stdout)
+    print(f"import teaklib        {summary(samples)}")
+    for name, own in sorted(slowest.items(), key=lambda item: -item[1])[:8]:
+        print(f"    {name:<28} {own / 1000:7.1f} ms own time")
+    if eager:
+        failures.append(f"imported at startup although only needed on demand: {', '.join(eager)}")
+    if args.import_budget and statistics.median(samples) > args.import_budget:
+        failures.append(f"import took {statistics.median(samples):.1f} ms, budget {args.import_budget:.0f} ms")
+
+    image = args.image
+    if image is None:
+        from PIL import Image
+        image = os.path.join(directory, "background.png")
+        Image.effect_mandelbrot((2560, 1600), (-2.2, -1.3, 0.8, 1.3), 100).convert("RGB").save(image)
+    try:
+        runs = [json.loads(run(FRAME_SCRIPT.format(root=ROOT, image=image), env).stdout) for _ in range(args.runs)]
+    except RuntimeError as e:
+        print(f"first frame           skipped: {e} (run under xvfb-run without a display)")
+    else:
+        frame = [sample["frame"] * 1000 for sample in runs]
+        print(f"first page drawn      {summary(frame)}   (after import)")
+        print(f"background shown      {summary([sample['background'] * 1000 for sample in runs])}")
+        if args.frame_budget and statistics.median(frame) > args.frame_budget:
+            failures.append(f"first page took {statistics.median(frame):.1f} ms, budget {args.frame_budget:.0f} ms")
+
+    for failure in failures:
+        print(f"FAIL    {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
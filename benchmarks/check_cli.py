@@ -0,0 +1,59 @@
+"""Fails if a command shown in teakcli.py's docstring no longer runs.
+
+Every "python teakcli.py ..." line of the docstring is run as written (the
+comment and any output redirection dropped) in a scratch directory against
+a scratch SQLite database with a reader, a few books and a catalog.csv.  A
+command may report a library error, such as a loan that does not exist, but
+a usage error (exit status 2) or a traceback fails the check.
+
+    python benchmarks/check_cli.py
+"""
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import teakcli
+from teakstore import SQLiteStore
+
+
+def documented_commands():
+    for line in teakcli.__doc__.splitlines():
+        line = line.strip()
+        if line.startswith("python teakcli.py "):
+            line = line.split("#")[0].split(">")[0]
+            yield shlex.split(line)[2:]
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, "check_cli.db")
+    store = SQLiteStore(database)
+    store.create_user("Reader", "reader@example.com", "x")
+    store.import_books([(f"Title {n}", "Author", "Checks", 2) for n in range(50)])
+    store.close()
+    with open(os.path.join(directory, "catalog.csv"), "w") as catalog:
+        catalog.write("title,author,category,total_copies\nThe Hobbit,J. R. R. Tolkien,Fantasy,2\n")
+
+    env = dict(os.environ, LIBRARY_DB_BACKEND="sqlite", LIBRARY_SQLITE_PATH=database)
+    failures = []
+    for args in documented_commands():
+        result = subprocess.run([sys.executable, os.path.join(ROOT, "teakcli.py"), *args], cwd=directory,
+                                env=env, capture_output=True, text=True)
+        broken = result.returncode == 2 or "Traceback" in result.stderr
+        print(f"{'FAIL' if broken else 'ok':<8}rc={result.returncode}  teakcli.py {shlex.join(args)}")
+        if broken:
+            failures.append(f"teakcli.py {shlex.join(args)}: {result.stderr.strip().splitlines()[-1:]}")
+
+    for failure in failures:
+        print(f"FAIL    {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Fails if a hot query falls back to a full table scan.
+
+Seeds a database, runs every query the screens fire on a click through
+LibraryStore with statement logging on, and EXPLAINs each statement.  A query
+that reads a whole table (SQLite "SCAN <table>", MySQL type ALL or index)
+fails the check, except for first pages, which may walk an index in ORDER BY
+order because LIMIT stops them after one page.
+
+    python benchmarks/check_plans.py
+    python benchmarks/check_plans.py --mysql   # LIBRARY_DB_*; use a scratch database, rows are added
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from teakfines import FineAssessment
+from teakschema import copy_barcode, migrate
+from teakstore import LibraryError, SQLiteStore, open_store
+
+
+def seed(store, books, users, loans):
+    """Enough rows that the planners have a real choice to make"""
+    with store.transaction() as cur:
+        cur.executemany("INSERT INTO categories (category_name) VALUES (%s)",
+                        [(f"Plan Category {n}",) for n in range(20)])
+        first_category = cur.execute("SELECT MIN(category_id) FROM categories").fetchone()[0]
+        cur.executemany("INSERT INTO books (title, author, category_id, total_copies, available_copies) "
+                        "VALUES (%s, %s, %s, %s, %s)",
+                        [(f"Plan Title {n:06d}", f"Author {n % 97}", first_category + n % 20, 3, n % 4)
+                         for n in range(books)])
+        cur.executemany("INSERT INTO users (full_name, email, password, role) VALUES (%s, %s, %s, 'user')",
+                        [(f"Reader {n}", f"plan-reader-{n}@example.com", f"hash{n}") for n in range(users)])
+        book_ids = [row[0] for row in cur.execute("SELECT book_id FROM books").fetchall()]
+        cur.executemany("INSERT INTO copies (barcode, book_id, status) VALUES (%s, %s, %s)",
+                        [(copy_barcode(book_id, copy + 1), book_id, "available" if copy < n % 4 else "on_loan")
+                         for n, book_id in enumerate(book_ids) for copy in range(3)])
+        user_ids = [row[0] for row in cur.execute("SELECT user_id FROM users").fetchall()]
+        today = date.today()
+        cur.executemany("INSERT INTO borrowed (user_id, book_id, borrow_date, due_date, return_date) "
+                        "VALUES (%s, %s, %s, %s, %s)",
+                        [(user_ids[n % len(user_ids)], book_ids[n * 7 % len(book_ids)],
+                          today - timedelta(days=n % 300), today - timedelta(days=n % 300 - 14),
+                          None if n % 5 else today) for n in range(loans)])
+    return book_ids, user_ids
+
+
+def hot_calls(store, book_ids, user_ids):
+    """(label, first_page, call) for every query a screen runs on a click"""
+    book = store.books_page(limit=1)[0]
+    available = store.available_books_page(limit=1)[0]
+    loan = store.borrowings_page(limit=1)[0]
+    user_id, book_id = user_ids[0], book_ids[-1]
+    # Loaded once per process, not on a click
+    store.category_names()
+    return [
+        ("login_record", False, lambda: store.login_record("plan-reader-1@example.com")),
+        ("user_name", False, lambda: store.user_name(user_id)),
+        ("books_page first", True, lambda: store.books_page()),
+        ("books_page next", False, lambda: store.books_page(store.book_key(book))),
+        ("books_changed_since watermark", False, lambda: store.books_changed_since()),
+        ("books_changed_since", False, lambda: store.books_changed_since(store.books_changed_since()[1])),
+        ("available_books_page first", True, lambda: store.available_books_page()),
+        ("available_books_page next", False, lambda: store.available_books_page(store.available_book_key(available))),
+        ("borrowings_page first", True, lambda: store.borrowings_page()),
+        ("borrowings_page next", False, lambda: store.borrowings_page(store.borrowing_key(loan))),
+        ("book_borrowings", False, lambda: store.book_borrowings(book_id)),
+        ("user_borrowings", False, lambda: store.user_borrowings(user_id)),
+        ("search_books", False, lambda: store.search_books("plan tit", limit=50)),
+        ("add_book", False, lambda: store.add_book("Plan Title new", "Author", "Plan Category 3", 1)),
+        ("update_book", False, lambda: store.update_book(book_id, "Plan Title renamed", "Author", "Plan Category 4", 3)),
+        ("borrow_book", False, lambda: store.borrow_book(user_id, book_id)),
+        ("return_book", False, lambda: store.return_book(store.user_borrowings(user_id)[0][0])),
+        # Desk scans; book_ids[1] has a copy on the shelf
+        ("borrow_copy", False, lambda: store.borrow_copy(user_ids[3], copy_barcode(book_ids[1], 1))),
+        ("return_copy", False, lambda: store.return_copy(copy_barcode(book_ids[1], 1))),
+        ("delete_book check", False, lambda: store.delete_book(book_ids[0])),
+        ("delete_user check", False, lambda: store.delete_user(user_ids[1])),
+        # book_ids[4] is seeded with no copies on the shelf
+        ("place_hold", False, lambda: store.place_hold(user_ids[2], book_ids[4])),
+        ("user_holds", False, lambda: store.user_holds(user_ids[2])),
+        ("hold_position", False, lambda: store.hold_position(store.user_holds(user_ids[2])[0][0])),
+        ("queue_length", False, lambda: store.queue_length(book_ids[4])),
+        ("cancel_hold", False, lambda: store.cancel_hold(store.user_holds(user_ids[2])[0][0])),
+        ("expire_holds", False, lambda: store.expire_holds()),
+        ("users_with_overdue", False, lambda: store.users_with_overdue()),
+        ("fine assessment", False, lambda: list(FineAssessment(store).run())),
+        # Analytics read the circulation summary tables; category_circulation groups
+        # the whole catalog by design and is left out
+        ("most_borrowed", True, lambda: store.most_borrowed()),
+        ("count_active_borrowers", False, lambda: store.count_active_borrowers()),
+        ("active_borrowers", True, lambda: store.active_borrowers()),
+        ("daily_circulation", False, lambda: store.daily_circulation(date.today() - timedelta(days=29))),
+    ]
+
+
+def explain(store, sql, params):
+    """Plan lines and whether they read a whole table or index"""
+    with store.transaction() as cur:
+        if store.dialect == "sqlite":
+            details = [row[3] for row in cur.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+            scans = [d for d in details if d.startswith("SCAN ") and "VIRTUAL TABLE" not in d
+                     and d != "SCAN CONSTANT ROW"]
+            sorts = [d for d in details if "TEMP B-TREE" in d]
+            return details, scans, sorts
+        cur.execute("EXPLAIN " + sql, params)
+        columns = [column[0] for column in cur.description]
+        rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+    details = [f"{row['table']}: type={row['type']} key={row['key']} {row.get('Extra') or ''}" for row in rows]
+    scans = [d for d, row in zip(details, rows) if row["type"] in ("ALL", "index")
+             and not str(row["table"]).startswith("<")]
+    sorts = [d for d, row in zip(details, rows) if "filesort" in str(row.get("Extra")) or
+             "temporary" in str(row.get("Extra"))]
+    return details, scans, sorts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--loans", type=int, default=20000)
+    parser.add_argument("--mysql", action="store_true", help="check the MySQL database from LIBRARY_DB_*")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    if args.mysql:
+        store = open_store("mysql")
+        migrate(store)
+    else:
+        store = SQLiteStore(os.path.join(tempfile.mkdtemp(), "plans.db"))
+    book_ids, user_ids = seed(store, args.books, args.users, args.loans)
+
+    failures = 0
+    for label, first_page, call in hot_calls(store, book_ids, user_ids):
+        store.statement_log = []
+        try:
+            call()
+        except LibraryError:
+            pass  # The refused deletes still ran their checks
+        statements, store.statement_log = store.statement_log, None
+        for sql, params in statements:
+            if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT")):
+                continue
+            details, scans, sorts = explain(store, sql, params)
+            # A first page may stream an index in order and stop at LIMIT
+            bad = scans if not (first_page and "LIMIT" in sql.upper() and not sorts) else []
+            if bad:
+                failures += 1
+            if bad or args.verbose:
+                print(f"{'FULL SCAN' if bad else 'ok':<10} {label}: {' '.join(sql.split())[:110]}")
+                for detail in details:
+                    print(f"           {detail}")
+        if not args.verbose:
+            print(f"{'checked':<10} {label} ({len(statements)} statements)")
+    store.close()
+    if failures:
+        print(f"{failures} statement(s) fall back to a full scan")
+        sys.exit(1)
+    print("no hot query reads a whole table")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Concurrency stress test for borrow/return on a single title.
+
+Many borrower threads are released at the same moment against one book with
+--copies copies; every borrower tries twice, so double borrows are attempted
+too.  Afterwards every loan is returned twice, again concurrently.  The run
+fails (exit status 1) if stock goes negative, more loans succeed than there
+were copies, a user holds two open loans of the book or a loan is returned
+twice.
+
+    python benchmarks/stress_borrow.py --borrowers 64 --copies 10
+    python benchmarks/stress_borrow.py --mysql    # LIBRARY_DB_* settings, cleans up after itself
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from teakstore import LibraryError, SQLiteStore, open_store
+
+
+def hammer(workers, action, items):
+    """Run action(item) for every item on its own thread, all released together"""
+    gate = threading.Barrier(workers)
+    outcomes = Counter()
+    results = []
+    lock = threading.Lock()
+
+    def worker(chunk):
+        gate.wait()
+        for item in chunk:
+            try:
+                value = action(item)
+                outcome = "ok"
+            except LibraryError as e:
+                value, outcome = None, str(e)
+            except Exception as e:
+                value, outcome = None, f"{type(e).__name__}: {e}"
+            with lock:
+                outcomes[outcome] += 1
+                if outcome == "ok":
+                    results.append((item, value))
+
+    threads = [threading.Thread(target=worker, args=(items[i::workers],)) for i in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes, results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--borrowers", type=int, default=64)
+    parser.add_argument("--copies", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--mysql", action="store_true", help="run against the MySQL database from LIBRARY_DB_*")
+    args = parser.parse_args()
+
+    if args.mysql:
+        store = open_store("mysql", pool_size=args.threads)
+    else:
+        store = SQLiteStore(os.path.join(tempfile.mkdtemp(), "stress.db"), pool_size=args.threads)
+
+    tag = f"stress-{os.getpid()}-{int(time.time())}"
+    book_id = store.add_book(f"Contended Title {tag}", "Stress Author", "Stress Tests", args.copies)
+    users = [store.create_user(f"Borrower {n}", f"{tag}-{n}@example.com", "x") for n in range(args.borrowers)]
+    failures = []
+    try:
+        attempts = users * 2  # Every borrower tries twice
+        outcomes, loans, elapsed = hammer(args.threads, lambda user_id: store.borrow_book(user_id, book_id), attempts)
+        print(f"borrow  {len(attempts)} attempts in {elapsed:.2f}s: {dict(outcomes)}")
+
+        available = store._fetchone("SELECT available_copies FROM books WHERE book_id = %s", (book_id,))[0]
+        open_loans = store._fetchall("SELECT user_id FROM borrowed WHERE book_id = %s AND return_date IS NULL",
+                                     (book_id,))
+        per_user = Counter(row[0] for row in open_loans)
+        if available < 0:
+            failures.append(f"available copies went negative: {available}")
+        if len(loans) != min(args.copies, args.borrowers):
+            failures.append(f"{len(loans)} loans succeeded for {args.copies} copies")
+        if available != args.copies - len(open_loans):
+            failures.append(f"available copies {available} do not match {len(open_loans)} open loans")
+        if per_user and max(per_user.values()) > 1:
+            failures.append(f"double borrows: {[user for user, n in per_user.items() if n > 1]}")
+
+        loan_ids = [row[0] for row in store._fetchall(
+            "SELECT borrow_id FROM borrowed WHERE book_id = %s AND return_date IS NULL", (book_id,))]
+        outcomes, returns, elapsed = hammer(args.threads, store.return_book, loan_ids * 2)
+        print(f"return  {len(loan_ids) * 2} attempts in {elapsed:.2f}s: {dict(outcomes)}")
+        available = store._fetchone("SELECT available_copies FROM books WHERE book_id = %s", (book_id,))[0]
+        if len(returns) != len(loan_ids):
+            failures.append(f"{len(returns)} returns succeeded for {len(loan_ids)} loans")
+        if available != args.copies:
+            failures.append(f"available copies {available} after returning everything, expected {args.copies}")
+    finally:
+        with store.transaction() as cur:
+            cur.execute("DELETE FROM borrowed WHERE book_id = %s", (book_id,))
+            cur.execute("DELETE FROM books WHERE book_id = %s", (book_id,))
+            cur.executemany("DELETE FROM users WHERE user_id = %s", [(user_id,) for user_id in users])
+        store.close()
+
+    for failure in failures:
+        print(f"FAIL    {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK      stock never went negative, no double borrows or double returns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,437 @@
+"""HTTP/JSON API for kiosks, the website and self-checkout machines.
+
+The same search, borrow and return logic the window uses, served from
+LibraryStore.  Every connection gets its own thread (keep-alive clients hold
+on to theirs), at most MAX_CONNECTIONS of them; further connections are
+turned away with 503 at once rather than queued.  Database work is bounded
+separately by the connection pool (LIBRARY_DB_POOL_SIZE), and every request
+runs in its own transaction, so concurrent borrows of the last copy are
+settled by the database exactly as they are for the window.
+
+    GET  /books?q=tolkien&by=Author&limit=20&offset=0   available books, searched when q is given
+    GET  /books/42                                       one book with its copies on the shelf
+    POST /loans            {"user": "reader@example.com", "book_id": 42}   or "barcode" of the copy instead of book_id
+    POST /loans/1337/return
+    POST /copies/0000042-001/return                      return a copy by its barcode; a reader's session only their own
+    POST /loans            {"user": "me", "barcodes": ["0000042-001", "0000107-002"]}   or "book_ids"
+    POST /returns          {"barcodes": ["0000042-001", "0000107-002"]}                or "borrow_ids"
+    GET  /books/42/copies                                every copy of a book with its barcode and status
+    GET  /users/reader@example.com/loans                 a user's loans (an id works too)
+    POST /holds            {"user": "reader@example.com", "book_id": 42}   queue for a book with no copies left
+    POST /holds/7/cancel
+    GET  /users/reader@example.com/holds                 open holds with their place in line
+    POST /sessions         {"email": "reader@example.com", "password": "..."}
+    GET  /session                                        who the session belongs to
+    DELETE /session
+
+With LIBRARY_API_TOKEN set, every request must carry
+"Authorization: Bearer <token>".  A kiosk that logs a reader in with POST
+/sessions sends the returned token as "X-Session: <token>" afterwards: the
+password is checked once per session instead of per request, "user" may be
+left out of a borrow and /users/me/loans lists the reader's own loans.  A
+reader's session only acts for that reader.  Sessions end after
+LIBRARY_SESSION_MINUTES unused.  Errors come back as {"error": message}:
+400 for a malformed request, 401 for a wrong password or an ended session,
+403 for acting on someone else's loans, 404 for an unknown book or user,
+409 for a library rule (no copies left, already returned, ...).  A batch of
+at most BATCH_LIMIT items runs in one transaction and answers 200 with a
+result per item, {"error": message} for the items a library rule refused
+(for a reader's session, also those on another reader's loan).
+
+    LIBRARY_DB_BACKEND=sqlite python teakapi.py --port 8080
+"""
+import argparse
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+from datetime import date
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from teakcore import SESSION_MINUTES, LibraryError, NotFound, NotYours, SessionStore, login, open_store, resolve_user
+from teakpool import PoolError
+from teakstore import BATCH_LIMIT, SEARCH_FIELDS
+
+MAX_CONNECTIONS = 64
+# Idle keep-alive connections are closed after this many seconds
+KEEPALIVE_TIMEOUT = 15
+MAX_BODY = 64 * 1024
+MAX_LIMIT = 200
+
+
+class ApiError(Exception):
+    """A request the API answers with an error status instead of a result"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ARGUMENTS
+def _int(value, name, minimum=0):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be a whole number") from None
+    if number < minimum:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be at least {minimum}")
+    return number
+
+
+def _field(body, name):
+    if name not in body:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"Missing {name}")
+    return body[name]
+
+
+def _list(body, name):
+    items = _field(body, name)
+    if not isinstance(items, list) or not items:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be a non-empty list")
+    if len(items) > BATCH_LIMIT:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} may hold at most {BATCH_LIMIT} items")
+    return items
+
+
+def _batch_results(results, name, fields):
+    """One JSON object per item of a batch: the item and what came of it, or why it was refused"""
+    return [{name: item, "error": error} if error else {name: item, **fields(value)} for item, value, error in results]
+
+
+def _user(store, session, user):
+    """user_id to act for: the session's reader by default, and only them for a reader's session"""
+    if user in (None, "me"):
+        if session is None:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Missing user")
+        return session[0]
+    user_id = resolve_user(store, user)
+    if session is not None and session[1] != "admin" and user_id != session[0]:
+        raise ApiError(HTTPStatus.FORBIDDEN, "A reader's session only acts for that reader")
+    return user_id
+
+
+# ENDPOINTS
+def search_books(store, query, body, session):
+    text = query.get("q", "").strip()
+    field = query.get("by", "All")
+    if field != "All" and field not in SEARCH_FIELDS:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"by must be All, {', '.join(SEARCH_FIELDS)}")
+    limit = min(_int(query.get("limit", 50), "limit", 1), MAX_LIMIT)
+    offset = _int(query.get("offset", 0), "offset")
+    if text:
+        rows, total = store.search_books(text, field, limit, offset), store.count_search(text, field)
+    else:
+        rows, total = store.available_books_page(limit=limit, skip=offset), store.count_available_books()
+    return HTTPStatus.OK, {
+        "total": total,
+        "books": [dict(zip(("book_id", "title", "author", "category", "available_copies"), row)) for row in rows],
+    }
+
+
+def get_book(store, query, body, session, book_id):
+    row = store.book(_int(book_id, "book_id"))
+    if row is None:
+        raise NotFound("Book not found")
+    return HTTPStatus.OK, dict(zip(("book_id", "title", "author", "category", "total_copies",
+                                    "available_copies"), row))
+
+
+def borrow(store, query, body, session):
+    user_id = _user(store, session, body.get("user"))
+    if "barcodes" in body:
+        results = store.borrow_copies(user_id, [str(barcode).strip() for barcode in _list(body, "barcodes")])
+        return HTTPStatus.OK, {"user_id": user_id, "results": _batch_results(
+            results, "barcode", lambda value: {"book_id": value[0], "due_date": value[1]})}
+    if "book_ids" in body:
+        results = store.borrow_books(user_id, [_int(book_id, "book_ids") for book_id in _list(body, "book_ids")])
+        return HTTPStatus.OK, {"user_id": user_id, "results": _batch_results(
+            results, "book_id", lambda due_date: {"due_date": due_date})}
+    if "barcode" in body:
+        book_id, due_date = store.borrow_copy(user_id, str(body["barcode"]).strip())
+        return HTTPStatus.CREATED, {"user_id": user_id, "book_id": book_id, "barcode": body["barcode"],
+                                    "due_date": due_date}
+    book_id = _int(_field(body, "book_id"), "book_id")
+    return HTTPStatus.CREATED, {"user_id": user_id, "book_id": book_id,
+                                "due_date": store.borrow_book(user_id, book_id)}
+
+
+def return_loan(store, query, body, session, borrow_id):
+    borrow_id = _int(borrow_id, "borrow_id")
+    if session is not None and session[1] != "admin":
+        owner = store.loan_user(borrow_id)
+        if owner is None:
+            raise NotFound("Loan not found")
+        if owner != session[0]:
+            raise ApiError(HTTPStatus.FORBIDDEN, "A reader's session only returns their own loans")
+    store.return_book(borrow_id)
+    return HTTPStatus.OK, {"borrow_id": borrow_id, "returned": True}
+
+
+def return_batch(store, query, body, session):
+    # A reader's session only returns the reader's own loans; others' are refused item by item
+    user_id = session[0] if session is not None and session[1] != "admin" else None
+    if "barcodes" in body:
+        results = store.return_copies([str(barcode).strip() for barcode in _list(body, "barcodes")], user_id=user_id)
+        return HTTPStatus.OK, {"results": _batch_results(results, "barcode", lambda borrow_id: {"borrow_id": borrow_id})}
+    borrow_ids = [_int(borrow_id, "borrow_ids") for borrow_id in _list(body, "borrow_ids")]
+    results = store.return_books(borrow_ids, user_id=user_id)
+    return HTTPStatus.OK, {"results": _batch_results(results, "borrow_id", lambda returned: {"returned": True})}
+
+
+def return_copy(store, query, body, session, barcode):
+    # A reader's session can only return the reader's own loans
+    borrow_id = store.return_copy(barcode, user_id=session[0] if session is not None and session[1] != "admin" else None)
+    return HTTPStatus.OK, {"barcode": barcode, "borrow_id": borrow_id, "returned": True}
+
+
+def book_copies(store, query, body, session, book_id):
+    book_id = _int(book_id, "book_id")
+    if store.book(book_id) is None:
+        raise NotFound("Book not found")
+    return HTTPStatus.OK, {"book_id": book_id, "copies": [
+        dict(zip(("copy_id", "barcode", "status", "location"), row)) for row in store.copies_of(book_id)]}
+
+
+def user_loans(store, query, body, session, user):
+    user_id = _user(store, session, user)
+    return HTTPStatus.OK, {
+        "user_id": user_id,
+        "loans": [dict(zip(("borrow_id", "title", "author", "borrow_date", "due_date", "status"), row))
+                  for row in store.user_borrowings(user_id)],
+    }
+
+
+def place_hold(store, query, body, session):
+    user_id = _user(store, session, body.get("user"))
+    book_id = _int(_field(body, "book_id"), "book_id")
+    hold_id, position = store.place_hold(user_id, book_id)
+    return HTTPStatus.CREATED, {"hold_id": hold_id, "user_id": user_id, "book_id": book_id, "position": position}
+
+
+def cancel_hold(store, query, body, session, hold_id):
+    hold_id = _int(hold_id, "hold_id")
+    # A reader's session can only find the reader's own holds
+    store.cancel_hold(hold_id, session[0] if session is not None and session[1] != "admin" else None)
+    return HTTPStatus.OK, {"hold_id": hold_id, "cancelled": True}
+
+
+def user_holds(store, query, body, session, user):
+    user_id = _user(store, session, user)
+    return HTTPStatus.OK, {
+        "user_id": user_id,
+        "holds": [dict(zip(("hold_id", "book_id", "title", "author", "status", "position", "ready_until"), row))
+                  for row in store.user_holds(user_id)],
+    }
+
+
+def open_session(store, query, body, session, sessions):
+    user = login(store, str(_field(body, "email")), str(_field(body, "password")))
+    if user is None:
+        raise ApiError(HTTPStatus.UNAUTHORIZED, "Wrong email or password")
+    return HTTPStatus.CREATED, {"session": sessions.open(user), "user_id": user[0], "role": user[1],
+                                "full_name": user[2], "expires_after": sessions.lifetime}
+
+
+def show_session(store, query, body, session):
+    if session is None:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "Missing X-Session")
+    return HTTPStatus.OK, {"user_id": session[0], "role": session[1], "full_name": session[2]}
+
+
+def close_session(store, query, body, session, sessions, token):
+    sessions.close(token)
+    return HTTPStatus.OK, {"closed": True}
+
+
+# (method, path pattern, endpoint); path groups are passed on as arguments
+ROUTES = [
+    ("GET", re.compile(r"/books"), search_books),
+    ("GET", re.compile(r"/books/([^/]+)"), get_book),
+    ("POST", re.compile(r"/loans"), borrow),
+    ("POST", re.compile(r"/loans/([^/]+)/return"), return_loan),
+    ("POST", re.compile(r"/copies/([^/]+)/return"), return_copy),
+    ("POST", re.compile(r"/returns"), return_batch),
+    ("GET", re.compile(r"/books/([^/]+)/copies"), book_copies),
+    ("GET", re.compile(r"/users/([^/]+)/loans"), user_loans),
+    ("POST", re.compile(r"/holds"), place_hold),
+    ("POST", re.compile(r"/holds/([^/]+)/cancel"), cancel_hold),
+    ("GET", re.compile(r"/users/([^/]+)/holds"), user_holds),
+    ("POST", re.compile(r"/sessions"), open_session),
+    ("GET", re.compile(r"/session"), show_session),
+    ("DELETE", re.compile(r"/session"), close_session),
+]
+
+
+# SERVER
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so clients do not reconnect per request
+    server_version = "teakapi/1"
+    timeout = KEEPALIVE_TIMEOUT
+    # Headers and body go out in separate writes; without this Nagle's algorithm
+    # holds the body back for the client's delayed ACK, ~40 ms per response
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method):
+        try:
+            # Read first, so an error below still leaves the connection at the next request
+            body = self._body()
+            self._check_token()
+            url = urlsplit(self.path)
+            endpoint, args = self._route(method, url.path)
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            token = self.headers.get("X-Session")
+            if endpoint is close_session:
+                # Logging out of a session that has already ended is fine
+                session, args = None, [self.server.sessions, token]
+            else:
+                session = self._session(token)
+            if endpoint is open_session:
+                args = [self.server.sessions]
+            status, payload = endpoint(self.server.store, query, body, session, *args)
+        except ApiError as e:
+            status, payload = e.status, {"error": str(e)}
+        except NotFound as e:
+            status, payload = HTTPStatus.NOT_FOUND, {"error": str(e)}
+        except NotYours as e:
+            status, payload = HTTPStatus.FORBIDDEN, {"error": str(e)}
+        except LibraryError as e:
+            status, payload = HTTPStatus.CONFLICT, {"error": str(e)}
+        except PoolError as e:
+            status, payload = HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(e)}
+        except Exception as e:
+            self.log_error("%s %s failed: %r", method, self.path, e)
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Database error"}
+        self._send(status, payload)
+
+    def _check_token(self):
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}"):
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "Missing or wrong API token")
+
+    def _session(self, token):
+        """The login behind X-Session, None without one"""
+        if token is None:
+            return None
+        session = self.server.sessions.get(token)
+        if session is None:
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "Session has ended, log in again")
+        return session
+
+    def _route(self, method, path):
+        allowed = False
+        for route_method, pattern, endpoint in ROUTES:
+            match = pattern.fullmatch(path.rstrip("/") or "/")
+            if match:
+                if route_method == method:
+                    return endpoint, [unquote(group) for group in match.groups()]
+                allowed = True
+        if allowed:
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} is not supported here")
+        raise ApiError(HTTPStatus.NOT_FOUND, "No such endpoint")
+
+    def _body(self):
+        try:
+            length = _int(self.headers.get("Content-Length", 0), "Content-Length")
+            if length > MAX_BODY:
+                raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        except ApiError:
+            self.close_connection = True  # The unread body would be taken for the next request
+            raise
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Body must be JSON") from None
+        if not isinstance(body, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+        return body
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, default=_iso).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def log_error(self, format, *args):
+        super().log_message(format, *args)
+
+
+def _iso(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class ApiServer(ThreadingHTTPServer):
+    """HTTP server over a store; serve_forever() in any thread, shutdown() from another"""
+
+    def __init__(self, address, store, max_connections=MAX_CONNECTIONS, token=None, quiet=False,
+                 session_minutes=SESSION_MINUTES):
+        super().__init__(address, ApiHandler)
+        self.store = store
+        self.sessions = SessionStore(session_minutes)
+        self.token = token
+        self.quiet = quiet
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+                            b"Content-Length: 28\r\nConnection: close\r\n\r\n{\"error\": \"Server is busy\"}\n")
+            self.shutdown_request(request)
+            return
+        super().process_request(request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._slots.release()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS)
+    parser.add_argument("--quiet", action="store_true", help="do not log every request")
+    args = parser.parse_args(argv)
+
+    store = open_store()
+    server = ApiServer((args.host, args.port), store, args.max_connections,
+                       os.environ.get("LIBRARY_API_TOKEN"), args.quiet)
+    print(f"Serving the library API on http://{args.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""Command line for the library: the everyday desk operations without a display.
+
+Uses the same database settings as the window (LIBRARY_DB_* environment
+variables, see teakstore.open_store) and imports neither tkinter nor Pillow.
+
+    python teakcli.py search "tolkien hobbit"
+    python teakcli.py borrow reader@example.com 42
+    python teakcli.py return 1337 1338          # several items go in one transaction
+    python teakcli.py checkout reader@example.com 0000042-001   # by the barcode on the copy
+    python teakcli.py checkin 0000042-001 0000107-002
+    python teakcli.py copies 42
+    python teakcli.py hold reader@example.com 42
+    python teakcli.py expire-holds              # nightly: frees copies not collected in time
+    python teakcli.py overdue --csv > overdue.csv
+    python teakcli.py import catalog.csv
+    python teakcli.py export borrowed --format parquet --state sync.json
+    python teakcli.py fines --grace 3
+"""
+import argparse
+import csv
+import sys
+
+from teakcore import LibraryError, check_in_batch, check_out_batch, days_overdue, open_store, resolve_user
+
+
+def _print_rows(headers, rows, as_csv=False, with_headers=True):
+    if as_csv:
+        writer = csv.writer(sys.stdout)
+        if with_headers:
+            writer.writerow(headers)
+        writer.writerows(rows)
+        return
+    rows = [[str(value) for value in row] for row in rows]
+    widths = [max([len(header)] + [len(row[i]) for row in rows]) for i, header in enumerate(headers)]
+    if with_headers:
+        rows = [headers, ["-" * width for width in widths]] + rows
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+
+
+def _print_batch(results, describe):
+    """A line per item of a batch, refused items on stderr; exit status 1 if any was refused"""
+    refused = 0
+    for item, value, error in results:
+        if error:
+            refused += 1
+            print(f"Error: {item}: {error}", file=sys.stderr)
+        else:
+            print(describe(item, value))
+    return 1 if refused else 0
+
+
+# COMMANDS
+def search(store, args):
+    rows = store.search_books(args.query, args.by, args.limit)
+    total = store.count_search(args.query, args.by)
+    _print_rows(["ID", "Title", "Author", "Category", "Available"], rows, args.csv)
+    if not args.csv:
+        print(f"{len(rows)} of {total} available books shown")
+
+
+def borrow(store, args):
+    return _print_batch(store.borrow_books(resolve_user(store, args.user), args.book_ids),
+                        lambda book_id, due_date: f"Borrowed book {book_id}, due {due_date}")
+
+
+def return_(store, args):
+    return _print_batch(store.return_books(args.borrow_ids), lambda borrow_id, _: f"Returned loan {borrow_id}")
+
+
+def checkout(store, args):
+    return _print_batch(check_out_batch(store, args.user, args.barcodes),
+                        lambda barcode, lent: f"Lent copy {barcode} of book {lent[0]}, due {lent[1]}")
+
+
+def checkin(store, args):
+    return _print_batch(check_in_batch(store, args.barcodes),
+                        lambda barcode, borrow_id: f"Returned copy {barcode}, closing loan {borrow_id}")
+
+
+def copies(store, args):
+    _print_rows(["Copy ID", "Barcode", "Status", "Location"],
+                [row[:3] + (row[3] or "",) for row in store.copies_of(args.book_id)], args.csv)
+
+
+def hold(store, args):
+    hold_id, position = store.place_hold(resolve_user(store, args.user), args.book_id)
+    print(f"Hold {hold_id} placed on book {args.book_id}, number {position} in line")
+
+
+def expire_holds(store, args):
+    print(f"{store.expire_holds():,} holds expired")
+
+
+def overdue(store, args):
+    # Streamed: only the rows of one batch are held at a time
+    headers = ["Borrow ID", "Email", "Name", "Title", "Borrowed", "Due", "Days Late"]
+    count = 0
+    for batch in store.stream_overdue():
+        _print_rows(headers, [row + (days_overdue(row[5]),) for row in batch], args.csv, with_headers=not count)
+        count += len(batch)
+    if not count:
+        _print_rows(headers, [], args.csv)
+    if not args.csv:
+        print(f"{count} overdue loans")
+
+
+# These open their own store
+def import_(args):
+    import teakimport
+    return teakimport.main([args.file])
+
+
+# These also parse their own options: main() hands them the rest of the command
+# line before parsing it, as argparse would take their options for its own
+def export(argv):
+    import teakexport
+    return teakexport.main(argv)
+
+
+def fines(argv):
+    import teakfines
+    return teakfines.main(argv)
+
+
+PASSED_ON = {"export": export, "fines": fines}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in PASSED_ON:
+        return PASSED_ON[argv[0]](argv[1:])
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("search", help="find available books")
+    command.add_argument("query")
+    command.add_argument("--by", choices=["All", "Title", "Author", "Category"], default="All")
+    command.add_argument("--limit", type=int, default=50)
+    command.add_argument("--csv", action="store_true", help="CSV instead of a table")
+    command.set_defaults(run=search)
+
+    command = commands.add_parser("borrow", help="lend books to a user")
+    command.add_argument("user", help="user id or email")
+    command.add_argument("book_ids", type=int, nargs="+", metavar="book_id")
+    command.set_defaults(run=borrow)
+
+    command = commands.add_parser("return", help="close loans")
+    command.add_argument("borrow_ids", type=int, nargs="+", metavar="borrow_id")
+    command.set_defaults(run=return_)
+
+    command = commands.add_parser("checkout", help="lend copies by their barcodes")
+    command.add_argument("user", help="user id or email")
+    command.add_argument("barcodes", nargs="+", metavar="barcode")
+    command.set_defaults(run=checkout)
+
+    command = commands.add_parser("checkin", help="return copies by their barcodes")
+    command.add_argument("barcodes", nargs="+", metavar="barcode")
+    command.set_defaults(run=checkin)
+
+    command = commands.add_parser("copies", help="list the copies of a book and where they are")
+    command.add_argument("book_id", type=int)
+    command.add_argument("--csv", action="store_true", help="CSV instead of a table")
+    command.set_defaults(run=copies)
+
+    command = commands.add_parser("hold", help="queue a user for a book with no copies left")
+    command.add_argument("user", help="user id or email")
+    command.add_argument("book_id", type=int)
+    command.set_defaults(run=hold)
+
+    command = commands.add_parser("expire-holds", help="expire holds not collected in time, passing the copies on")
+    command.set_defaults(run=expire_holds)
+
+    command = commands.add_parser("overdue", help="list open loans past their due date")
+    command.add_argument("--csv", action="store_true", help="CSV instead of a table")
+    command.set_defaults(run=overdue)
+
+    command = commands.add_parser("import", help="bulk import books from CSV or JSON (see teakimport.py)")
+    command.add_argument("file")
+    command.set_defaults(run=import_)
+
+    # Only listed here; main() has passed them on already
+    commands.add_parser("export", help="export tables (see teakcli.py export --help)", add_help=False)
+
+    commands.add_parser("fines", help="assess overdue fines (see teakcli.py fines --help)", add_help=False)
+
+    args = parser.parse_args(argv)
+    if args.run is import_:
+        return args.run(args)
+    store = open_store()
+    try:
+        return args.run(store, args) or 0
+    except LibraryError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""The library without a user interface: what the window, the CLI and scripts share.
+
+Importing this module pulls in neither tkinter nor Pillow, and the MySQL
+driver is only imported when the first connection opens, so batch jobs can
+run on servers without a display.  The queries themselves live in teakstore.
+
+    from teakcore import open_store, login
+    store = open_store()
+    user = login(store, "reader@example.com", "secret")
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from teakstore import LibraryError, NotFound, NotYours, open_store  # noqa: F401 -- the entry points scripts need
+
+# scrypt work factor as log2(n); each step doubles the time and memory of a
+# hash (15: ~32 MiB and ~0.1 s).  Stored hashes carry their own parameters, so
+# raising it only rehashes each password at its next login
+PASSWORD_COST = int(os.environ.get("LIBRARY_PASSWORD_COST", 15))
+SCRYPT_R = 8
+SCRYPT_P = 1
+# Sessions end after this many minutes without use
+SESSION_MINUTES = float(os.environ.get("LIBRARY_SESSION_MINUTES", 15))
+MAX_SESSIONS = 10000
+
+
+# PASSWORDS
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p, dklen=32)
+
+
+def encrypt_password(password, cost=None):
+    """Salted scrypt hash of password as "scrypt$n$r$p$salt$hash", for the users table"""
+    n = 2 ** (cost or PASSWORD_COST)
+    salt = os.urandom(16)
+    return f"scrypt${n}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${_scrypt(password, salt, n, SCRYPT_R, SCRYPT_P).hex()}"
+
+
+def verify_password(password, stored):
+    """(matches, needs_rehash) for password against a stored hash.
+
+    Hashes from before scrypt are unsalted SHA-256 hex digests; they match as
+    before and always need a rehash, as do scrypt hashes of another cost.
+    """
+    if stored.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt, digest = stored.split("$")
+            n, r, p = int(n), int(r), int(p)
+            matches = hmac.compare_digest(_scrypt(password, bytes.fromhex(salt), n, r, p), bytes.fromhex(digest))
+        except ValueError:
+            return False, False
+        return matches, (n, r, p) != (2 ** PASSWORD_COST, SCRYPT_R, SCRYPT_P)
+    legacy = hashlib.sha256(password.encode()).hexdigest()
+    return hmac.compare_digest(legacy, stored), True
+
+
+_unknown_user_hash = None
+
+
+def login(store, email, password):
+    """(user_id, role, full_name) for a correct email and password, else None.
+
+    A password still stored in an old format is rehashed on the way.
+    """
+    global _unknown_user_hash
+    record = store.login_record(email)
+    if record is None:
+        # Hash anyway, so an unknown email takes as long as a wrong password
+        _unknown_user_hash = _unknown_user_hash or encrypt_password("")
+        verify_password(password, _unknown_user_hash)
+        return None
+    user_id, role, full_name, stored = record
+    matches, needs_rehash = verify_password(password, stored)
+    if not matches:
+        return None
+    if needs_rehash:
+        store.set_password_hash(user_id, stored, encrypt_password(password))
+    return user_id, role, full_name
+
+
+def add_user(store, full_name, email, password, role="user"):
+    """New user with a hashed password; returns the user_id"""
+    return store.create_user(full_name, email, encrypt_password(password), role)
+
+
+def update_user(store, user_id, full_name, email, password=None):
+    """Change a user's name and email, and the password unless it is None"""
+    store.update_user(user_id, full_name, email, encrypt_password(password) if password else None)
+
+
+# SESSIONS
+class SessionStore:
+    """Logged-in users by session token, so later requests skip the password hash and the users lookup.
+
+    Sessions live in memory: a session unused for SESSION_MINUTES ends, and
+    past MAX_SESSIONS the least recently used end first.  Safe to share
+    between threads.
+    """
+
+    def __init__(self, minutes=SESSION_MINUTES, limit=MAX_SESSIONS, clock=time.monotonic):
+        self.lifetime = minutes * 60
+        self.limit = limit
+        self.clock = clock
+        self._sessions = OrderedDict()  # token -> [user, last used], least recently used first
+        self._lock = threading.Lock()
+
+    def open(self, user):
+        """New session for a login() result; returns its token"""
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            self._sessions[token] = [user, now]
+            while len(self._sessions) > self.limit:
+                self._sessions.popitem(last=False)
+        return token
+
+    def get(self, token):
+        """The login() result of a live session, else None; using a session keeps it alive"""
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            session = self._sessions.get(token) if token else None
+            if session is None:
+                return None
+            session[1] = now
+            self._sessions.move_to_end(token)
+            return session[0]
+
+    def close(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def _expire(self, now):
+        # Least recently used first, so the expired ones are all at the front
+        while self._sessions:
+            token, (_, used) = next(iter(self._sessions.items()))
+            if now - used < self.lifetime:
+                break
+            del self._sessions[token]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+# USERS
+def resolve_user(store, user):
+    """user_id for a user given as an id or an email, e.g. on a command line"""
+    user = str(user).strip()
+    if user.isdigit():
+        if store.user_name(int(user)) is None:
+            raise NotFound(f"No user with id {user}")
+        return int(user)
+    found = store.find_user(user)
+    if found is None:
+        raise NotFound(f"No user with email {user}")
+    return found[0]
+
+
+# LOANS
+def check_out(store, user, barcode):
+    """Lend the scanned copy to a user given as an id or an email; returns (book_id, due date)"""
+    return store.borrow_copy(resolve_user(store, user), barcode.strip())
+
+
+def check_in(store, barcode):
+    """Return the scanned copy; returns the borrow_id of the loan it closed"""
+    return store.return_copy(barcode.strip())
+
+
+def check_out_batch(store, user, barcodes):
+    """check_out() for a pile of scanned copies in one transaction; returns store.borrow_copies() results"""
+    return store.borrow_copies(resolve_user(store, user), [barcode.strip() for barcode in barcodes])
+
+
+def check_in_batch(store, barcodes):
+    """check_in() for a pile of scanned copies in one transaction; returns store.return_copies() results"""
+    return store.return_copies([barcode.strip() for barcode in barcodes])
+
+
+def days_overdue(due_date, today=None):
+    """Whole days a loan due on due_date is late by (0 when not late)"""
+    if isinstance(due_date, str):
+        due_date = date.fromisoformat(due_date[:10])
+    return max(((today or date.today()) - due_date).days, 0)
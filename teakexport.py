@@ -0,0 +1,209 @@
+"""Export of the catalog, users and loan history to CSV, JSON Lines or Parquet.
+
+Rows stream from a server-side cursor (LibraryStore.stream_export) into the
+output file one batch at a time, so memory use does not depend on the size
+of the table.  With since, only rows changed at or after that time are
+written (deleted rows are not reported).  Every export records a watermark
+to pass as since next time; --state keeps them in a file between runs, which
+is all a nightly warehouse sync needs.  The columns written are listed in
+teakstore.EXPORTS.
+
+Parquet output needs pyarrow (pip install pyarrow).
+
+    python teakexport.py                                    # every table to CSV in the current directory
+    python teakexport.py borrowed --format parquet --out exports
+    python teakexport.py --state sync.json --format jsonl   # only what changed since the last run
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import date, datetime
+
+from teakstore import EXPORTS, STREAM_BATCH, LibraryError, open_store
+
+FORMATS = {"csv": "csv", "jsonl": "jsonl", "parquet": "parquet"}  # format -> file extension
+
+
+# VALUES
+# SQLite hands dates and timestamps back as text, MySQL as date/datetime
+def _timestamp(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _date(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value.date() if isinstance(value, datetime) else value
+
+
+CONVERTERS = {"int": lambda value: value, "str": lambda value: value, "date": _date, "timestamp": _timestamp}
+
+
+def _iso(value):
+    return value.isoformat(sep=" ") if isinstance(value, datetime) else value.isoformat()
+
+
+# WRITERS
+class _CsvWriter:
+    def __init__(self, path, columns):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([name for name, _, _ in columns])
+
+    def write(self, rows):
+        self._writer.writerows(
+            [["" if value is None else _iso(value) if isinstance(value, date) else value for value in row]
+             for row in rows])
+
+    def close(self):
+        self._file.close()
+
+
+class _JsonLinesWriter:
+    def __init__(self, path, columns):
+        self._file = open(path, "w", encoding="utf-8")
+        self._names = [name for name, _, _ in columns]
+
+    def write(self, rows):
+        self._file.writelines(json.dumps(dict(zip(self._names, row)), ensure_ascii=False, default=_iso) + "\n"
+                              for row in rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise LibraryError("Parquet export needs pyarrow (pip install pyarrow)") from None
+        types = {"int": pa.int64(), "str": pa.string(), "date": pa.date32(), "timestamp": pa.timestamp("us")}
+        self._pa = pa
+        self._schema = pa.schema([(name, types[kind]) for name, kind, _ in columns])
+        # Each batch becomes a row group, so the file is written as it streams
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self._writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(values, type=field.type) for values, field in zip(columns, self._schema)],
+            schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+WRITERS = {"csv": _CsvWriter, "jsonl": _JsonLinesWriter, "parquet": _ParquetWriter}
+
+
+# EXPORT
+class TableExport:
+    """One table exported to one file; run() does the work and yields each batch written.
+
+    The file is written under a .part name and only renamed into place once
+    complete, so a cancelled or failed export leaves nothing half written.
+    The counters are safe to read from another thread while run() is going.
+    """
+
+    def __init__(self, store, table, path, format="csv", since=None, batch_size=STREAM_BATCH):
+        if table not in EXPORTS:
+            raise LibraryError(f"Unknown table to export: {table}")
+        if format not in WRITERS:
+            raise LibraryError(f"Unknown export format: {format}")
+        self.store = store
+        self.table = table
+        self.path = path
+        self.format = format
+        self.since = since
+        self.batch_size = batch_size
+        self.expected = None
+        self.rows = 0
+        self.watermark = None  # since for the next incremental export, once run() has started
+
+    def run(self):
+        # Taken first: anything committed while the export runs is picked up next time
+        self.watermark = self.store.export_watermark(self.table)
+        self.expected = self.store.count_export(self.table, self.since)
+        columns = EXPORTS[self.table][1]
+        converters = [CONVERTERS[kind] for _, kind, _ in columns]
+        partial = self.path + ".part"
+        writer = WRITERS[self.format](partial, columns)
+        complete = False
+        try:
+            for batch in self.store.stream_export(self.table, self.since, self.batch_size):
+                rows = [[None if value is None else convert(value) for convert, value in zip(converters, row)]
+                        for row in batch]
+                writer.write(rows)
+                self.rows += len(rows)
+                yield rows
+            complete = True
+        finally:
+            writer.close()
+            if complete:
+                os.replace(partial, self.path)
+            else:
+                os.remove(partial)
+
+    def summary(self):
+        return f"{self.table}: {self.rows:,} rows to {self.path}"
+
+
+def export_path(directory, table, format="csv", since=None):
+    """File name for an export: <table>.<ext>, or <table>-since-<time>.<ext> for changes only"""
+    name = table if since is None else f"{table}-since-{since:%Y%m%dT%H%M%S}"
+    return os.path.join(directory, f"{name}.{FORMATS[format]}")
+
+
+def read_state(path):
+    """{table: since} from a --state file; tables never exported are missing"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {table: datetime.fromisoformat(value) for table, value in json.load(f).items()}
+
+
+def write_state(path, state):
+    partial = path + ".part"
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump({table: value.isoformat() for table, value in state.items()}, f, indent=2)
+    os.replace(partial, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("tables", nargs="*", metavar="TABLE",
+                        help=f"tables to export: {', '.join(EXPORTS)} (default: all)")
+    parser.add_argument("--format", choices=list(FORMATS), default="csv")
+    parser.add_argument("--out", default=".", help="directory to write to")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="only rows changed since this time")
+    parser.add_argument("--state", help="JSON file remembering where the last export of each table stopped")
+    args = parser.parse_args(argv)
+
+    state = read_state(args.state)
+    os.makedirs(args.out, exist_ok=True)
+    store = open_store()
+    try:
+        for table in args.tables or list(EXPORTS):
+            since = args.since or state.get(table)
+            job = TableExport(store, table, export_path(args.out, table, args.format, since), args.format, since)
+            for _ in job.run():
+                print(f"\r{job.table}: {job.rows:,} of {job.expected:,} rows", end="", flush=True)
+            print(f"\r{job.summary()}" + " " * 20)
+            if args.state:
+                # Saved per table, so a failure later on does not repeat this one
+                state[table] = job.watermark
+                write_state(args.state, state)
+    except LibraryError as e:
+        print(f"\nExport stopped: {e}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Overdue fines: the fine policy and the nightly assessment pass.
+
+A loan returned late, or still out past its due date, costs nothing for the
+policy's grace days and then the daily rate for every further day, up to the
+cap.  Fines are materialized per loan in the fines table (amounts in cents),
+so screens read them instead of working them out.
+
+FineAssessment walks the open overdue loans plus the loans returned since the
+previous pass, a batch at a time through the (return_date, due_date) index,
+and rewrites their fines; a loan's fine is final once a pass has seen it
+returned.  Loans returned before the first pass are not fined retroactively.
+Run it nightly, e.g. from cron:
+
+    python teakfines.py                          # as of today, policy from LIBRARY_FINE_*
+    python teakfines.py --grace 3 --rate 0.25 --cap 10
+"""
+import argparse
+import os
+import sys
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+from teakstore import STREAM_BATCH, LibraryError, open_store
+
+
+# AMOUNTS
+def cents(amount):
+    """Cents from an amount such as "0.25" """
+    try:
+        return int((Decimal(str(amount).strip()) * 100).to_integral_value())
+    except InvalidOperation:
+        raise LibraryError(f"Not an amount: {amount}") from None
+
+
+def format_amount(amount):
+    return f"{Decimal(amount) / 100:.2f}"
+
+
+def _day(value):
+    # SQLite hands dates back as text, MySQL as date
+    return date.fromisoformat(str(value)[:10])
+
+
+# POLICY
+class FinePolicy:
+    """What a late loan costs: nothing for grace_days, then daily_rate a day up to cap (both in cents)"""
+
+    def __init__(self, grace_days=3, daily_rate=25, cap=1000):
+        if min(grace_days, daily_rate, cap) < 0:
+            raise LibraryError("Fine policy values cannot be negative")
+        self.grace_days = grace_days
+        self.daily_rate = daily_rate
+        self.cap = cap
+
+    @classmethod
+    def from_env(cls):
+        """Policy from LIBRARY_FINE_GRACE_DAYS, LIBRARY_FINE_DAILY_RATE and LIBRARY_FINE_CAP"""
+        return cls(int(os.environ.get("LIBRARY_FINE_GRACE_DAYS", 3)),
+                   cents(os.environ.get("LIBRARY_FINE_DAILY_RATE", "0.25")),
+                   cents(os.environ.get("LIBRARY_FINE_CAP", "10.00")))
+
+    def fine(self, days_late):
+        return min(max(days_late - self.grace_days, 0) * self.daily_rate, self.cap)
+
+    def values(self):
+        return self.grace_days, self.daily_rate, self.cap
+
+    def __str__(self):
+        return (f"{self.grace_days} days grace, then {format_amount(self.daily_rate)} a day "
+                f"up to {format_amount(self.cap)}")
+
+
+# ASSESSMENT
+class FineAssessment:
+    """One pass over the late loans as of today; run() does the work and yields each batch's fines.
+
+    The counters are safe to read from another thread while run() is going.
+    """
+
+    def __init__(self, store, policy=None, today=None, batch_size=STREAM_BATCH):
+        self.store = store
+        self.policy = policy or FinePolicy.from_env()
+        self.today = today or date.today()
+        self.batch_size = batch_size
+        self.loans = 0  # late loans read
+        self.fined = 0
+        self.total = 0
+
+    def run(self):
+        # Returns after the last pass may still be owed their final amount;
+        # the very first pass starts from today
+        since = self.store.last_fine_run() or self.today
+        cutoff = self.today - timedelta(days=self.policy.grace_days)
+        for batch in self.store.stream_late_loans(cutoff, since, self.batch_size):
+            fines = []
+            for borrow_id, user_id, due_date, return_date in batch:
+                days_late = ((_day(return_date) if return_date else self.today) - _day(due_date)).days
+                amount = self.policy.fine(days_late)
+                if amount:
+                    fines.append((borrow_id, user_id, days_late, amount))
+            if fines:
+                self.store.save_fines(fines, self.today)
+            self.loans += len(batch)
+            self.fined += len(fines)
+            self.total += sum(fine[3] for fine in fines)
+            yield fines
+        self.store.record_fine_run(self.today, self.policy.values(), self.fined, self.total)
+
+    def summary(self):
+        return f"{self.fined:,} loans fined {format_amount(self.total)} in total ({self.policy})"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--date", type=date.fromisoformat, help="assess as of this day (default: today)")
+    parser.add_argument("--grace", type=int, help="days late before fines start (LIBRARY_FINE_GRACE_DAYS)")
+    parser.add_argument("--rate", help="fine per day late, e.g. 0.25 (LIBRARY_FINE_DAILY_RATE)")
+    parser.add_argument("--cap", help="most one loan can be fined, e.g. 10 (LIBRARY_FINE_CAP)")
+    args = parser.parse_args(argv)
+
+    store = open_store()
+    try:
+        policy = FinePolicy.from_env()
+        policy = FinePolicy(policy.grace_days if args.grace is None else args.grace,
+                            policy.daily_rate if args.rate is None else cents(args.rate),
+                            policy.cap if args.cap is None else cents(args.cap))
+        job = FineAssessment(store, policy, args.date)
+        for _ in job.run():
+            print(f"\r{job.loans:,} late loans read, {job.fined:,} fined", end="", flush=True)
+        print(f"\r{job.summary()}" + " " * 20)
+    except LibraryError as e:
+        print(f"\nFine assessment stopped: {e}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Background image scaling for the Tk window.
+
+Decoding library.png and a LANCZOS resize to the window size cost hundreds of
+milliseconds, far too much to pay on every page change.  ScaledImage decodes
+the file once and keeps the most recently used sizes as ready-made images, so
+showing a page only looks one up.
+
+Pillow is only imported when the image is first needed; it is the slowest
+import of the whole window.  preload() decodes on any thread, so the window
+can show its first page while the image is still being read.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+
+def _pil():
+    from PIL import Image, ImageTk
+    return Image, ImageTk
+
+
+def _photo_image(image):
+    return _pil()[1].PhotoImage(image)
+
+
+class ScaledImage:
+    """One source image, decoded on first use, scaled to any size on demand.
+
+    variants       -- full-quality sizes kept, least recently used dropped first
+    preview_width  -- the source is also kept at this width for fast previews
+    make_photo     -- turns a PIL image into what callers display
+    """
+
+    def __init__(self, path, variants=4, preview_width=640, make_photo=_photo_image):
+        self.path = path
+        self.variants = variants
+        self.preview_width = preview_width
+        self.make_photo = make_photo
+        self._source = None
+        self._preview_source = None
+        self._failed = False
+        self._lock = threading.Lock()
+        self._photos = OrderedDict()  # (width, height) -> photo, least recently used first
+
+    @property
+    def loaded(self):
+        """True once the file has been decoded (or failed to), so photo() will not block on it"""
+        return self._source is not None or self._failed
+
+    def preload(self):
+        """Decode the file now, e.g. on a worker thread, so photo() only has to scale"""
+        self._load()
+
+    def _load(self):
+        with self._lock:
+            if self._source is None and not self._failed:
+                try:
+                    Image = _pil()[0]
+                    if not os.path.exists(self.path):
+                        raise FileNotFoundError(f"Background image not found at: {self.path}")
+                    with Image.open(self.path) as image:
+                        source = image.convert("RGB")
+                    self._preview_source = source.copy()
+                    self._preview_source.thumbnail((self.preview_width, self.preview_width),
+                                                   Image.Resampling.BILINEAR)
+                    self._source = source  # Last, so loaded is only true once both are ready
+                except Exception as e:
+                    # Reported once; pages then simply show no background
+                    print(f"Error loading background image: {e}")
+                    self._failed = True
+        return self._source
+
+    def photo(self, width, height, preview=False):
+        """The image scaled to width x height, or None when it cannot be loaded.
+
+        preview trades quality for speed (a bilinear resample of a small copy)
+        and is not cached; use it while a window is being dragged to size.
+        """
+        if self._load() is None:
+            return None
+        Image = _pil()[0]
+        size = (width, height)
+        if preview:
+            return self.make_photo(self._preview_source.resize(size, Image.Resampling.BILINEAR))
+        photo = self._photos.get(size)
+        if photo is None:
+            photo = self.make_photo(self._source.resize(size, Image.Resampling.LANCZOS))
+            self._photos[size] = photo
+            while len(self._photos) > self.variants:
+                self._photos.popitem(last=False)
+        else:
+            self._photos.move_to_end(size)
+        return photo
@@ -0,0 +1,263 @@
+"""Bulk catalog import from CSV or JSON files.
+
+The file is read as a stream, so its size does not matter: rows are
+validated and de-duplicated as they are read and written CHUNK_SIZE at a
+time, each chunk in one transaction through LibraryStore.import_books().
+Rows that cannot be imported are written, with the reason, to a rejected-rows
+CSV next to the input file.
+
+Columns (CSV header or JSON keys, any case): title, author, category (or
+category_name) and copies (or total_copies, default 1).  A .json file holds
+one array of objects, a .jsonl or .ndjson file one object per line.
+
+    python teakimport.py catalog.csv
+"""
+import csv
+import io
+import json
+import os
+import sys
+
+from teakstore import LibraryError, open_store
+
+CHUNK_SIZE = 1000
+# A JSON object still undecoded at this size is taken as malformed, not as long
+MAX_JSON_OBJECT = 1 << 20
+# Longest title, author and category the VARCHAR(255) columns hold
+MAX_FIELD_LENGTH = 255
+
+COLUMNS = {
+    "title": "title",
+    "author": "author",
+    "category": "category",
+    "category_name": "category",
+    "copies": "copies",
+    "total_copies": "copies",
+}
+
+
+class ImportRejected(Exception):
+    """A row that cannot be imported; the message is the reason given in the report"""
+
+
+# READING
+class _CountingReader(io.RawIOBase):
+    """Binary file wrapper counting the bytes read, for progress"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.raw.readinto(buffer)
+        self.bytes_read += count or 0
+        return count
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+def _csv_records(text):
+    reader = csv.DictReader(text)
+    for record in reader:
+        # Data starts on line 2; rows with quoted newlines take more lines
+        yield reader.line_num, record
+
+
+def _json_lines_records(text):
+    # A bad line only loses that line
+    for line, source in enumerate(text, 1):
+        if source.strip():
+            try:
+                yield line, json.loads(source)
+            except json.JSONDecodeError:
+                yield line, ImportRejected("Invalid JSON")
+
+
+def _json_records(text, chunk_size=1 << 16):
+    """Objects of a top-level JSON array decoded one at a time"""
+    decoder = json.JSONDecoder()
+    buffer, position, line = "", 0, 1
+    eof = False
+    while True:
+        # Skip whitespace and the array punctuation between objects
+        while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+            line += buffer[position] == "\n"
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer, position = text.read(chunk_size), 0
+            eof = not buffer
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            more = "" if eof or len(buffer) - position > MAX_JSON_OBJECT else text.read(chunk_size)
+            if not more:
+                raise ImportRejected(f"invalid JSON near line {line}") from None
+            buffer, position = buffer[position:] + more, 0
+            continue
+        yield line, value
+        line += buffer.count("\n", position, end)
+        position = end
+
+
+def read_records(path, text):
+    """(line, record) pairs from an open text file, chosen by the file's extension.
+
+    A record that cannot be decoded comes back as an ImportRejected instead.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson"):
+        return _json_lines_records(text)
+    if extension == ".json":
+        return _json_records(text)
+    return _csv_records(text)
+
+
+# VALIDATION
+def clean_record(record):
+    """(title, author, category_name, total_copies) from one record, or ImportRejected"""
+    if not isinstance(record, dict):
+        raise ImportRejected("Not an object")
+    fields = {}
+    for key, value in record.items():
+        column = COLUMNS.get(str(key).strip().lower())
+        if column is not None:
+            fields[column] = "" if value is None else str(value).strip()
+    title, author, category_name = (fields.get(column, "") for column in ("title", "author", "category"))
+    for column, value in (("title", title), ("author", author), ("category", category_name)):
+        if not value:
+            raise ImportRejected(f"Missing {column}")
+        if len(value) > MAX_FIELD_LENGTH:
+            raise ImportRejected(f"{column.capitalize()} longer than {MAX_FIELD_LENGTH} characters")
+    try:
+        copies = int(fields.get("copies") or 1)
+    except ValueError:
+        raise ImportRejected("Copies must be a number") from None
+    if copies <= 0:
+        raise ImportRejected("Copies must be at least 1")
+    return title, author, category_name, copies
+
+
+# IMPORT
+class CatalogImport:
+    """One import of a file into a store; run() does the work and yields as it goes.
+
+    The counters are safe to read from another thread while run() is going,
+    e.g. to show progress.
+    """
+
+    def __init__(self, store, path, chunk_size=CHUNK_SIZE, rejected_path=None):
+        self.store = store
+        self.path = path
+        self.chunk_size = chunk_size
+        stem, _ = os.path.splitext(path)
+        self.rejected_path = rejected_path or stem + ".rejected.csv"
+        self.total_bytes = os.path.getsize(path)
+        self.bytes_read = 0
+        self.records = 0
+        self.imported = 0
+        self.rejected = 0
+        self._report = None
+
+    @property
+    def fraction(self):
+        return self.bytes_read / self.total_bytes if self.total_bytes else 1.0
+
+    def run(self):
+        """Import the file, yielding the books written by each committed chunk.
+
+        Stopping early (closing the generator) keeps the chunks already
+        committed; the rejected-rows report covers the rows read so far.
+        """
+        seen = set()
+        chunk = []
+        with open(self.path, "rb") as raw:
+            counter = _CountingReader(raw)
+            text = io.TextIOWrapper(io.BufferedReader(counter), encoding="utf-8-sig", newline="")
+            try:
+                try:
+                    for line, record in read_records(self.path, text):
+                        self.records += 1
+                        self.bytes_read = counter.bytes_read
+                        if isinstance(record, ImportRejected):
+                            self._reject(line, None, str(record))
+                            continue
+                        try:
+                            book = clean_record(record)
+                            if book[0].lower() in seen:
+                                raise ImportRejected("Duplicate title in file")
+                        except ImportRejected as e:
+                            self._reject(line, record, str(e))
+                            continue
+                        seen.add(book[0].lower())
+                        chunk.append((line, record, book))
+                        if len(chunk) >= self.chunk_size:
+                            yield self._write(chunk)
+                            chunk = []
+                except (ImportRejected, UnicodeDecodeError) as e:
+                    # The file itself is unreadable past this point
+                    self._reject(self.records + 1, None, f"Unreadable file: {e}")
+                if chunk:
+                    yield self._write(chunk)
+            finally:
+                self.bytes_read = counter.bytes_read
+                if self._report is not None:
+                    self._report[0].close()
+                    self._report = None
+
+    def _write(self, chunk):
+        skipped = set(self.store.import_books([book for _, _, book in chunk]))
+        written = []
+        for line, record, book in chunk:
+            if book[0] in skipped:
+                self._reject(line, record, "Title already in the catalog")
+            else:
+                written.append(book)
+        self.imported += len(written)
+        return written
+
+    def _reject(self, line, record, reason):
+        self.rejected += 1
+        if self._report is None:
+            report = open(self.rejected_path, "w", newline="", encoding="utf-8")
+            writer = csv.writer(report)
+            writer.writerow(["line", "reason", "record"])
+            self._report = report, writer
+        shown = json.dumps(record, ensure_ascii=False) if record is not None else ""
+        self._report[1].writerow([line, reason, shown])
+
+    def summary(self):
+        text = f"{self.imported:,} books imported, {self.rejected:,} rows rejected"
+        if self.rejected:
+            text += f" (see {self.rejected_path})"
+        return text
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("usage: python teakimport.py CATALOG.csv|CATALOG.json", file=sys.stderr)
+        return 2
+    store = open_store()
+    job = CatalogImport(store, argv[0])
+    try:
+        for _ in job.run():
+            print(f"\r{job.fraction:6.1%}  {job.imported:,} imported, {job.rejected:,} rejected", end="", flush=True)
+    except LibraryError as e:
+        print(f"\nImport stopped: {e}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+    print(f"\n{job.summary()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
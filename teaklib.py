@@ -1,103 +1,367 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import mysql.connector
-import hashlib
-from PIL import Image, ImageTk
-import os
+from tkinter import ttk, messagebox, filedialog
+import time
+from datetime import date, datetime, timedelta
+from collections import Counter, OrderedDict, deque
+from teakimage import ScaledImage
+from teakcore import (SessionStore, add_user, check_in, check_in_batch, check_out, check_out_batch,
+                      login as check_login, update_user as save_user)
+from teakstore import EXPORTS, PAGE_SIZE, LibraryError, open_store, search_matches
+from teaktasks import Debouncer, TaskRunner
 
 # DB CONNECTION 
-def db_connection():
-    return mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="",
-        database="library_system"
-    )
-
-#  PASSWORD ENCRYPTION 
-def encrypt_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+# Backend and pool size come from LIBRARY_DB_* environment variables (see teakstore.open_store)
+store = open_store()
+
+# Searches wait this long after the last keystroke before querying
+SEARCH_DEBOUNCE_MS = 250
+
+# Queries still running after this long are given up on and reported
+DB_TIMEOUT_MS = 15000
+
+# Streamed reports keep at most this many rows on screen; the rest are only counted
+REPORT_MAX_ROWS = 5000
+
+# BACKGROUND DATABASE WORK
+# Queries run on the TaskRunner's worker threads so a slow query or a database
+# outage never freezes the window; results come back on the Tk thread.
+def show_db_error(error):
+    # LibraryError is a broken library rule, anything else a database problem
+    messagebox.showerror("Error" if isinstance(error, LibraryError) else "DB Error", str(error))
+
+# DESK BATCHES
+# Several selected books are borrowed or returned in one transaction (see
+# LibraryStore.borrow_books); the batch is confirmed and reported once
+BATCH_LIST_LINES = 10
+
+def confirm_batch(title, verb, names):
+    if len(names) == 1:
+        return messagebox.askyesno(title, f"Do you want to {verb} '{names[0]}'?")
+    listed = "\n".join(names[:BATCH_LIST_LINES])
+    if len(names) > BATCH_LIST_LINES:
+        listed += f"\n... and {len(names) - BATCH_LIST_LINES} more"
+    return messagebox.askyesno(title, f"Do you want to {verb} these {len(names)} books?\n\n{listed}")
+
+def show_batch_results(results, names, done):
+    """One message for a batch: what was done, and why any item was not; names maps items to titles"""
+    failed = [f"'{names[item]}': {error}" for item, _, error in results if error]
+    succeeded = len(results) - len(failed)
+    if len(results) == 1:
+        message = failed[0] if failed else f"'{names[results[0][0]]}' {done} successfully!"
+    else:
+        message = f"{succeeded} of {len(results)} books {done}." + "".join(f"\n{line}" for line in failed)
+    if not failed:
+        messagebox.showinfo("Success", message)
+    elif succeeded:
+        messagebox.showwarning("Partly Done", message)
+    else:
+        messagebox.showerror("Error", message)
+
+def show_busy(busy):
+    window.config(cursor="watch" if busy else "")
+
+def run_db(query, *args, on_done=None, on_error=show_db_error, widget=None, timeout_ms=DB_TIMEOUT_MS):
+    """Run query(*args) on a worker and pass the result to on_done on the Tk thread.
+
+    widget is what the result belongs to: if it is a button it is disabled
+    until the query finishes, and if it has been destroyed by then (the user
+    left the page) the result is dropped.
+    """
+    button = widget if isinstance(widget, (tk.Button, ttk.Button)) else None
+    if button is not None:
+        button.config(state="disabled")
+
+    def finish(callback, value):
+        if widget is not None and not widget.winfo_exists():
+            return
+        if button is not None:
+            button.config(state="normal")
+        if callback:
+            callback(value)
+
+    return tasks.submit(query, *args, timeout_ms=timeout_ms,
+                        on_done=lambda result: finish(on_done, result),
+                        on_error=lambda error: finish(on_error, error))
 
 # BACKGROUND IMAGE SETUP 
+# Decoded once; the sizes the window uses are kept scaled (see teakimage)
+background = ScaledImage(r"C:\Users\sreej\OneDrive\Desktop\python\library.png")
 bg_label = None  # Global variable to track background label
 
-def set_background_image(window):
+def set_background_image(window, size=None, preview=False):
     global bg_label
-    try:
-        # Remove existing background if it exists
-        if bg_label:
-            bg_label.destroy()
-            
-        # Load and resize the background image
-        image_path = r"C:\Users\sreej\OneDrive\Desktop\python\library.png"
-        if os.path.exists(image_path):
-            # Get current window size
-            window.update_idletasks()
-            width = window.winfo_width()
-            height = window.winfo_height()
-            
-            # Use minimum reasonable size if window is too small
-            if width < 400:
-                width = 800
-            if height < 300:
-                height = 600
-            
-            # Open and resize image to fit current window size
-            image = Image.open(image_path)
-            image = image.resize((width, height), Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(image)
-            
-            # Create background label that fills entire window
-            bg_label = tk.Label(window, image=photo)
-            bg_label.image = photo  # Keep a reference
-            bg_label.place(x=0, y=0, relwidth=1, relheight=1)
-            bg_label.lower()  # Send to back so other widgets appear on top
-            
-            return True
-        else:
-            print(f"Background image not found at: {image_path}")
-            return False
-    except Exception as e:
-        print(f"Error loading background image: {e}")
+    if not background.loaded:
+        return False  # Still decoding on a worker; the screen manager shows it once done
+    if size is None:
+        # Get current window size
+        window.update_idletasks()
+        size = (window.winfo_width(), window.winfo_height())
+    width, height = size
+
+    # Use minimum reasonable size if window is too small
+    if width < 400:
+        width = 800
+    if height < 300:
+        height = 600
+
+    photo = background.photo(width, height, preview)
+    if photo is None:
         return False
+    if bg_label is None or not bg_label.winfo_exists():
+        # Create background label that fills entire window
+        bg_label = tk.Label(window, bd=0)
+        bg_label.place(x=0, y=0, relwidth=1, relheight=1)
+    if getattr(bg_label, "image", None) is not photo:
+        bg_label.config(image=photo)
+        bg_label.image = photo  # Keep a reference
+    bg_label.lower()  # Send to back so other widgets appear on top
+    return True
 
 #  DYNAMIC BACKGROUND RESIZE
+# While the window is being dragged to size a cheap preview follows it; the
+# full-quality image is scaled once the size has been still this long
+RESIZE_SETTLE_MS = 150
+resize_state = {"size": None, "preview": None, "settle": None}
+
 def on_window_resize(event):
-    """Handle window resize to update background image"""
-    if event.widget == window:  # Only handle main window resize
-        window.after(100, lambda: set_background_image(window))  # Small delay to avoid too many calls
+    """Coalesce resize events so only the last size gets a full rescale"""
+    if event.widget != window:  # Only handle main window resize
+        return
+    size = (event.width, event.height)
+    if size == resize_state["size"]:
+        return  # Moved, not resized
+    resize_state["size"] = size
+    if resize_state["preview"] is None:
+        # One preview per burst of events, at whatever size is current by then
+        resize_state["preview"] = window.after_idle(show_resize_preview)
+    if resize_state["settle"] is not None:
+        window.after_cancel(resize_state["settle"])
+    resize_state["settle"] = window.after(RESIZE_SETTLE_MS, finish_resize)
+
+def show_resize_preview():
+    resize_state["preview"] = None
+    set_background_image(window, resize_state["size"], preview=True)
+
+def finish_resize():
+    resize_state["settle"] = None
+    set_background_image(window, resize_state["size"])
+
+# SCREEN CACHE
+# Screens not shown for this long refresh when they come back, which picks up
+# changes made by other clients
+SCREEN_MAX_AGE = 60.0
+
+class Route:
+    """One visit to a page: the page function, its arguments and the state it left behind.
+
+    state is whatever the page's save hook returned when it was last left
+    (rows, scroll position, selection, ...), with version and saved_at telling
+    how fresh that data is; a page rebuilt for the route restores it instead
+    of querying again.
+    """
+
+    def __init__(self, page_func, *args):
+        self.page_func = page_func
+        self.args = args
+        self.state = None
+        self.version = None
+        self.saved_at = None
+
+    @property
+    def key(self):
+        """Cache key of the page's screen, or None for arguments that cannot be hashed"""
+        key = (self.page_func, self.args)
+        try:
+            hash(key)
+        except TypeError:
+            return None  # e.g. a form opened for a row; never cached
+        return key
+
+
+class Screen:
+    """The widgets one page built, with what is needed to hide and re-show them"""
+
+    def __init__(self, key, version, loaded_at):
+        self.key = key
+        self.widgets = []
+        self.refresh = None  # set by ScreenManager.keep(); None means not cached
+        self.save = None
+        self.version = version
+        self.loaded_at = loaded_at
+        self._geometry = []
+
+    def hide(self):
+        self._geometry = []
+        for widget in self.widgets:
+            manager = widget.winfo_manager()
+            if manager:
+                info = getattr(widget, manager + "_info")()
+                self._geometry.append((widget, manager, {k: v for k, v in info.items() if v != ""}))
+                getattr(widget, manager + "_forget")()
+
+    def restore(self):
+        for widget, manager, info in self._geometry:
+            getattr(widget, manager)(**info)
+
+    def stale(self):
+        return self.version != store.data_version or time.monotonic() - self.loaded_at > SCREEN_MAX_AGE
+
+    def destroy(self):
+        for widget in self.widgets:
+            widget.destroy()
+
+
+class ScreenManager:
+    """Shows routes, keeping the pages that ask for it built instead of rebuilding them.
+
+    A page function builds its widgets straight onto the window; whatever it
+    adds is its screen.  A page that calls keep(refresh, save) while it is
+    built is cached under its route's key in a bounded LRU: showing it again
+    only re-places its widgets.  save() is called whenever the page is left
+    and its result stored on the route, so a page evicted from the cache is
+    rebuilt from saved_state() rather than from fresh queries.  Either way
+    refresh() runs if this process has written to the database since the data
+    was loaded or it is older than SCREEN_MAX_AGE.  Pages that do not call
+    keep() (logins, forms) are destroyed when left.
+    """
+
+    def __init__(self, window, size=4):
+        self.window = window
+        self.size = size
+        self._screens = OrderedDict()  # route key -> Screen, least recently used first
+        self._current = None
+        self._route = None
+        self._building = None
+        self._decoding = False
+
+    def show(self, route):
+        if self._current is not None:
+            self._leave()
+        if background.loaded:
+            set_background_image(self.window)
+        elif not self._decoding:
+            # Decoding the image takes a while: the first page is drawn without it
+            self._decoding = True
+            tasks.submit(background.preload, on_done=lambda _: set_background_image(self.window))
+        key = route.key
+        screen = self._screens.get(key) if key is not None else None
+        if screen is not None:
+            self._screens.move_to_end(key)
+            self._current, self._route = screen, route
+            screen.restore()
+        else:
+            screen = self._build(route)
+        if screen.refresh is not None and screen.stale():
+            screen.version, screen.loaded_at = store.data_version, time.monotonic()
+            screen.refresh()
+
+    def _build(self, route):
+        restoring = route.state is not None
+        screen = Screen(route.key, route.version if restoring else store.data_version,
+                        route.saved_at if restoring else time.monotonic())
+        self._current, self._route = screen, route
+        before = set(self.window.winfo_children())
+        self._building = screen
+        try:
+            route.page_func(*route.args)
+        finally:
+            self._building = None
+            screen.widgets = [w for w in self.window.winfo_children() if w not in before and w is not bg_label]
+        if screen.refresh is not None and screen.key is not None:
+            self._screens[screen.key] = screen
+            while len(self._screens) > self.size:
+                _, evicted = self._screens.popitem(last=False)
+                evicted.destroy()
+        return screen
+
+    def keep(self, refresh, save=None):
+        """Called by a page while it is built: cache it, calling refresh() when it comes back stale.
+
+        save() returns the page's state for saved_state() when it is left.
+        """
+        if self._building is not None:
+            self._building.refresh = refresh
+            self._building.save = save
+
+    def saved_state(self):
+        """While a page is built: the state its save() returned last time, or None"""
+        if self._building is None:
+            return None
+        return self._route.state
+
+    def _leave(self):
+        screen, route = self._current, self._route
+        if screen.save is not None:
+            try:
+                route.state = screen.save()
+                route.version, route.saved_at = screen.version, screen.loaded_at
+            except Exception:
+                route.state = None  # A half-loaded page is simply rebuilt from queries
+        if screen.key in self._screens:
+            screen.hide()
+        else:
+            screen.destroy()
+
+    def clear(self):
+        """Forget every cached screen, e.g. on logout"""
+        for screen in self._screens.values():
+            if screen is not self._current:
+                screen.destroy()
+        self._screens.clear()
+
 
 # NAVIGATION SYSTEM 
-history = []
-forward_stack = []
+# Routes kept for Back and Forward; the oldest are dropped beyond this
+HISTORY_LIMIT = 30
+history = deque(maxlen=HISTORY_LIMIT)  # visited routes, the current one last
+forward_stack = deque(maxlen=HISTORY_LIMIT)
 
 def navigate_to(page_func, *args):
-    global history, forward_stack
-    current = window.winfo_children()
-    if current:
-        history.append(page_func)
+    if not session_alive():
+        return
+    route = Route(page_func, *args)
+    history.append(route)
     forward_stack.clear()
-    for widget in window.winfo_children():
-        widget.destroy()
-    # Set background image first
-    set_background_image(window)
-    page_func(*args)
+    screens.show(route)
 
 def go_back():
-    global history, forward_stack
-    if history:
-        current_page = history.pop()
-        forward_stack.append(current_page)
-        for widget in window.winfo_children():
-            widget.destroy()
-        set_background_image(window)
-        history[-1]() if history else show_main_menu()
+    if history and session_alive():
+        forward_stack.append(history.pop())
+        screens.show(history[-1] if history else Route(show_main_menu))
 
 def go_forward():
-    global forward_stack
-    if forward_stack:
-        page_func = forward_stack.pop()
-        page_func()
+    if forward_stack and session_alive():
+        route = forward_stack.pop()
+        history.append(route)
+        screens.show(route)
+
+def end_session():
+    """Back to the main menu, dropping the session's cached screens and history"""
+    global current_session
+    sessions.close(current_session)
+    current_session = None
+    screens.clear()
+    history.clear()
+    forward_stack.clear()
+    screens.show(Route(show_main_menu))
+
+# LOGIN SESSIONS
+# Whoever logged in at this window; actions check the session instead of the
+# password, and a session left unused for SESSION_MINUTES logs out
+sessions = SessionStore()
+current_session = None
+
+def start_session(user):
+    global current_session
+    current_session = sessions.open(user)
+
+def session_alive():
+    """True unless the login session has run out, in which case it is ended"""
+    if current_session is None or sessions.get(current_session) is not None:
+        return True
+    end_session()
+    messagebox.showinfo("Logged Out", "You were logged out after a period of inactivity")
+    return False
 
 #  STYLED FRAME HELPER 
 def create_styled_frame(parent, width=400, height=300):
@@ -106,14 +370,634 @@ def create_styled_frame(parent, width=400, height=300):
     frame.configure(highlightbackground='lightgray', highlightthickness=1)
     return frame
 
+# CATEGORY CHOICES
+def fill_categories(combo):
+    # Served from the store's category cache; only the first form of a session queries
+    run_db(store.category_names, on_done=lambda names: combo.config(values=names), widget=combo)
+
+# TABLE BINDING
+class TableBinding:
+    """Keeps a Treeview in step with query results keyed by primary key.
+
+    sync() inserts, updates, moves or removes only the rows that differ from
+    what is on screen, so refreshing after one change touches one row.
+    """
+
+    def __init__(self, tree, key=lambda row: row[0], format_row=tuple):
+        self.tree = tree
+        self.key = key
+        self.format_row = format_row
+        self._values = {}  # item id -> values currently shown
+
+    def sync(self, rows):
+        """Make the table show exactly rows, in this order"""
+        wanted = [(str(self.key(row)), self.format_row(row)) for row in rows]
+        keep = {iid for iid, _ in wanted}
+        self.remove([iid for iid in self._values if iid not in keep])
+        self._apply(wanted, positional=True)
+        order = [iid for iid, _ in wanted]
+        if list(self.tree.get_children()) != order:
+            for index, iid in enumerate(order):
+                self.tree.move(iid, "", index)
+
+    def upsert(self, rows):
+        """Update rows already shown and append new ones, leaving the rest alone"""
+        self._apply([(str(self.key(row)), self.format_row(row)) for row in rows], positional=False)
+
+    def _apply(self, items, positional):
+        for index, (iid, values) in enumerate(items):
+            shown = self._values.get(iid)
+            if shown is None:
+                self.tree.insert("", index if positional else "end", iid=iid, values=values)
+            elif shown != values:
+                self.tree.item(iid, values=values)
+            self._values[iid] = values
+
+    def remove(self, iids):
+        for iid in iids:
+            if self._values.pop(str(iid), None) is not None:
+                self.tree.delete(str(iid))
+
+    def snapshot(self):
+        """The rows shown, the selection and the scroll position, for restore()"""
+        return ([(iid, self._values[iid]) for iid in self.tree.get_children()],
+                self.tree.selection(), self.tree.yview()[0])
+
+    def restore(self, state):
+        """Show a snapshot() again without querying"""
+        items, selection, top = state
+        self._apply(items, positional=True)
+        self.tree.selection_set([iid for iid in selection if iid in self._values])
+        # The Treeview only knows its height once it is laid out
+        self.tree.after_idle(lambda: self.tree.yview_moveto(top))
+
+# LAZY TABS
+class LazyTabs:
+    """Runs each notebook tab's first query only when the tab is first selected.
+
+    A dashboard registers a loader per tab with on_first_show(); the tab on
+    screen loads when load_current() is called after the page is built, the
+    others when the user switches to them.
+    """
+
+    def __init__(self, notebook):
+        self.notebook = notebook
+        self._loaders = {}  # tab widget name -> loader
+        self._loaded = set()
+        notebook.bind("<<NotebookTabChanged>>", self.load_current, add="+")
+
+    def on_first_show(self, tab, load):
+        self._loaders[str(tab)] = load
+
+    def load_current(self, event=None):
+        tab = str(self.notebook.select())
+        if tab in self._loaders and tab not in self._loaded:
+            self._loaded.add(tab)
+            self._loaders[tab]()
+
+    def loaded(self, tab):
+        return str(tab) in self._loaded
+
+    def mark_loaded(self, tab):
+        """For a tab restored from saved state instead of queried"""
+        self._loaded.add(str(tab))
+
+# VIRTUAL TABLE
+LOADING_ROW = ("Loading...",)
+# Modifier bits of a Tk event's state
+SHIFT_MASK = 0x0001
+CONTROL_MASK = 0x0004
+
+class VirtualTable(tk.Frame):
+    """Treeview over a keyset-paginated query that only materializes the visible rows.
+
+    fetch(after, limit, skip) returns up to limit rows following the key after
+    (None for the first page), skipping skip rows first; key(row) gives the key
+    of a row.  With key=None pages are addressed by row offset instead (after is
+    the number of rows before the page), for results such as ranked searches
+    that have no stable sort key.  Only the pages around the visible window are
+    kept in memory.
+
+    changes(since) is optional and returns (rows, watermark) for rows changed
+    since a watermark (since=None only returns the current watermark); with it
+    refresh_changes() patches the cached rows instead of reloading.  include(row)
+    says whether a changed row still belongs in the query's result.
+
+    run is optional and works like run_db: with it every query runs on a worker
+    and rows whose page is still loading show as placeholders until it arrives.
+
+    selectmode="extended" lets several rows be selected with Shift and Control;
+    selected_rows() returns them, including any scrolled out of view.
+    """
+
+    def __init__(self, parent, columns, fetch, count, key, height=10, page_size=PAGE_SIZE,
+                 prefetch=1, format_row=None, changes=None, include=None, pk=lambda row: row[0], run=None,
+                 selectmode="browse"):
+        super().__init__(parent)
+        self.run = run
+        self.fetch = fetch
+        self.count = count
+        self.key = key
+        self.changes = changes
+        self.include = include or (lambda row: True)
+        self.pk = pk
+        self._since = None
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.format_row = format_row or tuple
+        self.visible_rows = height
+        self.total = 0
+        self.offset = 0
+        self._pages = OrderedDict()  # page number -> rows, least recently used first
+        self._anchors = {0: None}    # page number -> key of the row before it
+        self._slots = []             # Treeview items reused for the visible rows
+        self._slot_values = []       # values each slot currently shows
+        self._visible = []
+        self.selectmode = selectmode
+        self._selected = {}          # pk -> row of every selected row, on screen or not
+        self._select_index = None
+        self._extend_selection = False
+        self._replace_selection = False  # the next select event comes from a plain click or arrow
+        self._render_pending = False
+        self._loading = set()        # page numbers requested from a worker
+        self._generation = 0         # bumped on reload; older results are dropped
+
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=height, selectmode=selectmode)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(sequence, self._on_wheel)
+        self.tree.bind("<Up>", lambda e: self._on_arrow(-1, e))
+        self.tree.bind("<Down>", lambda e: self._on_arrow(1, e))
+        self.tree.bind("<ButtonPress-1>", self._on_click)
+        self.tree.bind("<Prior>", lambda e: self.scroll(-self.visible_rows) or "break")
+        self.tree.bind("<Next>", lambda e: self.scroll(self.visible_rows) or "break")
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<Configure>", self._on_resize)
+
+    # Treeview methods the pages use
+    def heading(self, column, **options):
+        return self.tree.heading(column, **options)
+
+    def selection(self):
+        return self.tree.selection()
+
+    def item(self, item, **options):
+        return self.tree.item(item, **options)
+
+    def selected_rows(self):
+        """Every selected row, in the order they were selected"""
+        return list(self._selected.values())
+
+    def _call(self, query, on_done, *args):
+        # Through run (a worker) when given, inline otherwise
+        if self.run is None:
+            return on_done(query(*args))
+        generation = self._generation
+
+        def deliver(result):
+            if generation == self._generation:  # Otherwise a reload has overtaken it
+                on_done(result)
+
+        self.run(query, *args, on_done=deliver, widget=self)
+
+    def refresh(self, reset=False):
+        """Re-run the query, keeping the scroll position unless reset is set"""
+        if reset:
+            self.offset = 0
+            self._selected = {}
+        self._generation += 1
+        # The old rows stay on screen until the new count arrives
+        self._call(self._load_total, self._reload)
+
+    def _load_total(self):
+        # Watermark first, so nothing committed during the reload is missed
+        since = self.changes(None)[1] if self.changes is not None else None
+        return since, self.count()
+
+    def _reload(self, result):
+        self._since, self.total = result
+        self._start_over()
+        self._render()
+
+    def _start_over(self):
+        self._generation += 1
+        self._pages.clear()
+        self._anchors = {0: None}
+        self._loading.clear()
+
+    def snapshot(self):
+        """The loaded pages, scroll position and selection, for restore()"""
+        return {"total": self.total, "offset": self.offset, "selected": dict(self._selected),
+                "since": self._since, "anchors": dict(self._anchors),
+                "pages": [(number, list(rows)) for number, rows in self._pages.items()]}
+
+    def restore(self, state):
+        """Show a snapshot() again without querying; pages it lacks load as usual"""
+        self._start_over()
+        self.total = state["total"]
+        self.offset = state["offset"]
+        self._selected = dict(state["selected"])
+        self._since = state["since"]
+        self._anchors = dict(state["anchors"])
+        self._pages.update(state["pages"])
+        self._render()
+
+    def load_first_page(self):
+        """Query everything show_first_page() needs; safe to call from a worker thread"""
+        since = self.changes(None)[1] if self.changes is not None else None
+        return self.count(), list(self.fetch(None, self.page_size, 0)), since
+
+    def show_first_page(self, total, rows, since=None):
+        """Display results fetched elsewhere (e.g. by a worker) from the top"""
+        self._start_over()
+        self._since = since
+        self.total = total
+        self.offset = 0
+        self._selected = {}
+        self._pages[0] = list(rows)
+        if len(rows) == self.page_size:
+            self._anchors[1] = self.key(rows[-1]) if self.key else self.page_size
+        self._render()
+
+    def refresh_changes(self):
+        """Apply only the rows changed since the last refresh.
+
+        A changed row that is cached and keeps its place is patched in place;
+        rows that appear inside, leave or move within the cached range trigger
+        a reload of the window.
+        """
+        if self.changes is None or self._since is None:
+            return self.refresh()
+        self._call(self.changes, self._apply_changes, self._since)
+
+    def _apply_changes(self, result):
+        rows, self._since = result
+        if not rows:
+            return None
+        cached = {}
+        for page in self._pages.values():
+            for index, row in enumerate(page):
+                cached[self.pk(row)] = (page, index)
+        for row in rows:
+            where = cached.get(self.pk(row))
+            included = self.include(row)
+            if where is not None:
+                page, index = where
+                if not included or (self.key and self.key(page[index]) != self.key(row)):
+                    return self.refresh()
+                page[index] = row
+            elif included and self._in_cached_range(row):
+                return self.refresh()
+        self._render()
+
+    def patch(self, rows):
+        """Show new values for cached rows whose sort key has not changed, without querying"""
+        new = {self.pk(row): row for row in rows}
+        for page in self._pages.values():
+            for index, row in enumerate(page):
+                if self.pk(row) in new:
+                    page[index] = new[self.pk(row)]
+        for pk in new.keys() & self._selected.keys():
+            self._selected[pk] = new[pk]
+        self._render()
+
+    def _in_cached_range(self, row):
+        if self.key is None:
+            return True  # No sort key, so the row could land anywhere
+        key = self.key(row)
+        for page in self._pages.values():
+            if page and self.key(page[0]) <= key and (len(page) < self.page_size or key <= self.key(page[-1])):
+                return True
+        return False
+
+    def scroll(self, rows):
+        self._scroll_to(self.offset + rows)
+
+    def _scroll_to(self, offset):
+        offset = max(0, min(int(offset), self.total - self.visible_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self._schedule_render()
+
+    def _schedule_render(self):
+        # Coalesce bursts of scroll events (e.g. dragging the scrollbar) into one render
+        if not self._render_pending:
+            self._render_pending = True
+            self.after_idle(self._render_safely)
+
+    def _render_safely(self):
+        try:
+            self._render()
+        except Exception as e:
+            messagebox.showerror("DB Error", str(e))
+
+    def _page(self, number, quiet=False):
+        """Rows of a page, or None while a worker is still fetching it"""
+        rows = self._pages.get(number)
+        if rows is not None:
+            self._pages.move_to_end(number)
+            return rows
+        known = max(n for n in self._anchors if n <= number)
+        args = (self._anchors[known], self.page_size, (number - known) * self.page_size)
+        if self.run is None:
+            return self._store_page(number, self.fetch(*args))
+        if number not in self._loading:
+            self._loading.add(number)
+            generation = self._generation
+            self.run(self.fetch, *args, widget=self,
+                     on_done=lambda rows: self._page_loaded(generation, number, rows),
+                     on_error=lambda error: self._page_failed(generation, number, error, quiet))
+        return None
+
+    def _page_loaded(self, generation, number, rows):
+        if generation != self._generation:
+            return
+        self._loading.discard(number)
+        self._store_page(number, rows)
+        self._schedule_render()
+
+    def _page_failed(self, generation, number, error, quiet):
+        if generation != self._generation:
+            return
+        self._loading.discard(number)  # The next render asks again
+        if not quiet:
+            messagebox.showerror("DB Error", str(error))
+
+    def _store_page(self, number, rows):
+        if len(rows) == self.page_size:
+            self._anchors[number + 1] = self.key(rows[-1]) if self.key else (number + 1) * self.page_size
+        else:
+            # Rows were deleted since count(); the last page tells the real total
+            self.total = number * self.page_size + len(rows)
+        rows = list(rows)
+        self._pages[number] = rows
+        while len(self._pages) > 2 * self.prefetch + 2:
+            self._pages.popitem(last=False)
+        return rows
+
+    def _rows(self, first, last):
+        rows = []
+        number = first // self.page_size
+        while first + len(rows) < min(last, self.total):
+            start = number * self.page_size
+            page = self._page(number)
+            if page is None:
+                # Still loading: hold its rows' places so the window keeps its size
+                rows.extend([None] * (min(last, self.total, start + self.page_size) - first - len(rows)))
+            else:
+                rows.extend(page[max(first - start, 0):last - start])
+                if len(page) < self.page_size:
+                    break
+            number += 1
+        return rows
+
+    def _render(self):
+        self._render_pending = False
+        self.offset = max(0, min(self.offset, self.total - self.visible_rows))
+        self._visible = self._rows(self.offset, self.offset + self.visible_rows)
+        if self._select_index is not None:
+            index = self._select_index - self.offset
+            if not 0 <= index < len(self._visible):
+                self._select_index = None
+            elif self._visible[index] is not None:  # Otherwise wait for its page
+                if not self._extend_selection:
+                    self._selected = {}
+                self._selected[self.pk(self._visible[index])] = self._visible[index]
+                self._select_index = None
+        selected = []
+        for index, row in enumerate(self._visible):
+            values = LOADING_ROW if row is None else self.format_row(row)
+            if index >= len(self._slots):
+                self._slots.append(self.tree.insert("", "end", values=values))
+                self._slot_values.append(values)
+            elif self._slot_values[index] != values:
+                self.tree.item(self._slots[index], values=values)
+                self._slot_values[index] = values
+            if row is not None and self.pk(row) in self._selected:
+                self._selected[self.pk(row)] = row
+                selected.append(self._slots[index])
+        for slot in self._slots[len(self._visible):]:
+            self.tree.delete(slot)
+        del self._slots[len(self._visible):]
+        del self._slot_values[len(self._visible):]
+        if selected:
+            if set(selected) != set(self.tree.selection()):
+                self.tree.selection_set(selected)
+        elif self.tree.selection():
+            self.tree.selection_remove(self.tree.selection())
+        self._update_scrollbar()
+        self.after_idle(self._prefetch_neighbours)
+
+    def _prefetch_neighbours(self):
+        first = self.offset // self.page_size
+        last = (self.offset + self.visible_rows) // self.page_size
+        try:
+            for number in range(max(first - self.prefetch, 0), last + self.prefetch + 1):
+                if number * self.page_size < self.total:
+                    self._page(number, quiet=True)
+        except Exception:
+            pass  # Prefetching is best effort; the next render reports real errors
+
+    def _update_scrollbar(self):
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, min((self.offset + self.visible_rows) / self.total, 1.0))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(float(amount) * self.total)
+        elif unit == "pages":
+            self.scroll(int(amount) * self.visible_rows)
+        else:
+            self.scroll(int(amount))
+
+    def _on_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.scroll(-3)
+        else:
+            self.scroll(3)
+        return "break"
+
+    def _on_arrow(self, step, event):
+        selection = self.tree.selection()
+        current = self.tree.focus() if self.tree.focus() in selection else (selection[0] if selection else "")
+        if current not in self._slots:
+            return None
+        extend = self.selectmode != "browse" and bool(event.state & SHIFT_MASK)
+        index = self._slots.index(current)
+        if 0 <= index + step < len(self._slots):
+            self._replace_selection = not extend
+            return None  # Let the Treeview move the selection inside the window
+        target = self.offset + index + step
+        if 0 <= target < self.total:
+            self._select_index = target
+            self._extend_selection = extend
+            self.scroll(step)
+        return "break"
+
+    def _on_click(self, event):
+        if self.tree.identify_region(event.x, event.y) == "cell":
+            self._replace_selection = self.selectmode == "browse" or not event.state & (SHIFT_MASK | CONTROL_MASK)
+
+    def _on_select(self, event):
+        # Only the rows on screen are in the Treeview; selected rows scrolled
+        # out of view stay selected unless a plain click or arrow replaced them
+        chosen = set(self.tree.selection())
+        if self._replace_selection or (self.selectmode == "browse" and chosen):
+            self._selected = {}
+        self._replace_selection = False
+        for slot, row in zip(self._slots, self._visible):
+            if row is None:
+                continue
+            if slot in chosen:
+                self._selected[self.pk(row)] = row
+            else:
+                self._selected.pop(self.pk(row), None)
+
+    def _on_resize(self, event):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        rows = max(1, (event.height - 25) // row_height)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self._schedule_render()
+
+# STREAMING REPORT
+class StreamingReport(tk.Frame):
+    """Treeview filled batch by batch from a streamed query, with progress and Cancel.
+
+    stream(*args) is a store stream_* method yielding row batches; count(*args)
+    gives the expected number of rows for the progress bar.  Rows are appended
+    as they arrive; past max_rows they are only counted, so neither Python nor
+    Tk holds more than max_rows rows however long the history is.  The values
+    of status_column are tallied over every row.
+    """
+
+    def __init__(self, parent, columns, stream, count=None, args=(), height=15,
+                 max_rows=REPORT_MAX_ROWS, status_column=-1):
+        super().__init__(parent, bg='white')
+        self.stream = stream
+        self.count = count
+        self.args = args
+        self.max_rows = max_rows
+        self.status_column = status_column
+        self.expected = None
+        self.shown = 0
+        self.tally = Counter()
+        self.complete = False
+        self._task = None
+
+        table_frame = tk.Frame(self)
+        table_frame.pack(fill="both", expand=True)
+        self.tree = ttk.Treeview(table_frame, columns=columns, show="headings", height=height)
+        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        self.binding = TableBinding(self.tree)
+
+        bar = tk.Frame(self, bg='white')
+        bar.pack(fill="x", pady=5)
+        self.progress = ttk.Progressbar(bar, length=200)
+        self.progress.pack(side="left", padx=5)
+        self.status = tk.Label(bar, text="", bg='white', anchor="w")
+        self.status.pack(side="left", fill="x", expand=True, padx=5)
+        self.cancel_button = tk.Button(bar, text="Cancel", command=self.cancel, bg='lightcoral', state="disabled")
+        self.cancel_button.pack(side="right", padx=5)
+
+    # Treeview methods the pages use
+    def heading(self, column, **options):
+        return self.tree.heading(column, **options)
+
+    def selection(self):
+        return self.tree.selection()
+
+    def item(self, item, **options):
+        return self.tree.item(item, **options)
+
+    def load(self):
+        """Run the report again from the top"""
+        self.cancel()
+        self.binding.sync([])
+        self.expected = None
+        self.shown = 0
+        self.tally.clear()
+        self.complete = False
+        self.progress.config(mode="indeterminate")
+        self.progress.start()
+        self.status.config(text="Loading...")
+        self.cancel_button.config(state="normal")
+        if self.count is not None:
+            run_db(self.count, *self.args, on_done=self._set_expected, on_error=lambda error: None, widget=self)
+        self._task = tasks.stream(self.stream, *self.args, on_batch=self._add,
+                                  on_done=self._finished, on_error=self._failed)
+
+    def cancel(self):
+        if self._task is not None and not self._task.settled:
+            self._task.cancel()
+            self._stopped(f"Cancelled after {self._task.rows:,} rows")
+        self._task = None
+
+    def _set_expected(self, expected):
+        self.expected = expected
+        if self._task is not None and not self._task.settled:
+            self.progress.stop()
+            self.progress.config(mode="determinate", maximum=max(expected, 1), value=self._task.rows)
+
+    def _add(self, batch):
+        if not self.winfo_exists():
+            # The page was destroyed; stop reading rows nobody will see
+            self._task.cancel()
+            return
+        room = self.max_rows - self.shown
+        if room > 0:
+            self.binding.upsert(batch[:room])
+            self.shown += min(room, len(batch))
+        self.tally.update(row[self.status_column] for row in batch)
+        rows = self._task.rows
+        if self.expected:
+            self.progress.config(value=rows)
+        self.status.config(text=f"{rows:,}{f' of {self.expected:,}' if self.expected else ''} rows...")
+
+    def _finished(self, rows):
+        if self.winfo_exists():
+            self.complete = True
+            self._stopped(f"{rows:,} rows")
+
+    def _failed(self, error):
+        if self.winfo_exists():
+            self._stopped("Failed")
+            show_db_error(error)
+
+    def _stopped(self, text):
+        self.progress.stop()
+        self.progress.config(mode="determinate", maximum=1, value=1 if self.complete else 0)
+        self.cancel_button.config(state="disabled")
+        if self.tally:
+            text += " - " + ", ".join(f"{value}: {n:,}" for value, n in sorted(self.tally.items()))
+        if self.shown < sum(self.tally.values()):
+            text += f" (showing the first {self.shown:,})"
+        self.status.config(text=text)
+
+    def snapshot(self):
+        """The finished report, for restore(); None while it is incomplete"""
+        if not self.complete:
+            return None
+        return self.binding.snapshot(), self.shown, dict(self.tally), self.status.cget("text")
+
+    def restore(self, state):
+        """Show a snapshot() again without querying"""
+        rows, self.shown, tally, text = state
+        self.binding.restore(rows)
+        self.tally = Counter(tally)
+        self.complete = True
+        self.progress.config(maximum=1, value=1)
+        self.status.config(text=text)
+
 # MAIN MENU
 def show_main_menu():
-    for widget in window.winfo_children():
-        widget.destroy()
-    
-    # Set background image
-    set_background_image(window)
-    
     # Create main content frame with semi-transparent background
     main_frame = create_styled_frame(window)
     main_frame.place(relx=0.5, rely=0.5, anchor='center', width=350, height=250)
@@ -125,11 +1009,6 @@ def show_main_menu():
 
 # REGISTER USER 
 def register_user():
-    for widget in window.winfo_children():
-        widget.destroy()
-    
-    set_background_image(window)
-    
     main_frame = create_styled_frame(window)
     main_frame.place(relx=0.5, rely=0.5, anchor='center', width=400, height=300)
 
@@ -155,34 +1034,18 @@ def register_user():
             messagebox.showerror("Error", "Fill all fields")
             return
 
-        encrypted = encrypt_password(password)
-        try:
-            db = db_connection()
-            cur = db.cursor()
-            cur.execute("SELECT email FROM users WHERE email=%s", (email,))
-            if cur.fetchone():
-                messagebox.showerror("Error", "Email already exists")
-                return
-            # Ensure parameters are passed as a tuple or list
-            cur.execute("INSERT INTO users (full_name, email, password, role) VALUES (%s, %s, %s, %s)", (full_name, email, encrypted, 'user'))  
-            db.commit()
+        def registered(_):
             messagebox.showinfo("Success", "Registration successful")
             navigate_to(show_main_menu)
-        except Exception as e:
-            messagebox.showerror("DB Error", str(e))
-        finally:
-            db.close()
 
-    tk.Button(main_frame, text="Register", command=submit, bg='lightgreen').pack(pady=10)
+        run_db(add_user, store, full_name, email, password, on_done=registered, widget=register_button)
+
+    register_button = tk.Button(main_frame, text="Register", command=submit, bg='lightgreen')
+    register_button.pack(pady=10)
     tk.Button(main_frame, text="Back", command=go_back, bg='lightgray').pack()
 
 # ADMIN LOGIN 
 def admin_login():
-    for widget in window.winfo_children():
-        widget.destroy()
-    
-    set_background_image(window)
-    
     main_frame = create_styled_frame(window)
     main_frame.place(relx=0.5, rely=0.5, anchor='center', width=400, height=300)
 
@@ -199,31 +1062,22 @@ def admin_login():
     def login():
         email = email_entry.get()
         password = password_entry.get()
-        encrypted = encrypt_password(password)
-        try:
-            db = db_connection()
-            cur = db.cursor()
-            cur.execute("SELECT role FROM users WHERE email=%s AND password=%s", (email, encrypted))
-            result = cur.fetchone()
-            if result and result[0] == "admin":
+
+        def logged_in(result):
+            if result and result[1] == "admin":
+                start_session(result)
                 navigate_to(admin_dashboard)
             else:
                 messagebox.showerror("Error", "Invalid credentials")
-        except Exception as e:
-            messagebox.showerror("DB Error", str(e))
-        finally:
-            db.close()
 
-    tk.Button(main_frame, text="Login", command=login, bg='lightblue').pack(pady=10)
+        run_db(check_login, store, email, password, on_done=logged_in, widget=login_button)
+
+    login_button = tk.Button(main_frame, text="Login", command=login, bg='lightblue')
+    login_button.pack(pady=10)
     tk.Button(main_frame, text="Back", command=go_back, bg='lightgray').pack()
 
 # USER LOGIN 
 def user_login():
-    for widget in window.winfo_children():
-        widget.destroy()
-    
-    set_background_image(window)
-    
     main_frame = create_styled_frame(window)
     main_frame.place(relx=0.5, rely=0.5, anchor='center', width=400, height=300)
 
@@ -240,31 +1094,22 @@ def user_login():
     def login():
         email = email_entry.get()
         password = password_entry.get()
-        encrypted = encrypt_password(password)
-        try:
-            db = db_connection()
-            cur = db.cursor()
-            cur.execute("SELECT user_id, role FROM users WHERE email=%s AND password=%s", (email, encrypted))
-            result = cur.fetchone()
+
+        def logged_in(result):
             if result and result[1] == "user":
+                start_session(result)
                 navigate_to(user_dashboard, result[0])
             else:
                 messagebox.showerror("Error", "Invalid credentials")
-        except Exception as e:
-            messagebox.showerror("DB Error", str(e))
-        finally:
-            db.close()
 
-    tk.Button(main_frame, text="Login", command=login, bg='lightgreen').pack(pady=10)
+        run_db(check_login, store, email, password, on_done=logged_in, widget=login_button)
+
+    login_button = tk.Button(main_frame, text="Login", command=login, bg='lightgreen')
+    login_button.pack(pady=10)
     tk.Button(main_frame, text="Back", command=go_back, bg='lightgray').pack()
 
 # ADMIN DASHBOARD - FIXED TO SHOW ALL BOOKS INCLUDING FULLY BORROWED ONES
 def admin_dashboard():
-    for widget in window.winfo_children():
-        widget.destroy()
-    
-    set_background_image(window)
-
     # Create main container with background
     container = tk.Frame(window, bg='white', relief='raised', bd=2)
     container.pack(fill='both', expand=True, padx=10, pady=10)
@@ -274,6 +1119,10 @@ def admin_dashboard():
     # Create a notebook for tabs
     notebook = ttk.Notebook(container)
     notebook.pack(fill="both", expand=True, padx=10, pady=10)
+    # Coming back through history: show what was on screen instead of querying
+    state = screens.saved_state()
+    # Each tab queries only once it is first looked at
+    tabs = LazyTabs(notebook)
 
     # Books tab
     books_frame = ttk.Frame(notebook)
@@ -283,10 +1132,24 @@ def admin_dashboard():
     users_frame = ttk.Frame(notebook)
     notebook.add(users_frame, text="Users Management")
 
+    # Overdue tab
+    overdue_frame = ttk.Frame(notebook)
+    notebook.add(overdue_frame, text="Overdue & Fines")
+
     # BOOKS TAB - FIXED TO SHOW ALL BOOKS
     tk.Label(books_frame, text="Books Management", font=("Arial", 14, "bold")).pack(pady=5)
     
-    books_table = ttk.Treeview(books_frame, columns=("ID", "Title", "Author", "Category", "Total", "Available"), show="headings", height=10)
+    def show_availability(row):
+        # If no copies available, say so instead of a bare 0
+        if row[5] == 0:
+            return tuple(row[:5]) + ("0 (All Borrowed)",)
+        return tuple(row)
+
+    # Only the visible rows are loaded, one keyset page at a time
+    books_table = VirtualTable(books_frame, ("ID", "Title", "Author", "Category", "Total", "Available"),
+                               fetch=store.books_page, count=store.count_books, key=store.book_key,
+                               height=10, format_row=show_availability, changes=store.books_changed_since,
+                               run=run_db)
     books_table.heading("ID", text="Book ID")
     books_table.heading("Title", text="Title")
     books_table.heading("Author", text="Author")
@@ -296,32 +1159,14 @@ def admin_dashboard():
     books_table.pack(fill="both", expand=True, padx=5, pady=5)
 
     def refresh_books_table():
-        for item in books_table.get_children():
-             books_table.delete(item)
-        try:
-          db = db_connection()
-          cur = db.cursor()
-
         # FIXED: Removed the condition that hides books with 0 available copies
-          cur.execute("""
-            SELECT b.book_id, b.title, b.author, c.category_name, b.total_copies, b.available_copies
-            FROM books b
-            JOIN categories c ON b.category_id = c.category_id
-            ORDER BY c.category_name, b.title
-        """)
-
-          for row in cur.fetchall():
-                # Color code rows based on availability
-                item = books_table.insert("", "end", values=row)
-                # If no copies available, you could add visual indication here
-                if row[5] == 0:  # available_copies is 0
-                    books_table.set(item, "Available", "0 (All Borrowed)")
-        except Exception as e:
-              messagebox.showerror("DB Error", str(e))
-        finally:
-              db.close()
+        books_table.refresh()
 
-    refresh_books_table()
+    if state and state["books"]:
+        books_table.restore(state["books"])
+        tabs.mark_loaded(books_frame)
+    else:
+        tabs.on_first_show(books_frame, refresh_books_table)
 
     # Book action buttons
     book_buttons_frame = tk.Frame(books_frame)
@@ -350,24 +1195,13 @@ def admin_dashboard():
         book_id = books_table.item(selected)["values"][0]
         book_title = books_table.item(selected)["values"][1]
         
+        def deleted(_):
+            messagebox.showinfo("Success", "Book deleted successfully")
+            refresh_books_table()
+
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete '{book_title}'?"):
-            try:
-                db = db_connection()
-                cur = db.cursor()
-                # Check if book is currently borrowed
-                cur.execute("SELECT COUNT(*) FROM borrowed WHERE book_id=%s AND return_date IS NULL", (book_id,))
-                if cur.fetchone()[0] > 0:
-                    messagebox.showerror("Error", "Cannot delete book that is currently borrowed")
-                    return
-                
-                cur.execute("DELETE FROM books WHERE book_id=%s", (book_id,))
-                db.commit()
-                messagebox.showinfo("Success", "Book deleted successfully")
-                refresh_books_table()
-            except Exception as e:
-                messagebox.showerror("DB Error", str(e))
-            finally:
-                db.close()
+            # Refused while the book is currently borrowed
+            run_db(store.delete_book, book_id, on_done=deleted, widget=delete_book_button)
 
     def view_borrowed():
         selected = books_table.selection()
@@ -379,11 +1213,19 @@ def admin_dashboard():
 
     def logout():
         if messagebox.askyesno("Confirm Logout", "Are you sure you want to logout?"):
-            navigate_to(show_main_menu)
+            end_session()
 
     tk.Button(book_buttons_frame, text="Add Book", command=add_book, width=12, bg='lightgreen').pack(side="left", padx=5)
+    # Bulk data in and out of the library
+    data_button = tk.Menubutton(book_buttons_frame, text="Data", width=12, bg='lightgreen', relief='raised')
+    data_menu = tk.Menu(data_button, tearoff=0)
+    data_menu.add_command(label="Import Books...", command=lambda: navigate_to(admin_import_books))
+    data_menu.add_command(label="Export Data...", command=lambda: navigate_to(admin_export_data))
+    data_button.config(menu=data_menu)
+    data_button.pack(side="left", padx=5)
     tk.Button(book_buttons_frame, text="Edit Book", command=edit_book, width=12, bg='lightyellow').pack(side="left", padx=5)
-    tk.Button(book_buttons_frame, text="Delete Book", command=delete_book, width=12, bg='lightcoral').pack(side="left", padx=5)
+    delete_book_button = tk.Button(book_buttons_frame, text="Delete Book", command=delete_book, width=12, bg='lightcoral')
+    delete_book_button.pack(side="left", padx=5)
     tk.Button(book_buttons_frame, text="View Borrowed", command=view_borrowed, width=12, bg='lightblue').pack(side="left", padx=5)
     tk.Button(book_buttons_frame, text="All Borrowed Books", command=lambda: navigate_to(admin_all_borrowed), width=15, bg='lightcyan').pack(side="left", padx=5)
     tk.Button(book_buttons_frame, text="Logout", command=logout, width=12, bg='lightgray').pack(side="left", padx=5)
@@ -397,24 +1239,17 @@ def admin_dashboard():
     users_table.heading("Email", text="Email")
     users_table.heading("Role", text="Role")
     users_table.pack(fill="both", expand=True, padx=5, pady=5)
+    users_binding = TableBinding(users_table)
 
     def refresh_users_table():
-        for item in users_table.get_children():
-            users_table.delete(item)
-        try:
-            db = db_connection()
-            cur = db.cursor()
-            # FIXED: Match the column order with table headers
-            cur.execute("SELECT user_id, full_name, email, role FROM users WHERE role='user'")
-            users = cur.fetchall()
-            for row in users:
-                users_table.insert("", "end", values=row)
-        except Exception as e:
-            messagebox.showerror("DB Error", str(e))
-        finally:
-            db.close()
+        # FIXED: Match the column order with table headers
+        run_db(store.list_users, on_done=users_binding.sync, widget=users_table)
 
-    refresh_users_table()
+    if state and state["users"]:
+        users_binding.restore(state["users"])
+        tabs.mark_loaded(users_frame)
+    else:
+        tabs.on_first_show(users_frame, refresh_users_table)
 
     # User action buttons
     user_buttons_frame = tk.Frame(users_frame)
@@ -439,49 +1274,102 @@ def admin_dashboard():
         user_id = users_table.item(selected)["values"][0]
         user_email = users_table.item(selected)["values"][2]  # Fixed index for email
         
+        def deleted(_):
+            messagebox.showinfo("Success", "User deleted successfully")
+            refresh_users_table()
+
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete user '{user_email}'?"):
-            try:
-                db = db_connection()
-                cur = db.cursor()
-                # Check if user has borrowed books
-                cur.execute("SELECT COUNT(*) FROM borrowed WHERE user_id=%s AND return_date IS NULL", (user_id,))
-                if cur.fetchone()[0] > 0:
-                    messagebox.showerror("Error", "Cannot delete user who has borrowed books")
-                    return
-                
-                cur.execute("DELETE FROM users WHERE user_id=%s", (user_id,))
-                db.commit()
-                messagebox.showinfo("Success", "User deleted successfully")
-                refresh_users_table()
-            except Exception as e:
-                messagebox.showerror("DB Error", str(e))
-            finally:
-                db.close()
+            # Refused while the user has borrowed books
+            run_db(store.delete_user, user_id, on_done=deleted, widget=delete_user_button)
 
     def logout_users():
         if messagebox.askyesno("Confirm Logout", "Are you sure you want to logout?"):
-            navigate_to(show_main_menu)
+            end_session()
 
     tk.Button(user_buttons_frame, text="Add User", command=add_user, width=12, bg='lightgreen').pack(side="left", padx=5)
     tk.Button(user_buttons_frame, text="Edit User", command=edit_user, width=12, bg='lightyellow').pack(side="left", padx=5)
-    tk.Button(user_buttons_frame, text="Delete User", command=delete_user, width=12, bg='lightcoral').pack(side="left", padx=5)
+    delete_user_button = tk.Button(user_buttons_frame, text="Delete User", command=delete_user, width=12, bg='lightcoral')
+    delete_user_button.pack(side="left", padx=5)
     tk.Button(user_buttons_frame, text="View User Books", command=lambda: navigate_to(admin_user_borrowed), width=15, bg='lightcyan').pack(side="left", padx=5)
     tk.Button(user_buttons_frame, text="Logout", command=logout_users, width=12, bg='lightgray').pack(side="left", padx=5)
 
+    # OVERDUE TAB - fines as materialized by the last assessment (see teakfines)
+    from teakfines import FineAssessment, format_amount
+
+    tk.Label(overdue_frame, text="Users With Overdue Books", font=("Arial", 14, "bold")).pack(pady=5)
+
+    overdue_table = ttk.Treeview(overdue_frame, columns=("ID", "Full_Name", "Email", "Overdue", "Oldest_Due", "Fines"),
+                                 show="headings", height=10)
+    overdue_table.heading("ID", text="User ID")
+    overdue_table.heading("Full_Name", text="Full Name")
+    overdue_table.heading("Email", text="Email")
+    overdue_table.heading("Overdue", text="Overdue Books")
+    overdue_table.heading("Oldest_Due", text="Oldest Due Date")
+    overdue_table.heading("Fines", text="Fines")
+    overdue_table.pack(fill="both", expand=True, padx=5, pady=5)
+    overdue_binding = TableBinding(overdue_table, format_row=lambda row: tuple(row[:5]) + (format_amount(row[5]),))
+
+    def refresh_overdue_table():
+        run_db(store.users_with_overdue, on_done=overdue_binding.sync, widget=overdue_table)
+
+    if state and state.get("overdue"):
+        overdue_binding.restore(state["overdue"])
+        tabs.mark_loaded(overdue_frame)
+    else:
+        tabs.on_first_show(overdue_frame, refresh_overdue_table)
+
+    overdue_buttons_frame = tk.Frame(overdue_frame)
+    overdue_buttons_frame.pack(pady=10)
+
+    def assess_fines():
+        # Worker thread: the same pass the nightly job runs
+        job = FineAssessment(store)
+        for _ in job.run():
+            pass
+        return job.summary()
+
+    def assessed(summary):
+        messagebox.showinfo("Fines", summary)
+        refresh_overdue_table()
+
+    assess_button = tk.Button(overdue_buttons_frame, text="Assess Fines Now", width=15, bg='lightyellow',
+                              command=lambda: run_db(assess_fines, on_done=assessed, widget=assess_button))
+    assess_button.pack(side="left", padx=5)
+    tk.Button(overdue_buttons_frame, text="View User Books", command=lambda: navigate_to(admin_user_borrowed), width=15, bg='lightcyan').pack(side="left", padx=5)
+    tk.Button(overdue_buttons_frame, text="Logout", command=logout_users, width=12, bg='lightgray').pack(side="left", padx=5)
+
     # Navigation buttons
     nav_frame = tk.Frame(container, bg='white')
     nav_frame.pack(pady=10)
     tk.Button(nav_frame, text="Back", command=go_back, bg='lightgray').pack(side="left", padx=5)
     if forward_stack:
         tk.Button(nav_frame, text="Forward", command=go_forward, bg='lightgray').pack(side="left", padx=5)
+    tk.Button(nav_frame, text="Analytics", command=lambda: navigate_to(admin_analytics), bg='lightblue').pack(side="left", padx=5)
+    tk.Button(nav_frame, text="Scan Desk", command=lambda: navigate_to(admin_scan_desk), bg='lightgreen').pack(side="left", padx=5)
+
+    if state:
+        notebook.select(state["tab"])
+    tabs.load_current()
+
+    def refresh_dashboard():
+        # A tab not loaded yet queries fresh data when it is first shown anyway
+        if tabs.loaded(books_frame):
+            books_table.refresh_changes()
+        if tabs.loaded(users_frame):
+            refresh_users_table()
+        if tabs.loaded(overdue_frame):
+            refresh_overdue_table()
+
+    def save_dashboard():
+        return {"books": books_table.snapshot() if tabs.loaded(books_frame) else None,
+                "users": users_binding.snapshot() if tabs.loaded(users_frame) else None,
+                "overdue": overdue_binding.snapshot() if tabs.loaded(overdue_frame) else None,
+                "tab": notebook.index("current")}
+
+    screens.keep(refresh_dashboard, save_dashboard)
 
 # ADMIN EDIT BOOK - FIXED
 def admin_edit_book(book_data):
-    for widget in window.winfo_children():
-        widget.destroy()
-    
-    set_background_image(window)
-    
     main_frame = create_styled_frame(window)
     main_frame.place(relx=0.5, rely=0.5, anchor='center', width=450, height=400)
 
@@ -502,22 +1390,11 @@ def admin_edit_book(book_data):
 
     tk.Label(form_frame, text="Category:", bg='white').grid(row=2, column=0, sticky="e", padx=5, pady=5)
     
-    # Get categories and current category
-    try:
-        db = db_connection()
-        cur = db.cursor()
-        cur.execute("SELECT category_name FROM categories")
-        categories = [row[0] for row in cur.fetchall()]
-        current_category = book_data[3]  # category name from display
-        db.close()
-    except Exception as e:
-        messagebox.showerror("DB Error", str(e))
-        categories = []
-        current_category = ""
-    
-    category_var = tk.StringVar(value=current_category)
-    category_combo = ttk.Combobox(form_frame, textvariable=category_var, values=categories)
+    # Current category comes from the display
+    category_var = tk.StringVar(value=book_data[3])
+    category_combo = ttk.Combobox(form_frame, textvariable=category_var, values=[])
     category_combo.grid(row=2, column=1, padx=5, pady=5)
+    fill_categories(category_combo)
     
     tk.Label(form_frame, text="Total Copies:", bg='white').grid(row=3, column=0, sticky="e", padx=5, pady=5)
     copies_entry = tk.Entry(form_frame, width=30)
@@ -538,57 +1415,23 @@ def admin_edit_book(book_data):
             messagebox.showerror("Error", "Please fill all fields with valid data")
             return
 
-        try:
-            db = db_connection()
-            cur = db.cursor()
-            
-            # Check if title already exists for other books
-            cur.execute("SELECT book_id FROM books WHERE title=%s AND book_id != %s", (title, book_data[0]))
-            if cur.fetchone():
-                messagebox.showerror("Error", "Book title already exists")
-                return
-            
-            # Get or create category
-            cur.execute("SELECT category_id FROM categories WHERE category_name=%s", (category_name,))
-            category = cur.fetchone()
-            if category:
-                category_id = category[0]
-            else:
-                cur.execute("INSERT INTO categories (category_name) VALUES (%s)", (category_name,))
-                category_id = cur.lastrowid
-                
-            # Calculate available copies difference
-            old_total = book_data[4]
-            old_available = book_data[5]
-            difference = total_copies - old_total
-            new_available = old_available + difference
-            
-            # Make sure available copies don't go negative
-            if new_available < 0:
-                new_available = 0
-            
-            cur.execute("UPDATE books SET title=%s, author=%s, category_id=%s, total_copies=%s, available_copies=%s WHERE book_id=%s", 
-                       (title, author, category_id, total_copies, new_available, book_data[0]))
-            db.commit()
+        def updated(_):
             messagebox.showinfo("Success", "Book updated successfully")
             navigate_to(admin_dashboard)
-        except Exception as e:
-            messagebox.showerror("DB Error", str(e))
-        finally:
-            db.close()
+
+        # Rejects duplicate titles, creates the category if needed and shifts
+        # available copies by the change in total copies
+        run_db(store.update_book, book_data[0], title, author, category_name, total_copies,
+               on_done=updated, widget=update_button)
 
     button_frame = tk.Frame(main_frame, bg='white')
     button_frame.pack(pady=20)
-    tk.Button(button_frame, text="Update Book", command=submit, bg='lightgreen').pack(side="left", padx=5)
+    update_button = tk.Button(button_frame, text="Update Book", command=submit, bg='lightgreen')
+    update_button.pack(side="left", padx=5)
     tk.Button(button_frame, text="Cancel", command=lambda: navigate_to(admin_dashboard), bg='lightgray').pack(side="left", padx=5)
 
 # ADMIN ADD BOOK - FIXED (removed duplicate)
 def admin_add_book():
-    for widget in window.winfo_children():
-        widget.destroy()
-    
-    set_background_image(window)
-    
     main_frame = create_styled_frame(window)
     main_frame.place(relx=0.5, rely=0.5, anchor='center', width=450, height=400)
 
@@ -606,8 +1449,10 @@ def admin_add_book():
     author_entry.grid(row=1, column=1, padx=5, pady=5)
 
     tk.Label(form_frame, text="Category:", bg='white').grid(row=2, column=0, sticky="e", padx=5, pady=5)
-    category_entry = tk.Entry(form_frame, width=30)
+    # Pick an existing category or type a new one
+    category_entry = ttk.Combobox(form_frame, width=28, values=[])
     category_entry.grid(row=2, column=1, padx=5, pady=5)
+    fill_categories(category_entry)
     
     tk.Label(form_frame, text="Total Copies:", bg='white').grid(row=3, column=0, sticky="e", padx=5, pady=5)
     copies_entry = tk.Entry(form_frame, width=30)
@@ -627,47 +1472,200 @@ def admin_add_book():
             messagebox.showerror("Error", "Please fill all fields with valid data")
             return
 
-        try:
-            db = db_connection()
-            cur = db.cursor()
-            
-            # Check if title already exists
-            cur.execute("SELECT book_id FROM books WHERE title=%s", (title,))
-            if cur.fetchone():
-                messagebox.showerror("Error", "Book title already exists")
-                return
-            
-            # Check if category exists, if not create it
-            cur.execute("SELECT category_id FROM categories WHERE category_name=%s", (category_name,))
-            category = cur.fetchone()
-            if category:
-                category_id = category[0]
-            else:
-                cur.execute("INSERT INTO categories (category_name) VALUES (%s)", (category_name,))
-                category_id = cur.lastrowid
-            
-            cur.execute("INSERT INTO books (title, author, category_id, total_copies, available_copies) VALUES (%s, %s, %s, %s, %s)", 
-                       (title, author, category_id, total_copies, total_copies))
-            db.commit()
+        def added(_):
             messagebox.showinfo("Success", "Book added successfully")
             navigate_to(admin_dashboard)
-        except Exception as e:
-            messagebox.showerror("DB Error", str(e))
-        finally:
-            db.close()
+
+        # Rejects duplicate titles and creates the category if needed
+        run_db(store.add_book, title, author, category_name, total_copies, on_done=added, widget=add_button)
 
     button_frame = tk.Frame(main_frame, bg='white')
     button_frame.pack(pady=20)
-    tk.Button(button_frame, text="Add Book", command=submit, bg='lightgreen').pack(side="left", padx=5)
+    add_button = tk.Button(button_frame, text="Add Book", command=submit, bg='lightgreen')
+    add_button.pack(side="left", padx=5)
     tk.Button(button_frame, text="Cancel", command=lambda: navigate_to(admin_dashboard), bg='lightgray').pack(side="left", padx=5)
 
+# ADMIN IMPORT BOOKS
+def admin_import_books():
+    # Imported here so starting the window does not pay for the bulk data modules
+    from teakimport import CatalogImport
+
+    main_frame = create_styled_frame(window)
+    main_frame.place(relx=0.5, rely=0.5, anchor='center', width=500, height=320)
+
+    tk.Label(main_frame, text="Import Books", font=("Arial", 16, "bold"), bg='white').pack(pady=10)
+    tk.Label(main_frame, text="CSV or JSON file with title, author, category and copies", bg='white').pack()
+
+    progress = ttk.Progressbar(main_frame, length=400, maximum=1.0)
+    progress.pack(pady=15)
+    status_label = tk.Label(main_frame, text="", bg='white', wraplength=450)
+    status_label.pack(pady=5)
+
+    # The import keeps going if the page is left; it only stops on Cancel
+    running = {"job": None, "task": None}
+
+    def show_progress(_):
+        if main_frame.winfo_exists():
+            job = running["job"]
+            progress.config(value=job.fraction)
+            status_label.config(text=f"{job.imported:,} imported, {job.rejected:,} rejected...")
+
+    def stopped(text):
+        running["task"] = None
+        if main_frame.winfo_exists():
+            progress.config(value=running["job"].fraction)
+            status_label.config(text=text)
+            choose_button.config(state="normal")
+            cancel_button.config(state="disabled")
+
+    def finished(_):
+        stopped(running["job"].summary())
+        messagebox.showinfo("Import Finished", running["job"].summary())
+
+    def failed(error):
+        stopped(f"Stopped: {running['job'].summary()}")
+        show_db_error(error)
+
+    def choose_file():
+        path = filedialog.askopenfilename(title="Import Books", filetypes=[
+            ("Catalog files", "*.csv *.json *.jsonl *.ndjson"), ("All files", "*.*")])
+        if not path:
+            return
+        # Read and written in chunks on a worker; each chunk commits on its own
+        running["job"] = CatalogImport(store, path)
+        running["task"] = tasks.stream(running["job"].run, on_batch=show_progress,
+                                       on_done=finished, on_error=failed)
+        progress.config(value=0)
+        status_label.config(text="Importing...")
+        choose_button.config(state="disabled")
+        cancel_button.config(state="normal")
+
+    def cancel():
+        if running["task"] is not None:
+            running["task"].cancel()
+            stopped(f"Cancelled: {running['job'].summary()}")
+
+    button_frame = tk.Frame(main_frame, bg='white')
+    button_frame.pack(pady=15)
+    choose_button = tk.Button(button_frame, text="Choose File...", command=choose_file, bg='lightgreen')
+    choose_button.pack(side="left", padx=5)
+    cancel_button = tk.Button(button_frame, text="Cancel", command=cancel, bg='lightcoral', state="disabled")
+    cancel_button.pack(side="left", padx=5)
+    tk.Button(button_frame, text="Back to Dashboard", command=lambda: navigate_to(admin_dashboard), bg='lightgray').pack(side="left", padx=5)
+
+# ADMIN EXPORT DATA
+# Where the last export of each table in this session stopped, to offer as "changes since"
+export_watermarks = {}
+
+def admin_export_data():
+    from teakexport import FORMATS, TableExport, export_path
+
+    main_frame = create_styled_frame(window)
+    main_frame.place(relx=0.5, rely=0.5, anchor='center', width=520, height=400)
+
+    tk.Label(main_frame, text="Export Data", font=("Arial", 16, "bold"), bg='white').pack(pady=10)
+
+    form_frame = tk.Frame(main_frame, bg='white')
+    form_frame.pack(pady=5)
+
+    tk.Label(form_frame, text="Tables:", bg='white').grid(row=0, column=0, sticky="e", padx=5, pady=5)
+    tables_frame = tk.Frame(form_frame, bg='white')
+    tables_frame.grid(row=0, column=1, sticky="w", padx=5, pady=5)
+    table_vars = {}
+    for table in EXPORTS:
+        table_vars[table] = tk.BooleanVar(value=True)
+        tk.Checkbutton(tables_frame, text=table.capitalize(), variable=table_vars[table], bg='white').pack(side="left")
+
+    tk.Label(form_frame, text="Format:", bg='white').grid(row=1, column=0, sticky="e", padx=5, pady=5)
+    format_var = tk.StringVar(value="csv")
+    ttk.Combobox(form_frame, textvariable=format_var, values=list(FORMATS), width=10,
+                 state="readonly").grid(row=1, column=1, sticky="w", padx=5, pady=5)
+
+    tk.Label(form_frame, text="Changes since:", bg='white').grid(row=2, column=0, sticky="e", padx=5, pady=5)
+    since_entry = tk.Entry(form_frame, width=30)
+    since_entry.grid(row=2, column=1, sticky="w", padx=5, pady=5)
+    if export_watermarks:
+        since_entry.insert(0, min(export_watermarks.values()).isoformat(sep=" "))
+    tk.Label(form_frame, text="YYYY-MM-DD HH:MM:SS, blank for everything", bg='white',
+             fg='gray').grid(row=3, column=1, sticky="w", padx=5)
+
+    progress = ttk.Progressbar(main_frame, length=420)
+    progress.pack(pady=10)
+    status_label = tk.Label(main_frame, text="", bg='white', wraplength=470, justify="left")
+    status_label.pack(pady=5)
+
+    # The export keeps going if the page is left; it only stops on Cancel
+    running = {"job": None, "task": None, "done": []}
+
+    def export_all(jobs):
+        # Worker thread: the tables one after another
+        for job in jobs:
+            running["job"] = job
+            yield from job.run()
+            running["done"].append(job)
+
+    def show_progress(_):
+        job = running["job"]
+        if main_frame.winfo_exists() and job.expected is not None:
+            progress.config(maximum=max(job.expected, 1), value=job.rows)
+            status_label.config(text=f"{job.table}: {job.rows:,} of {job.expected:,} rows...")
+
+    def stopped(text):
+        running["task"] = None
+        for job in running["done"]:
+            export_watermarks[job.table] = job.watermark
+        if main_frame.winfo_exists():
+            status_label.config(text="\n".join([job.summary() for job in running["done"]] + [text]))
+            export_button.config(state="normal")
+            cancel_button.config(state="disabled")
+
+    def finished(_):
+        stopped("Export finished")
+
+    def failed(error):
+        stopped("Export stopped")
+        show_db_error(error)
+
+    def start_export():
+        tables = [table for table, selected in table_vars.items() if selected.get()]
+        if not tables:
+            messagebox.showerror("Error", "Please select a table to export")
+            return
+        since = None
+        if since_entry.get().strip():
+            try:
+                since = datetime.fromisoformat(since_entry.get().strip())
+            except ValueError:
+                messagebox.showerror("Error", "Changes since must look like 2024-01-31 18:00:00")
+                return
+        directory = filedialog.askdirectory(title="Export To")
+        if not directory:
+            return
+        fmt = format_var.get()
+        jobs = [TableExport(store, table, export_path(directory, table, fmt, since), fmt, since) for table in tables]
+        running["done"] = []
+        # Streamed from a server-side cursor straight into the files on a worker
+        running["task"] = tasks.stream(export_all, jobs, on_batch=show_progress, on_done=finished, on_error=failed)
+        progress.config(value=0)
+        status_label.config(text="Exporting...")
+        export_button.config(state="disabled")
+        cancel_button.config(state="normal")
+
+    def cancel():
+        if running["task"] is not None:
+            running["task"].cancel()
+            stopped("Cancelled; the table being exported was not written")
+
+    button_frame = tk.Frame(main_frame, bg='white')
+    button_frame.pack(pady=10)
+    export_button = tk.Button(button_frame, text="Export To...", command=start_export, bg='lightgreen')
+    export_button.pack(side="left", padx=5)
+    cancel_button = tk.Button(button_frame, text="Cancel", command=cancel, bg='lightcoral', state="disabled")
+    cancel_button.pack(side="left", padx=5)
+    tk.Button(button_frame, text="Back to Dashboard", command=lambda: navigate_to(admin_dashboard), bg='lightgray').pack(side="left", padx=5)
+
 # ADMIN ADD USER - COMPLETED
 def admin_add_user():
-    for widget in window.winfo_children():
-        widget.destroy()
-    
-    set_background_image(window)
-    
     main_frame = create_styled_frame(window)
     main_frame.place(relx=0.5, rely=0.5, anchor='center', width=450, height=350)
 
@@ -697,39 +1695,20 @@ def admin_add_user():
             messagebox.showerror("Error", "Please fill all fields")
             return
 
-        try:
-            db = db_connection()
-            cur = db.cursor()
-            
-            # Check if email already exists
-            cur.execute("SELECT email FROM users WHERE email=%s", (email,))
-            if cur.fetchone():
-                messagebox.showerror("Error", "Email already exists")
-                return
-            
-            encrypted_password = encrypt_password(password)
-            cur.execute("INSERT INTO users (full_name, email, password, role) VALUES (%s, %s, %s, %s)", 
-                       (full_name, email, encrypted_password, 'user'))
-            db.commit()
+        def added(_):
             messagebox.showinfo("Success", "User added successfully")
             navigate_to(admin_dashboard)
-        except Exception as e:
-            messagebox.showerror("DB Error", str(e))
-        finally:
-            db.close()
+
+        run_db(add_user, store, full_name, email, password, on_done=added, widget=add_button)
 
     button_frame = tk.Frame(main_frame, bg='white')
     button_frame.pack(pady=20)
-    tk.Button(button_frame, text="Add User", command=submit, bg='lightgreen').pack(side="left", padx=5)
+    add_button = tk.Button(button_frame, text="Add User", command=submit, bg='lightgreen')
+    add_button.pack(side="left", padx=5)
     tk.Button(button_frame, text="Cancel", command=lambda: navigate_to(admin_dashboard), bg='lightgray').pack(side="left", padx=5)
 
 # ADMIN EDIT USER
 def admin_edit_user(user_data):
-    for widget in window.winfo_children():
-        widget.destroy()
-    
-    set_background_image(window)
-    
     main_frame = create_styled_frame(window)
     main_frame.place(relx=0.5, rely=0.5, anchor='center', width=450, height=350)
 
@@ -761,51 +1740,31 @@ def admin_edit_user(user_data):
             messagebox.showerror("Error", "Name and email are required")
             return
 
-        try:
-            db = db_connection()
-            cur = db.cursor()
-            
-            # Check if email already exists for other users
-            cur.execute("SELECT user_id FROM users WHERE email=%s AND user_id != %s", (email, user_data[0]))
-            if cur.fetchone():
-                messagebox.showerror("Error", "Email already exists")
-                return
-            
-            if password:
-                encrypted_password = encrypt_password(password)
-                cur.execute("UPDATE users SET full_name=%s, email=%s, password=%s WHERE user_id=%s", 
-                           (full_name, email, encrypted_password, user_data[0]))
-            else:
-                cur.execute("UPDATE users SET full_name=%s, email=%s WHERE user_id=%s", 
-                           (full_name, email, user_data[0]))
-            
-            db.commit()
+        def updated(_):
             messagebox.showinfo("Success", "User updated successfully")
             navigate_to(admin_dashboard)
-        except Exception as e:
-            messagebox.showerror("DB Error", str(e))
-        finally:
-            db.close()
+
+        # Blank password keeps the current one
+        run_db(save_user, store, user_data[0], full_name, email, password or None,
+               on_done=updated, widget=update_button)
 
     button_frame = tk.Frame(main_frame, bg='white')
     button_frame.pack(pady=20)
-    tk.Button(button_frame, text="Update User", command=submit, bg='lightgreen').pack(side="left", padx=5)
+    update_button = tk.Button(button_frame, text="Update User", command=submit, bg='lightgreen')
+    update_button.pack(side="left", padx=5)
     tk.Button(button_frame, text="Cancel", command=lambda: navigate_to(admin_dashboard), bg='lightgray').pack(side="left", padx=5)
 
 # ADMIN VIEW BORROWED BOOKS FOR SPECIFIC BOOK
 def admin_view_borrowed(book_id):
-    for widget in window.winfo_children():
-        widget.destroy()
-    
-    set_background_image(window)
-    
     container = tk.Frame(window, bg='white', relief='raised', bd=2)
     container.pack(fill='both', expand=True, padx=10, pady=10)
 
     tk.Label(container, text="Borrowed Books Report", font=("Arial", 16, "bold"), bg='white').pack(pady=10)
 
-    # Create treeview for borrowed books
-    borrowed_table = ttk.Treeview(container, columns=("ID", "User", "Email", "Borrow_Date", "Due_Date", "Status"), show="headings", height=15)
+    # Streamed batch by batch; a long history never has to fit in memory at once
+    borrowed_table = StreamingReport(container, ("ID", "User", "Email", "Borrow_Date", "Due_Date", "Status"),
+                                     stream=store.stream_book_borrowings, count=store.count_book_borrowings,
+                                     args=(book_id,), height=15)
     borrowed_table.heading("ID", text="Borrow ID")
     borrowed_table.heading("User", text="User Name")
     borrowed_table.heading("Email", text="Email")
@@ -814,24 +1773,12 @@ def admin_view_borrowed(book_id):
     borrowed_table.heading("Status", text="Status")
     borrowed_table.pack(fill="both", expand=True, padx=10, pady=10)
 
-    try:
-        db = db_connection()
-        cur = db.cursor()
-        cur.execute("""
-            SELECT br.borrow_id, u.full_name, u.email, br.borrow_date, br.due_date,
-                   CASE WHEN br.return_date IS NULL THEN 'Borrowed' ELSE 'Returned' END as status
-            FROM borrowed br
-            JOIN users u ON br.user_id = u.user_id
-            WHERE br.book_id = %s
-            ORDER BY br.borrow_date DESC
-        """, (book_id,))
-        
-        for row in cur.fetchall():
-            borrowed_table.insert("", "end", values=row)
-    except Exception as e:
-        messagebox.showerror("DB Error", str(e))
-    finally:
-        db.close()
+    state = screens.saved_state()
+    if state:
+        borrowed_table.restore(state)
+    else:
+        borrowed_table.load()
+    screens.keep(borrowed_table.load, borrowed_table.snapshot)
 
     # Navigation buttons
     nav_frame = tk.Frame(container, bg='white')
@@ -840,18 +1787,15 @@ def admin_view_borrowed(book_id):
 
 # ADMIN VIEW ALL BORROWED BOOKS
 def admin_all_borrowed():
-    for widget in window.winfo_children():
-        widget.destroy()
-    
-    set_background_image(window)
-    
     container = tk.Frame(window, bg='white', relief='raised', bd=2)
     container.pack(fill='both', expand=True, padx=10, pady=10)
 
     tk.Label(container, text="All Borrowed Books", font=("Arial", 16, "bold"), bg='white').pack(pady=10)
 
     # Create treeview for all borrowed books
-    borrowed_table = ttk.Treeview(container, columns=("ID", "Book", "User", "Email", "Borrow_Date", "Due_Date", "Status"), show="headings", height=15)
+    borrowed_table = VirtualTable(container, ("ID", "Book", "User", "Email", "Borrow_Date", "Due_Date", "Status"),
+                                  fetch=store.borrowings_page, count=store.count_borrowings,
+                                  key=store.borrowing_key, height=15, run=run_db, selectmode="extended")
     borrowed_table.heading("ID", text="Borrow ID")
     borrowed_table.heading("Book", text="Book Title")
     borrowed_table.heading("User", text="User Name")
@@ -861,75 +1805,311 @@ def admin_all_borrowed():
     borrowed_table.heading("Status", text="Status")
     borrowed_table.pack(fill="both", expand=True, padx=10, pady=10)
 
-    def refresh_borrowed_table():
-        for item in borrowed_table.get_children():
-            borrowed_table.delete(item)
-        try:
-            db = db_connection()
-            cur = db.cursor()
-            cur.execute("""
-                SELECT br.borrow_id, b.title, u.full_name, u.email, br.borrow_date, br.due_date,
-                       CASE WHEN br.return_date IS NULL THEN 'Borrowed' ELSE 'Returned' END as status
-                FROM borrowed br
-                JOIN books b ON br.book_id = b.book_id
-                JOIN users u ON br.user_id = u.user_id
-                ORDER BY br.borrow_date DESC
-            """)
-            
-            for row in cur.fetchall():
-                borrowed_table.insert("", "end", values=row)
-        except Exception as e:
-            messagebox.showerror("DB Error", str(e))
-        finally:
-            db.close()
-
-    refresh_borrowed_table()
+    state = screens.saved_state()
+    if state:
+        borrowed_table.restore(state)
+    else:
+        borrowed_table.refresh()
 
     # Action buttons
     button_frame = tk.Frame(container, bg='white')
     button_frame.pack(pady=10)
 
     def return_book():
-        selected = borrowed_table.selection()
-        if not selected:
+        # Shift and Control select several loans, returned together in one transaction
+        rows = borrowed_table.selected_rows()
+        if not rows:
             messagebox.showerror("Error", "Please select a borrowed book")
             return
-        
-        borrow_id = borrowed_table.item(selected)["values"][0]
-        status = borrowed_table.item(selected)["values"][6]
-        
-        if status == "Returned":
+
+        loans = {row[0]: row for row in rows if row[6] != "Returned"}
+        if not loans:
             messagebox.showinfo("Info", "Book is already returned")
             return
-        
-        if messagebox.askyesno("Confirm Return", "Mark this book as returned?"):
-            try:
-                db = db_connection()
-                cur = db.cursor()
-                # Update return date and increment available copies
-                cur.execute("UPDATE borrowed SET return_date = CURDATE() WHERE borrow_id = %s", (borrow_id,))
-                cur.execute("""
-                    UPDATE books SET available_copies = available_copies + 1 
-                    WHERE book_id = (SELECT book_id FROM borrowed WHERE borrow_id = %s)
-                """, (borrow_id,))
-                db.commit()
-                messagebox.showinfo("Success", "Book returned successfully")
-                refresh_borrowed_table()
-            except Exception as e:
-                messagebox.showerror("DB Error", str(e))
-            finally:
-                db.close()
-
-    tk.Button(button_frame, text="Mark as Returned", command=return_book, bg='lightgreen').pack(side="left", padx=5)
+
+        def returned(results):
+            show_batch_results(results, {borrow_id: row[1] for borrow_id, row in loans.items()}, "returned")
+            # A return leaves a loan's place in the list alone, so only its status changes
+            borrowed_table.patch([loans[borrow_id][:6] + ("Returned",) for borrow_id, _, error in results
+                                  if not error])
+
+        if confirm_batch("Confirm Return", "mark as returned", [row[1] for row in loans.values()]):
+            # Update return dates and put the copies back
+            run_db(store.return_books, list(loans), on_done=returned, widget=return_button)
+
+    return_button = tk.Button(button_frame, text="Mark as Returned", command=return_book, bg='lightgreen')
+    return_button.pack(side="left", padx=5)
+    tk.Button(button_frame, text="Back to Dashboard", command=lambda: navigate_to(admin_dashboard), bg='lightgray').pack(side="left", padx=5)
+
+    screens.keep(borrowed_table.refresh, borrowed_table.snapshot)
+
+# ADMIN SCAN DESK
+# Check copies out and in by the barcode on them; a scanner types the barcode
+# and presses Return, so the barcode field keeps the focus between scans
+SCAN_HISTORY = 50
+
+def admin_scan_desk():
+    container = tk.Frame(window, bg='white', relief='raised', bd=2)
+    container.pack(fill='both', expand=True, padx=10, pady=10)
+
+    tk.Label(container, text="Scan Desk", font=("Arial", 16, "bold"), bg='white').pack(pady=10)
+
+    form = tk.Frame(container, bg='white')
+    form.pack(pady=5)
+    tk.Label(form, text="Reader (email or ID):", bg='white').grid(row=0, column=0, sticky="e", padx=5, pady=5)
+    reader_entry = tk.Entry(form, width=30)
+    reader_entry.grid(row=0, column=1, padx=5, pady=5)
+    tk.Label(form, text="Barcode:", bg='white').grid(row=1, column=0, sticky="e", padx=5, pady=5)
+    barcode_entry = tk.Entry(form, width=30)
+    barcode_entry.grid(row=1, column=1, padx=5, pady=5)
+
+    mode = tk.StringVar(value="out")
+    modes = tk.Frame(container, bg='white')
+    modes.pack()
+    tk.Radiobutton(modes, text="Check Out", variable=mode, value="out", bg='white').pack(side="left", padx=5)
+    tk.Radiobutton(modes, text="Check In", variable=mode, value="in", bg='white').pack(side="left", padx=5)
+
+    status_label = tk.Label(container, text="Scan a barcode", font=("Arial", 12), bg='white')
+    status_label.pack(pady=5)
+
+    scans_table = ttk.Treeview(container, columns=("Time", "Barcode", "Action", "Result"), show="headings", height=12)
+    for column, width in (("Time", 80), ("Barcode", 120), ("Action", 90), ("Result", 360)):
+        scans_table.heading(column, text=column)
+        scans_table.column(column, width=width)
+    scans_table.pack(fill="both", expand=True, padx=10, pady=10)
+
+    # With "Queue scans" on, a reader's pile is scanned first and checked out
+    # or in with one button press, in one transaction
+    queued = []  # (barcode, table item) scanned but not yet committed
+    queue_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(modes, text="Queue scans", variable=queue_var, bg='white').pack(side="left", padx=15)
+
+    def now():
+        return datetime.now().strftime("%H:%M:%S")
+
+    def ready_for_next(result, ok):
+        status_label.config(text=result, fg='darkgreen' if ok else 'red')
+        keep = {item for _, item in queued}
+        for item in [item for item in scans_table.get_children() if item not in keep][SCAN_HISTORY:]:
+            scans_table.delete(item)
+        barcode_entry.delete(0, tk.END)
+        barcode_entry.focus_set()
+
+    def record(barcode, action, result, ok):
+        scans_table.insert("", 0, values=(now(), barcode, action, result))
+        ready_for_next(result, ok)
+
+    def describe(action, value, error):
+        if error:
+            return error
+        return f"Book {value[0]} lent, due {value[1]}" if action == "out" else f"Returned, loan {value} closed"
+
+    def reader_given():
+        if reader_entry.get().strip():
+            return True
+        messagebox.showerror("Error", "Enter the reader's email or ID before checking out")
+        reader_entry.focus_set()
+        return False
+
+    def scan(action=None):
+        barcode = barcode_entry.get().strip()
+        action = action or mode.get()
+        if not barcode or not session_alive():
+            return
+        if queue_var.get():
+            queued.append((barcode, scans_table.insert("", 0, values=(now(), barcode, "Queued", ""))))
+            ready_for_next(f"{len(queued)} scans queued", True)
+            return
+        name = "Check Out" if action == "out" else "Check In"
+        if action == "out":
+            if not reader_given():
+                return
+            query, args = check_out, (store, reader_entry.get().strip(), barcode)
+        else:
+            query, args = check_in, (store, barcode)
+        run_db(query, *args, widget=scans_table,
+               on_done=lambda value: record(barcode, name, describe(action, value, None), True),
+               on_error=lambda error: record(barcode, name, str(error), False))
+
+    def commit_queue(action):
+        if not queued:
+            return scan(action)
+        if not session_alive() or (action == "out" and not reader_given()):
+            return
+        # Taken off the queue at once, so a second press cannot send it twice
+        batch = list(queued)
+        queued.clear()
+        name = "Check Out" if action == "out" else "Check In"
+
+        def committed(results):
+            # The queued rows get their results in place, in one pass
+            for (_, item), (_, value, error) in zip(batch, results):
+                scans_table.item(item, values=(now(), scans_table.set(item, "Barcode"), name,
+                                               describe(action, value, error)))
+            failed = sum(1 for _, _, error in results if error)
+            ready_for_next(f"{len(results) - failed} of {len(results)} scans done", not failed)
+
+        def failed(error):
+            # Nothing was committed; the scans wait in the queue again
+            queued[:0] = batch
+            show_db_error(error)
+
+        barcodes = [barcode for barcode, _ in batch]
+        if action == "out":
+            run_db(check_out_batch, store, reader_entry.get().strip(), barcodes, on_done=committed, on_error=failed,
+                   widget=scans_table)
+        else:
+            run_db(check_in_batch, store, barcodes, on_done=committed, on_error=failed, widget=scans_table)
+
+    def clear_queue():
+        for _, item in queued:
+            scans_table.delete(item)
+        queued.clear()
+        ready_for_next("Queue cleared", True)
+
+    barcode_entry.bind("<Return>", lambda event: scan())
+
+    button_frame = tk.Frame(container, bg='white')
+    button_frame.pack(pady=10)
+    tk.Button(button_frame, text="Check Out", command=lambda: commit_queue("out"), bg='lightgreen').pack(side="left", padx=5)
+    tk.Button(button_frame, text="Check In", command=lambda: commit_queue("in"), bg='lightyellow').pack(side="left", padx=5)
+    tk.Button(button_frame, text="Clear Queue", command=clear_queue, bg='lightcoral').pack(side="left", padx=5)
     tk.Button(button_frame, text="Back to Dashboard", command=lambda: navigate_to(admin_dashboard), bg='lightgray').pack(side="left", padx=5)
 
+    reader_entry.focus_set()
+
+# ADMIN ANALYTICS
+# Read from the circulation summary tables kept by every borrow and return,
+# so opening the screen never aggregates the loan history itself
+ANALYTICS_DAYS = 30
+ANALYTICS_TOP = 15
+
+def admin_analytics():
+    container = tk.Frame(window, bg='white', relief='raised', bd=2)
+    container.pack(fill='both', expand=True, padx=10, pady=10)
+
+    tk.Label(container, text="Library Analytics", font=("Arial", 16, "bold"), bg='white').pack(pady=10)
+
+    notebook = ttk.Notebook(container)
+    notebook.pack(fill="both", expand=True, padx=10, pady=10)
+    tabs = LazyTabs(notebook)
+
+    overview_frame = ttk.Frame(notebook)
+    notebook.add(overview_frame, text="Overview")
+    popular_frame = ttk.Frame(notebook)
+    notebook.add(popular_frame, text="Most Borrowed")
+    categories_frame = ttk.Frame(notebook)
+    notebook.add(categories_frame, text="Categories")
+    borrowers_frame = ttk.Frame(notebook)
+    notebook.add(borrowers_frame, text="Active Borrowers")
+
+    # OVERVIEW: stock, utilization and daily loan volume
+    summary_label = tk.Label(overview_frame, text="Loading...", font=("Arial", 12), justify="left")
+    summary_label.pack(pady=10)
+    tk.Label(overview_frame, text=f"Loans per day, last {ANALYTICS_DAYS} days", font=("Arial", 11, "bold")).pack()
+    chart = tk.Canvas(overview_frame, height=220, bg='white', highlightthickness=0)
+    chart.pack(fill="both", expand=True, padx=10, pady=5)
+    volume = []  # (day, loans, returns) for every day shown, quiet days included
+
+    def draw_chart(event=None):
+        chart.delete("all")
+        if not volume:
+            return
+        width, height = chart.winfo_width(), chart.winfo_height()
+        most = max(max(loans for _, loans, _ in volume), 1)
+        slot = (width - 50) / len(volume)
+        for index, (day, loans, returns) in enumerate(volume):
+            x = 40 + index * slot
+            bar = (height - 40) * loans / most
+            chart.create_rectangle(x + 1, height - 20 - bar, x + slot - 1, height - 20, fill='steelblue', outline='')
+            if index % 5 == 0 or index == len(volume) - 1:
+                chart.create_text(x + slot / 2, height - 8, text=day.strftime("%d %b"), font=("Arial", 7))
+        chart.create_line(38, height - 20, width - 10, height - 20)
+        chart.create_text(4, 12, text=f"{most} loans", anchor="w", font=("Arial", 8))
+
+    chart.bind("<Configure>", draw_chart)
+
+    def overview():
+        # Worker thread: a few small summary queries
+        since = date.today() - timedelta(days=ANALYTICS_DAYS - 1)
+        return store.category_circulation(), store.count_active_borrowers(), store.daily_circulation(since), since
+
+    def show_overview(results):
+        categories, active, days, since = results
+        titles = sum(row[1] for row in categories)
+        copies = sum(row[2] for row in categories)
+        on_loan = sum(row[3] for row in categories)
+        by_day = {str(day)[:10]: (loans, returns) for day, loans, returns in days}
+        volume[:] = [(day, *by_day.get(day.isoformat(), (0, 0)))
+                     for day in (since + timedelta(days=n) for n in range(ANALYTICS_DAYS))]
+        utilization = f"{on_loan / copies:.0%}" if copies else "-"
+        summary_label.config(text=(
+            f"Titles: {titles:,}    Copies: {copies:,}    On loan: {on_loan:,} ({utilization} utilization)\n"
+            f"Active borrowers: {active:,}    Loans in the last {ANALYTICS_DAYS} days: "
+            f"{sum(day[1] for day in volume):,}    Returns: {sum(day[2] for day in volume):,}"))
+        draw_chart()
+
+    def load_overview():
+        run_db(overview, on_done=show_overview, widget=summary_label)
+
+    tabs.on_first_show(overview_frame, load_overview)
+
+    def report_table(parent, columns, headings):
+        table = ttk.Treeview(parent, columns=columns, show="headings", height=15)
+        for column, text in zip(columns, headings):
+            table.heading(column, text=text)
+        table.pack(fill="both", expand=True, padx=5, pady=5)
+        return table
+
+    # MOST BORROWED TITLES
+    popular_binding = TableBinding(report_table(popular_frame, ("ID", "Title", "Author", "Loans"),
+                                                ("Book ID", "Title", "Author", "Times Borrowed")))
+
+    def load_popular():
+        run_db(store.most_borrowed, ANALYTICS_TOP, on_done=popular_binding.sync, widget=popular_binding.tree)
+
+    tabs.on_first_show(popular_frame, load_popular)
+
+    # CIRCULATION AND UTILIZATION PER CATEGORY
+    def show_category(row):
+        name, titles, copies, on_loan, loans = row
+        return name, titles, copies, on_loan, f"{on_loan / copies:.0%}" if copies else "-", loans
+
+    categories_binding = TableBinding(
+        report_table(categories_frame, ("Category", "Titles", "Copies", "On_Loan", "Utilization", "Loans"),
+                     ("Category", "Titles", "Copies", "On Loan", "Utilization", "Times Borrowed")),
+        format_row=show_category)
+
+    def load_categories():
+        run_db(store.category_circulation, on_done=categories_binding.sync, widget=categories_binding.tree)
+
+    tabs.on_first_show(categories_frame, load_categories)
+
+    # ACTIVE BORROWERS
+    borrowers_binding = TableBinding(
+        report_table(borrowers_frame, ("ID", "Full_Name", "Email", "Open", "Loans", "Last"),
+                     ("User ID", "Full Name", "Email", "Books Out", "Times Borrowed", "Last Borrowed")))
+
+    def load_borrowers():
+        run_db(store.active_borrowers, ANALYTICS_TOP, on_done=borrowers_binding.sync, widget=borrowers_binding.tree)
+
+    tabs.on_first_show(borrowers_frame, load_borrowers)
+    tabs.load_current()
+
+    nav_frame = tk.Frame(container, bg='white')
+    nav_frame.pack(pady=10)
+    tk.Button(nav_frame, text="Back to Dashboard", command=lambda: navigate_to(admin_dashboard), bg='lightgray').pack()
+
+    def refresh_analytics():
+        for frame, load in ((overview_frame, load_overview), (popular_frame, load_popular),
+                            (categories_frame, load_categories), (borrowers_frame, load_borrowers)):
+            if tabs.loaded(frame):
+                load()
+
+    screens.keep(refresh_analytics)
+
 # ADMIN VIEW USER BORROWED BOOKS
 def admin_user_borrowed():
-    for widget in window.winfo_children():
-        widget.destroy()
-    
-    set_background_image(window)
-    
     container = tk.Frame(window, bg='white', relief='raised', bd=2)
     container.pack(fill='both', expand=True, padx=10, pady=10)
 
@@ -941,23 +2121,24 @@ def admin_user_borrowed():
 
     tk.Label(selection_frame, text="Select User:", bg='white').pack(side="left", padx=5)
     
-    # Get all users
-    try:
-        db = db_connection()
-        cur = db.cursor()
-        cur.execute("SELECT user_id, full_name, email FROM users WHERE role='user'")
-        users = cur.fetchall()
-        user_options = [f"{user[1]} ({user[2]})" for user in users]
-        db.close()
-    except Exception as e:
-        messagebox.showerror("DB Error", str(e))
-        users = []
-        user_options = []
-
     selected_user_var = tk.StringVar()
-    user_combo = ttk.Combobox(selection_frame, textvariable=selected_user_var, values=user_options, width=40)
+    user_combo = ttk.Combobox(selection_frame, textvariable=selected_user_var, values=[], width=40)
     user_combo.pack(side="left", padx=5)
 
+    # Get all users
+    users = []
+
+    def show_users(rows):
+        users[:] = rows
+        user_combo.config(values=[f"{user[1]} ({user[2]})" for user in users])
+
+    state = screens.saved_state()
+    if state:
+        show_users(state["users"])
+        selected_user_var.set(state["selected"])
+    else:
+        run_db(store.list_users, on_done=show_users, widget=user_combo)
+
     # Create treeview for user borrowed books
     borrowed_table = ttk.Treeview(container, columns=("ID", "Book", "Author", "Borrow_Date", "Due_Date", "Status"), show="headings", height=12)
     borrowed_table.heading("ID", text="Borrow ID")
@@ -967,6 +2148,9 @@ def admin_user_borrowed():
     borrowed_table.heading("Due_Date", text="Due Date")
     borrowed_table.heading("Status", text="Status")
     borrowed_table.pack(fill="both", expand=True, padx=10, pady=10)
+    borrowed_binding = TableBinding(borrowed_table)
+    if state:
+        borrowed_binding.restore(state["books"])
 
     def load_user_books():
         selected_user = selected_user_var.get()
@@ -985,62 +2169,52 @@ def admin_user_borrowed():
             messagebox.showerror("Error", "Invalid user selection")
             return
 
-        # Clear existing data
-        for item in borrowed_table.get_children():
-            borrowed_table.delete(item)
+        # Switching users replaces the rows; reloading the same user only touches changes
+        run_db(store.user_borrowings, user_id, on_done=borrowed_binding.sync, widget=load_button)
 
-        try:
-            db = db_connection()
-            cur = db.cursor()
-            cur.execute("""
-                SELECT br.borrow_id, b.title, b.author, br.borrow_date, br.due_date,
-                       CASE WHEN br.return_date IS NULL THEN 'Borrowed' ELSE 'Returned' END as status
-                FROM borrowed br
-                JOIN books b ON br.book_id = b.book_id
-                WHERE br.user_id = %s
-                ORDER BY br.borrow_date DESC
-            """, (user_id,))
-            
-            for row in cur.fetchall():
-                borrowed_table.insert("", "end", values=row)
-        except Exception as e:
-            messagebox.showerror("DB Error", str(e))
-        finally:
-            db.close()
-
-    tk.Button(selection_frame, text="Load Books", command=load_user_books, bg='lightblue').pack(side="left", padx=5)
+    load_button = tk.Button(selection_frame, text="Load Books", command=load_user_books, bg='lightblue')
+    load_button.pack(side="left", padx=5)
 
     # Navigation buttons
     nav_frame = tk.Frame(container, bg='white')
     nav_frame.pack(pady=10)
     tk.Button(nav_frame, text="Back to Dashboard", command=lambda: navigate_to(admin_dashboard), bg='lightgray').pack()
 
+    def refresh_user_borrowed():
+        run_db(store.list_users, on_done=show_users, widget=user_combo)
+        if selected_user_var.get():
+            load_user_books()
+
+    def save_user_borrowed():
+        return {"users": list(users), "selected": selected_user_var.get(), "books": borrowed_binding.snapshot()}
+
+    screens.keep(refresh_user_borrowed, save_user_borrowed)
+
 # USER DASHBOARD - FIXED TO ONLY SHOW AVAILABLE BOOKS FOR BORROWING
 def user_dashboard(user_id):
-    for widget in window.winfo_children():
-        widget.destroy()
-    
-    set_background_image(window)
-    
     container = tk.Frame(window, bg='white', relief='raised', bd=2)
     container.pack(fill='both', expand=True, padx=10, pady=10)
 
-    # Get user info
-    try:
-        db = db_connection()
-        cur = db.cursor()
-        cur.execute("SELECT full_name FROM users WHERE user_id=%s", (user_id,))
-        user_name = cur.fetchone()[0]
-        db.close()
-    except Exception as e:
-        messagebox.showerror("DB Error", str(e))
-        user_name = "User"
+    welcome_label = tk.Label(container, text="Welcome", font=("Arial", 16, "bold"), bg='white')
+    welcome_label.pack(pady=10)
+
+    # Coming back through history: show what was on screen instead of querying
+    state = screens.saved_state()
 
-    tk.Label(container, text=f"Welcome {user_name}", font=("Arial", 16, "bold"), bg='white').pack(pady=10)
+    # Get user info; the login already looked it up
+    user = sessions.get(current_session)
+    if state:
+        welcome_label.config(text=state["welcome"])
+    elif user and user[0] == user_id:
+        welcome_label.config(text=f"Welcome {user[2]}")
+    else:
+        run_db(store.user_name, user_id, widget=welcome_label,
+               on_done=lambda user_name: welcome_label.config(text=f"Welcome {user_name or 'User'}"))
 
     # Create notebook for tabs
     notebook = ttk.Notebook(container)
     notebook.pack(fill="both", expand=True, padx=10, pady=10)
+    tabs = LazyTabs(notebook)
 
     # Available Books tab
     books_frame = ttk.Frame(notebook)
@@ -1050,6 +2224,10 @@ def user_dashboard(user_id):
     my_books_frame = ttk.Frame(notebook)
     notebook.add(my_books_frame, text="My Borrowed Books")
 
+    # Holds tab
+    holds_frame = ttk.Frame(notebook)
+    notebook.add(holds_frame, text="Holds")
+
     # AVAILABLE BOOKS TAB - USERS ONLY SEE BOOKS WITH COPIES AVAILABLE
     tk.Label(books_frame, text="Available Books", font=("Arial", 14, "bold")).pack(pady=5)
     
@@ -1058,14 +2236,48 @@ def user_dashboard(user_id):
     search_frame.pack(pady=5)
     
     tk.Label(search_frame, text="Search:").pack(side="left", padx=5)
-    search_entry = tk.Entry(search_frame, width=30)
+    search_text = tk.StringVar()
+    search_entry = tk.Entry(search_frame, width=30, textvariable=search_text)
     search_entry.pack(side="left", padx=5)
     
-    search_by_var = tk.StringVar(value="Title")
-    search_combo = ttk.Combobox(search_frame, textvariable=search_by_var, values=["Title", "Author", "Category"], width=10)
+    # "All" searches title, author and category at once through the full-text index
+    search_by_var = tk.StringVar(value="All")
+    search_combo = ttk.Combobox(search_frame, textvariable=search_by_var, values=["All", "Title", "Author", "Category"], width=10)
     search_combo.pack(side="left", padx=5)
 
-    available_books_table = ttk.Treeview(books_frame, columns=("ID", "Title", "Author", "Category", "Available"), show="headings", height=12)
+    current_search = {"term": "", "by": "All"}
+    if state:
+        # Set before the search trace is added, so restoring does not search again
+        search_text.set(state["typed"])
+        search_by_var.set(state["search"]["by"])
+        current_search.update(state["search"])
+
+    def fetch_available(after, limit, skip):
+        if current_search["term"]:
+            # Ranked search results are paged by position; after is a row offset here
+            return store.search_books(current_search["term"], current_search["by"], limit, (after or 0) + skip)
+        return store.available_books_page(after, limit, skip)
+
+    def count_available():
+        if current_search["term"]:
+            return store.count_search(current_search["term"], current_search["by"])
+        return store.count_available_books()
+
+    def available_changes(since):
+        # Changed books come back in the admin row shape; drop the total copies column
+        rows, since = store.books_changed_since(since)
+        return [row[:4] + row[5:] for row in rows], since
+
+    def still_listed(row):
+        if row[4] <= 0:
+            return False
+        return search_matches(current_search["term"], row[1], row[2], row[3], current_search["by"])
+
+    available_books_table = VirtualTable(books_frame, ("ID", "Title", "Author", "Category", "Available"),
+                                         fetch=fetch_available, count=count_available,
+                                         key=store.available_book_key, height=12,
+                                         changes=available_changes, include=still_listed, run=run_db,
+                                         selectmode="extended")
     available_books_table.heading("ID", text="Book ID")
     available_books_table.heading("Title", text="Title")
     available_books_table.heading("Author", text="Author")
@@ -1073,113 +2285,97 @@ def user_dashboard(user_id):
     available_books_table.heading("Available", text="Available Copies")
     available_books_table.pack(fill="both", expand=True, padx=5, pady=5)
 
-    def refresh_available_books(search_term="", search_by="Title"):
-        for item in available_books_table.get_children():
-            available_books_table.delete(item)
-        try:
-            db = db_connection()
-            cur = db.cursor()
-            
-            # Users only see books with available copies > 0
-            if search_term:
-                if search_by == "Title":
-                    cur.execute("""
-                        SELECT b.book_id, b.title, b.author, c.category_name, b.available_copies
-                        FROM books b
-                        JOIN categories c ON b.category_id = c.category_id
-                        WHERE b.available_copies > 0 AND b.title LIKE %s
-                        ORDER BY b.title
-                    """, (f"%{search_term}%",))
-                elif search_by == "Author":
-                    cur.execute("""
-                        SELECT b.book_id, b.title, b.author, c.category_name, b.available_copies
-                        FROM books b
-                        JOIN categories c ON b.category_id = c.category_id
-                        WHERE b.available_copies > 0 AND b.author LIKE %s
-                        ORDER BY b.title
-                    """, (f"%{search_term}%",))
-                else:  # Category
-                    cur.execute("""
-                        SELECT b.book_id, b.title, b.author, c.category_name, b.available_copies
-                        FROM books b
-                        JOIN categories c ON b.category_id = c.category_id
-                        WHERE b.available_copies > 0 AND c.category_name LIKE %s
-                        ORDER BY b.title
-                    """, (f"%{search_term}%",))
-            else:
-                cur.execute("""
-                    SELECT b.book_id, b.title, b.author, c.category_name, b.available_copies
-                    FROM books b
-                    JOIN categories c ON b.category_id = c.category_id
-                    WHERE b.available_copies > 0
-                    ORDER BY b.title
-                """)
-            
-            for row in cur.fetchall():
-                available_books_table.insert("", "end", values=row)
-        except Exception as e:
-            messagebox.showerror("DB Error", str(e))
-        finally:
-            db.close()
+    def refresh_available_books(search_term="", search_by="All"):
+        new_search = (search_term, search_by) != (current_search["term"], current_search["by"])
+        current_search.update(term=search_term, by=search_by)
+        available_books_table.key = None if search_term else store.available_book_key
+        # Users only see books with available copies > 0
+        available_books_table.refresh(reset=new_search)
+
+    # SEARCH AS YOU TYPE: queries run on a worker, only the newest search is shown
+    search_status = tk.Label(search_frame, text="", width=14, anchor="w")
+    running_search = {"task": None}
+
+    def run_search(search_term, search_by):
+        # Worker thread: no widget access, the table's fetch/count read current_search
+        # only after show_search_results has switched it on the Tk thread
+        count = store.count_search(search_term, search_by) if search_term else store.count_available_books()
+        if search_term:
+            rows = store.search_books(search_term, search_by, available_books_table.page_size)
+        else:
+            rows = store.available_books_page(limit=available_books_table.page_size)
+        return count, rows, available_changes(None)[1]
+
+    def show_search_results(search_term, search_by, results):
+        running_search["task"] = None
+        current_search.update(term=search_term, by=search_by)
+        available_books_table.key = None if search_term else store.available_book_key
+        available_books_table.show_first_page(*results)
+        search_status.config(text=f"{results[0]} found" if search_term else "")
+
+    def search_failed(error):
+        running_search["task"] = None
+        search_status.config(text="")
+        messagebox.showerror("DB Error", str(error))
 
     def search_books():
         search_term = search_entry.get().strip()
         search_by = search_by_var.get()
-        refresh_available_books(search_term, search_by)
-
-    tk.Button(search_frame, text="Search", command=search_books, bg='lightblue').pack(side="left", padx=5)
-    tk.Button(search_frame, text="Show All", command=lambda: refresh_available_books(), bg='lightgray').pack(side="left", padx=5)
-
-    refresh_available_books()
+        if running_search["task"]:
+            # A newer search makes the one in flight stale
+            running_search["task"].cancel()
+        search_status.config(text="Searching...")
+        running_search["task"] = run_db(
+            run_search, search_term, search_by, widget=search_status,
+            on_done=lambda results: show_search_results(search_term, search_by, results),
+            on_error=search_failed)
+
+    def show_all():
+        search_entry.delete(0, "end")
+        search_debounce.flush()
+
+    search_debounce = Debouncer(window, SEARCH_DEBOUNCE_MS, search_books)
+    # Every edit of the text restarts the debounce window
+    search_text.trace_add("write", search_debounce.trigger)
+    search_combo.bind("<<ComboboxSelected>>", search_debounce.flush)
+    search_entry.bind("<Return>", search_debounce.flush)
+
+    tk.Button(search_frame, text="Search", command=search_debounce.flush, bg='lightblue').pack(side="left", padx=5)
+    tk.Button(search_frame, text="Show All", command=show_all, bg='lightgray').pack(side="left", padx=5)
+    search_status.pack(side="left", padx=5)
+
+    if state and state["available"]:
+        available_books_table.key = None if current_search["term"] else store.available_book_key
+        available_books_table.restore(state["available"])
+        tabs.mark_loaded(books_frame)
+    else:
+        tabs.on_first_show(books_frame, lambda: refresh_available_books(current_search["term"], current_search["by"]))
 
     # Book action buttons
     book_action_frame = tk.Frame(books_frame)
     book_action_frame.pack(pady=10)
 
     def borrow_book():
-        selected = available_books_table.selection()
-        if not selected:
+        # Shift and Control select several books, borrowed together in one transaction
+        rows = available_books_table.selected_rows()
+        if not rows:
             messagebox.showerror("Error", "Please select a book to borrow")
             return
-        
-        book_id = available_books_table.item(selected)["values"][0]
-        book_title = available_books_table.item(selected)["values"][1]
-        available_copies = available_books_table.item(selected)["values"][4]
-        
-        if available_copies <= 0:
-            messagebox.showerror("Error", "No copies available")
-            return
-        
-        if messagebox.askyesno("Confirm Borrow", f"Do you want to borrow '{book_title}'?"):
-            try:
-                db = db_connection()
-                cur = db.cursor()
-                
-                # Check if user already has this book
-                cur.execute("SELECT COUNT(*) FROM borrowed WHERE user_id=%s AND book_id=%s AND return_date IS NULL", (user_id, book_id))
-                if cur.fetchone()[0] > 0:
-                    messagebox.showerror("Error", "You already have this book borrowed")
-                    return
-                
-                # Borrow the book (due date is 14 days from now)
-                cur.execute("""
-                    INSERT INTO borrowed (user_id, book_id, borrow_date, due_date) 
-                    VALUES (%s, %s, CURDATE(), DATE_ADD(CURDATE(), INTERVAL 14 DAY))
-                """, (user_id, book_id))
-                
-                # Decrease available copies
-                cur.execute("UPDATE books SET available_copies = available_copies - 1 WHERE book_id = %s", (book_id,))
-                
-                db.commit()
-                messagebox.showinfo("Success", f"'{book_title}' borrowed successfully! Due date: 14 days from today.")
-                refresh_available_books()
+        titles = {row[0]: row[1] for row in rows}
+
+        def borrowed(results):
+            show_batch_results(results, titles, "borrowed")
+            # Only the borrowed books' rows change
+            available_books_table.refresh_changes()
+            if tabs.loaded(my_books_frame):
                 refresh_my_books()
-            except Exception as e:
-                messagebox.showerror("DB Error", str(e))
-            finally:
-                db.close()
 
-    tk.Button(book_action_frame, text="Borrow Book", command=borrow_book, bg='lightgreen').pack(side="left", padx=5)
+        if confirm_batch("Confirm Borrow", "borrow", list(titles.values())) and session_alive():
+            # Each book is due 14 days from now
+            run_db(store.borrow_books, user_id, list(titles), on_done=borrowed, widget=borrow_button)
+
+    borrow_button = tk.Button(book_action_frame, text="Borrow Book", command=borrow_book, bg='lightgreen')
+    borrow_button.pack(side="left", padx=5)
 
     # MY BORROWED BOOKS TAB
     tk.Label(my_books_frame, text="My Borrowed Books", font=("Arial", 14, "bold")).pack(pady=5)
@@ -1192,75 +2388,149 @@ def user_dashboard(user_id):
     my_books_table.heading("Due_Date", text="Due Date")
     my_books_table.heading("Status", text="Status")
     my_books_table.pack(fill="both", expand=True, padx=5, pady=5)
+    my_books_binding = TableBinding(my_books_table)
 
     def refresh_my_books():
-        for item in my_books_table.get_children():
-            my_books_table.delete(item)
-        try:
-            db = db_connection()
-            cur = db.cursor()
-            cur.execute("""
-                SELECT br.borrow_id, b.title, b.author, br.borrow_date, br.due_date,
-                       CASE 
-                           WHEN br.return_date IS NOT NULL THEN 'Returned'
-                           WHEN br.due_date < CURDATE() THEN 'Overdue'
-                           ELSE 'Borrowed'
-                       END as status
-                FROM borrowed br
-                JOIN books b ON br.book_id = b.book_id
-                WHERE br.user_id = %s
-                ORDER BY br.borrow_date DESC
-            """, (user_id,))
-            
-            for row in cur.fetchall():
-                my_books_table.insert("", "end", values=row)
-        except Exception as e:
-            messagebox.showerror("DB Error", str(e))
-        finally:
-            db.close()
+        run_db(store.user_borrowings, user_id, on_done=my_books_binding.sync, widget=my_books_table)
 
-    refresh_my_books()
+    if state and state["my_books"]:
+        my_books_binding.restore(state["my_books"])
+        tabs.mark_loaded(my_books_frame)
+    else:
+        tabs.on_first_show(my_books_frame, refresh_my_books)
 
     # My books action buttons
     my_books_action_frame = tk.Frame(my_books_frame)
     my_books_action_frame.pack(pady=10)
 
     def return_book():
+        # Shift and Control select several books, returned together in one transaction
         selected = my_books_table.selection()
         if not selected:
             messagebox.showerror("Error", "Please select a book to return")
             return
-        
-        borrow_id = my_books_table.item(selected)["values"][0]
-        book_title = my_books_table.item(selected)["values"][1]
-        status = my_books_table.item(selected)["values"][5]
-        
-        if status == "Returned":
+
+        loans = {row[0]: row for row in (tuple(my_books_table.item(iid)["values"]) for iid in selected)
+                 if row[5] != "Returned"}
+        if not loans:
             messagebox.showinfo("Info", "Book is already returned")
             return
-        
-        if messagebox.askyesno("Confirm Return", f"Do you want to return '{book_title}'?"):
-            try:
-                db = db_connection()
-                cur = db.cursor()
-                
-                # Update return date and increment available copies
-                cur.execute("UPDATE borrowed SET return_date = CURDATE() WHERE borrow_id = %s", (borrow_id,))
-                cur.execute("""
-                    UPDATE books SET available_copies = available_copies + 1 
-                    WHERE book_id = (SELECT book_id FROM borrowed WHERE borrow_id = %s)
-                """, (borrow_id,))
-                
-                db.commit()
-                messagebox.showinfo("Success", f"'{book_title}' returned successfully!")
+
+        def returned(results):
+            show_batch_results(results, {borrow_id: row[1] for borrow_id, row in loans.items()}, "returned")
+            # The returned rows are patched in place rather than queried again
+            my_books_binding.upsert([loans[borrow_id][:5] + ("Returned",) for borrow_id, _, error in results
+                                     if not error])
+            if tabs.loaded(books_frame):
+                available_books_table.refresh_changes()
+
+        if confirm_batch("Confirm Return", "return", [row[1] for row in loans.values()]) and session_alive():
+            # Update return dates and put the copies back; passing the reader refuses
+            # any loan that is not theirs, as POST /returns does (today=None)
+            run_db(store.return_books, list(loans), None, user_id, on_done=returned, widget=return_button)
+
+    return_button = tk.Button(my_books_action_frame, text="Return Book", command=return_book, bg='lightcoral')
+    return_button.pack(side="left", padx=5)
+
+    # HOLDS TAB: queue for books with no copies left, collect them when one is set aside
+    tk.Label(holds_frame, text="Books Out on Loan", font=("Arial", 14, "bold")).pack(pady=5)
+
+    hold_search_frame = tk.Frame(holds_frame)
+    hold_search_frame.pack(pady=5)
+    tk.Label(hold_search_frame, text="Search:").pack(side="left", padx=5)
+    hold_search_entry = tk.Entry(hold_search_frame, width=30)
+    hold_search_entry.pack(side="left", padx=5)
+
+    out_table = ttk.Treeview(holds_frame, columns=("ID", "Title", "Author", "Category"), show="headings", height=5)
+    out_table.heading("ID", text="Book ID")
+    out_table.heading("Title", text="Title")
+    out_table.heading("Author", text="Author")
+    out_table.heading("Category", text="Category")
+    out_table.pack(fill="both", expand=True, padx=5, pady=5)
+    out_binding = TableBinding(out_table, format_row=lambda row: row[:4])
+
+    def search_out_books():
+        term = hold_search_entry.get().strip()
+        if term:
+            run_db(store.search_books, term, "All", 50, 0, False, on_done=out_binding.sync, widget=out_table)
+
+    tk.Button(hold_search_frame, text="Search", command=search_out_books).pack(side="left", padx=5)
+    hold_search_entry.bind("<Return>", lambda event: search_out_books())
+
+    def place_hold():
+        selected = out_table.selection()
+        if not selected:
+            messagebox.showerror("Error", "Please select a book to hold")
+            return
+        book_id, book_title = out_table.item(selected)["values"][:2]
+
+        def placed(result):
+            messagebox.showinfo("Success", f"'{book_title}' is on hold for you. You are number {result[1]} in line.")
+            refresh_holds()
+
+        if session_alive():
+            run_db(store.place_hold, user_id, book_id, on_done=placed, widget=place_hold_button)
+
+    place_hold_button = tk.Button(holds_frame, text="Place Hold", command=place_hold, bg='lightyellow')
+    place_hold_button.pack(pady=5)
+
+    tk.Label(holds_frame, text="My Holds", font=("Arial", 14, "bold")).pack(pady=5)
+    holds_table = ttk.Treeview(holds_frame, columns=("ID", "Book", "Title", "Author", "Status", "Place", "Until"),
+                               show="headings", height=5)
+    for column, heading in zip(holds_table["columns"], ("Hold ID", "Book ID", "Title", "Author", "Status",
+                                                         "Place in Line", "Collect By")):
+        holds_table.heading(column, text=heading)
+    holds_table.pack(fill="both", expand=True, padx=5, pady=5)
+    # Blank place for a ready hold, blank date for a waiting one
+    holds_binding = TableBinding(holds_table, format_row=lambda row: tuple("" if v is None else v for v in row))
+
+    def refresh_holds():
+        run_db(store.user_holds, user_id, on_done=holds_binding.sync, widget=holds_table)
+
+    if state and state["holds"]:
+        holds_binding.restore(state["holds"])
+        tabs.mark_loaded(holds_frame)
+    else:
+        tabs.on_first_show(holds_frame, refresh_holds)
+
+    holds_action_frame = tk.Frame(holds_frame)
+    holds_action_frame.pack(pady=5)
+
+    def selected_hold():
+        selected = holds_table.selection()
+        if not selected:
+            messagebox.showerror("Error", "Please select a hold")
+            return None
+        return holds_table.item(selected)["values"]
+
+    def collect_hold():
+        hold = selected_hold()
+        if hold is None:
+            return
+        if hold[4] != "ready":
+            messagebox.showinfo("Info", "No copy has come back for this hold yet")
+            return
+
+        def collected(due_date):
+            messagebox.showinfo("Success", f"'{hold[2]}' borrowed successfully! Due date: {due_date}")
+            refresh_holds()
+            if tabs.loaded(my_books_frame):
                 refresh_my_books()
-                refresh_available_books()
-            except Exception as e:
-                messagebox.showerror("DB Error", str(e))
-            finally:
-                db.close()
 
-    tk.Button(my_books_action_frame, text="Return Book", command=return_book, bg='lightcoral').pack(side="left", padx=5)
+        if session_alive():
+            run_db(store.borrow_book, user_id, hold[1], on_done=collected, widget=collect_button)
+
+    def cancel_hold():
+        hold = selected_hold()
+        if hold is None:
+            return
+        if messagebox.askyesno("Confirm Cancel", f"Cancel your hold on '{hold[2]}'?") and session_alive():
+            run_db(store.cancel_hold, hold[0], user_id, on_done=lambda _: refresh_holds(), widget=cancel_hold_button)
+
+    collect_button = tk.Button(holds_action_frame, text="Borrow Held Copy", command=collect_hold, bg='lightgreen')
+    collect_button.pack(side="left", padx=5)
+    cancel_hold_button = tk.Button(holds_action_frame, text="Cancel Hold", command=cancel_hold, bg='lightcoral')
+    cancel_hold_button.pack(side="left", padx=5)
 
     # Navigation and logout buttons
     nav_frame = tk.Frame(container, bg='white')
@@ -1268,12 +2538,35 @@ def user_dashboard(user_id):
     
     def logout():
         if messagebox.askyesno("Confirm Logout", "Are you sure you want to logout?"):
-            navigate_to(show_main_menu)
+            end_session()
     
     tk.Button(nav_frame, text="Logout", command=logout, bg='lightgray').pack()
 
+    if state:
+        notebook.select(state["tab"])
+    tabs.load_current()
+
+    def refresh_user_dashboard():
+        if tabs.loaded(books_frame):
+            available_books_table.refresh_changes()
+        if tabs.loaded(my_books_frame):
+            refresh_my_books()
+        if tabs.loaded(holds_frame):
+            refresh_holds()
+
+    def save_user_dashboard():
+        return {"welcome": welcome_label.cget("text"), "typed": search_text.get(), "search": dict(current_search),
+                "available": available_books_table.snapshot() if tabs.loaded(books_frame) else None,
+                "my_books": my_books_binding.snapshot() if tabs.loaded(my_books_frame) else None,
+                "holds": holds_binding.snapshot() if tabs.loaded(holds_frame) else None,
+                "tab": notebook.index("current")}
+
+    screens.keep(refresh_user_dashboard, save_user_dashboard)
+
 # MAIN APPLICATION
-if __name__ == "__main__":
+def start():
+    """Create the window and show the main menu; mainloop() is left to the caller"""
+    global window, tasks, screens
     window = tk.Tk()
     window.title("Library Management System")
     window.geometry("1000x700")
@@ -1281,9 +2574,17 @@ if __name__ == "__main__":
     
     # Bind window resize event
     window.bind("<Configure>", on_window_resize)
+
+    # Worker threads for queries, results delivered back on the Tk thread
+    tasks = TaskRunner(window, on_busy=show_busy)
+    screens = ScreenManager(window)
     
     # Start with main menu
-    show_main_menu()
-    
+    screens.show(Route(show_main_menu))
+    return window
+
+if __name__ == "__main__":
     # Start the application
-    window.mainloop()
+    start().mainloop()
+    tasks.shutdown()
+    store.close()
@@ -0,0 +1,211 @@
+"""Connection pooling for the library database.
+
+Every screen in teaklib opens a connection, runs a few statements and closes
+it again.  ConnectionPool keeps those connections alive between clicks so a
+tab refresh no longer pays a TCP + authentication handshake.  Callers keep
+the same open/close pattern: close() on a pooled connection hands it back.
+"""
+import threading
+import time
+from collections import deque
+
+
+class PoolError(Exception):
+    """Raised when the pool cannot hand out a connection."""
+
+
+class PoolTimeout(PoolError):
+    """Raised when every connection stays checked out for too long."""
+
+
+def default_ping(conn):
+    """Cheap liveness probe that works for any DB-API connection"""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1")
+        cur.fetchall()
+    finally:
+        cur.close()
+
+
+# POOLED CONNECTION PROXY
+class PooledConnection:
+    """Wraps a raw connection; close() returns it to the pool instead of dropping it"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    @property
+    def raw(self):
+        if self._conn is None:
+            raise PoolError("Connection already returned to the pool")
+        return self._conn
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool._release(conn)
+
+    def discard(self):
+        """Close the underlying connection for good, e.g. after a network error"""
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool._discard(conn)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # A handler that forgot close() must not leak a pool slot
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+# CONNECTION POOL
+class ConnectionPool:
+    """Bounded pool of database connections.
+
+    connect      -- zero-argument factory returning a new DB-API connection
+    size         -- maximum number of open connections
+    idle_timeout -- seconds an unused connection may sit idle before eviction
+    check_after  -- connections idle longer than this are pinged on checkout
+    timeout      -- seconds to wait for a free connection before PoolTimeout
+    retries      -- extra connect attempts when the server refuses a connection
+    """
+
+    def __init__(self, connect, size=5, idle_timeout=300.0, check_after=5.0,
+                 timeout=10.0, retries=1, retry_delay=0.2, ping=default_ping):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self._connect = connect
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._ping = ping
+        self._idle = deque()  # (connection, returned_at); newest on the right
+        self._open = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.stats = {"created": 0, "reused": 0, "evicted": 0, "failed_checks": 0, "discarded": 0}
+
+    def connect(self):
+        """Check out a connection, reusing a healthy idle one when possible"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn, idle_for = self._checkout(deadline)
+            if conn is None:
+                # A free slot was reserved for a brand new connection
+                return PooledConnection(self, self._new_connection())
+            if idle_for < self.check_after or self._healthy(conn):
+                self.stats["reused"] += 1
+                return PooledConnection(self, conn)
+            # Dead connection (server restart, wait_timeout, ...): drop it and retry
+            self.stats["failed_checks"] += 1
+            self._discard(conn)
+
+    def _checkout(self, deadline):
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("Connection pool is closed")
+                self._evict_idle()
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    return conn, time.monotonic() - returned_at
+                if self._open < self.size:
+                    self._open += 1
+                    return None, 0.0
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No free database connection after {self.timeout}s")
+                self._cond.wait(remaining)
+
+    def _evict_idle(self):
+        # Oldest connections sit on the left; called with the lock held
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._open -= 1
+            self.stats["evicted"] += 1
+            self._close_quietly(conn)
+
+    def _new_connection(self):
+        attempt = 0
+        while True:
+            try:
+                conn = self._connect()
+                self.stats["created"] += 1
+                return conn
+            except Exception:
+                if attempt >= self.retries:
+                    self._free_slot()
+                    raise
+                attempt += 1
+                time.sleep(self.retry_delay * attempt)
+
+    def _healthy(self, conn):
+        try:
+            self._ping(conn)
+            return True
+        except Exception:
+            return False
+
+    def _release(self, conn):
+        try:
+            # Never hand the next caller a half-finished transaction
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            if self._closed:
+                self._open -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn):
+        self.stats["discarded"] += 1
+        self._close_quietly(conn)
+        self._free_slot()
+
+    def _free_slot(self):
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """Close idle connections and refuse new checkouts"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._open -= 1
+                self._close_quietly(conn)
+            self._cond.notify_all()
+
+    def __len__(self):
+        """Number of connections currently open (idle or checked out)"""
+        return self._open
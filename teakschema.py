@@ -0,0 +1,543 @@
+"""Schema bootstrap and versioned upgrades for the library database.
+
+Every change to the tables is a numbered migration.  migrate() records each
+one it applies in schema_version and skips those already recorded, so a new
+database is created from scratch and an old one is brought up to date by the
+same call.  Every step is idempotent, so databases created by hand before
+migrations existed are upgraded safely too.  MySQL commits DDL implicitly, so
+there a step that fails halfway is finished by simply running migrate() again.
+
+SQLite files are migrated when SQLiteStore opens them.  For MySQL run
+
+    python teakschema.py            # LIBRARY_DB_* settings, see teakstore.open_store
+"""
+
+SCHEMA_VERSION_TABLE = """CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)"""
+
+
+# INTROSPECTION
+def _columns(cur, dialect, table):
+    if dialect == "sqlite":
+        return [row[1] for row in cur.execute(f"PRAGMA table_info({table})").fetchall()]
+    return [row[0] for row in cur.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s",
+        (table,)).fetchall()]
+
+
+def _index_columns(cur, dialect, table):
+    """Column tuples of every index on table, primary key included"""
+    if dialect == "sqlite":
+        indexes = [row[1] for row in cur.execute(f"PRAGMA index_list({table})").fetchall()]
+        return [tuple(row[2] for row in cur.execute(f"PRAGMA index_info({name})").fetchall()) for name in indexes]
+    indexes = {}
+    for name, column in cur.execute("""
+        SELECT index_name, column_name FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s ORDER BY index_name, seq_in_index
+    """, (table,)).fetchall():
+        indexes.setdefault(name, []).append(column)
+    return [tuple(columns) for columns in indexes.values()]
+
+
+def _ensure_index(cur, dialect, table, name, columns):
+    # An existing index that starts with the same columns already serves the lookup
+    if any(existing[:len(columns)] == columns for existing in _index_columns(cur, dialect, table)):
+        return
+    cur.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+
+
+# MIGRATIONS
+MYSQL_TABLES = [
+    """CREATE TABLE IF NOT EXISTS users (
+        user_id INT AUTO_INCREMENT PRIMARY KEY,
+        full_name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) NOT NULL UNIQUE,
+        password VARCHAR(255) NOT NULL,
+        role VARCHAR(20) NOT NULL DEFAULT 'user'
+    ) ENGINE=InnoDB""",
+    """CREATE TABLE IF NOT EXISTS categories (
+        category_id INT AUTO_INCREMENT PRIMARY KEY,
+        category_name VARCHAR(255) NOT NULL UNIQUE
+    ) ENGINE=InnoDB""",
+    """CREATE TABLE IF NOT EXISTS books (
+        book_id INT AUTO_INCREMENT PRIMARY KEY,
+        title VARCHAR(255) NOT NULL,
+        author VARCHAR(255) NOT NULL,
+        category_id INT NOT NULL,
+        total_copies INT NOT NULL DEFAULT 1,
+        available_copies INT NOT NULL DEFAULT 1,
+        updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+        FOREIGN KEY (category_id) REFERENCES categories (category_id)
+    ) ENGINE=InnoDB""",
+    # No foreign keys: loan history stays when a user or book is deleted
+    """CREATE TABLE IF NOT EXISTS borrowed (
+        borrow_id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        book_id INT NOT NULL,
+        borrow_date DATE NOT NULL,
+        due_date DATE NOT NULL,
+        return_date DATE NULL
+    ) ENGINE=InnoDB""",
+]
+
+SQLITE_TABLES = [
+    """CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        full_name TEXT NOT NULL,
+        email TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL DEFAULT 'user'
+    )""",
+    """CREATE TABLE IF NOT EXISTS categories (
+        category_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category_name TEXT NOT NULL UNIQUE
+    )""",
+    """CREATE TABLE IF NOT EXISTS books (
+        book_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        author TEXT NOT NULL,
+        category_id INTEGER NOT NULL REFERENCES categories(category_id),
+        total_copies INTEGER NOT NULL DEFAULT 1,
+        available_copies INTEGER NOT NULL DEFAULT 1,
+        updated_at TIMESTAMP NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+    )""",
+    """CREATE TABLE IF NOT EXISTS borrowed (
+        borrow_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users(user_id),
+        book_id INTEGER NOT NULL REFERENCES books(book_id),
+        borrow_date DATE NOT NULL,
+        due_date DATE NOT NULL,
+        return_date DATE
+    )""",
+]
+
+
+def _create_tables(cur, dialect):
+    for statement in SQLITE_TABLES if dialect == "sqlite" else MYSQL_TABLES:
+        cur.execute(statement)
+
+
+def _add_updated_at(cur, dialect, table):
+    # Tables created before the table tracked changes lack the column
+    if "updated_at" not in _columns(cur, dialect, table):
+        if dialect == "sqlite":
+            # SQLite only adds columns with a constant default
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN updated_at TIMESTAMP NOT NULL "
+                        "DEFAULT '1970-01-01 00:00:00.000'")
+        else:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN updated_at TIMESTAMP(6) NOT NULL "
+                        "DEFAULT CURRENT_TIMESTAMP(6)")
+    _ensure_index(cur, dialect, table, f"idx_{table}_updated_at", ("updated_at",))
+
+
+def _books_updated_at(cur, dialect):
+    _add_updated_at(cur, dialect, "books")
+
+
+# book_search mirrors books with the category name folded in, because a MySQL
+# FULLTEXT index cannot span the books/categories join
+MYSQL_SEARCH_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS book_search (
+        book_id INT PRIMARY KEY,
+        title VARCHAR(255) NOT NULL,
+        author VARCHAR(255) NOT NULL,
+        category_name VARCHAR(255) NOT NULL,
+        FULLTEXT KEY ft_book_search (title, author, category_name),
+        FULLTEXT KEY ft_book_search_title (title),
+        FULLTEXT KEY ft_book_search_author (author),
+        FULLTEXT KEY ft_book_search_category (category_name)
+    ) ENGINE=InnoDB""",
+    "DROP TRIGGER IF EXISTS books_search_insert",
+    """CREATE TRIGGER books_search_insert AFTER INSERT ON books FOR EACH ROW
+        REPLACE INTO book_search (book_id, title, author, category_name)
+        SELECT NEW.book_id, NEW.title, NEW.author, category_name FROM categories
+        WHERE category_id = NEW.category_id""",
+    "DROP TRIGGER IF EXISTS books_search_update",
+    """CREATE TRIGGER books_search_update AFTER UPDATE ON books FOR EACH ROW
+    BEGIN
+        IF NEW.title <> OLD.title OR NEW.author <> OLD.author OR NEW.category_id <> OLD.category_id THEN
+            REPLACE INTO book_search (book_id, title, author, category_name)
+            SELECT NEW.book_id, NEW.title, NEW.author, category_name FROM categories
+            WHERE category_id = NEW.category_id;
+        END IF;
+    END""",
+    "DROP TRIGGER IF EXISTS books_search_delete",
+    """CREATE TRIGGER books_search_delete AFTER DELETE ON books FOR EACH ROW
+        DELETE FROM book_search WHERE book_id = OLD.book_id""",
+    """REPLACE INTO book_search (book_id, title, author, category_name)
+        SELECT b.book_id, b.title, b.author, c.category_name
+        FROM books b JOIN categories c ON b.category_id = c.category_id""",
+]
+
+SQLITE_SEARCH_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(title, author, category_name, prefix='2 3')",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts (rowid, title, author, category_name)
+        SELECT new.book_id, new.title, new.author, category_name FROM categories WHERE category_id = new.category_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author, category_id ON books BEGIN
+        DELETE FROM books_fts WHERE rowid = old.book_id;
+        INSERT INTO books_fts (rowid, title, author, category_name)
+        SELECT new.book_id, new.title, new.author, category_name FROM categories WHERE category_id = new.category_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+        DELETE FROM books_fts WHERE rowid = old.book_id;
+    END""",
+]
+
+# Refills books_fts from books, e.g. for a file whose books predate the index
+SQLITE_SEARCH_REBUILD = [
+    "DELETE FROM books_fts",
+    """INSERT INTO books_fts (rowid, title, author, category_name)
+        SELECT b.book_id, b.title, b.author, c.category_name
+        FROM books b JOIN categories c ON b.category_id = c.category_id""",
+]
+
+
+def _search_index(cur, dialect):
+    statements = SQLITE_SEARCH_SCHEMA + SQLITE_SEARCH_REBUILD if dialect == "sqlite" else MYSQL_SEARCH_SCHEMA
+    for statement in statements:
+        cur.execute(statement)
+
+
+# (table, index name, columns) for the lookups the application runs on every click
+HOT_INDEXES = [
+    ("users", "idx_users_login", ("email", "password")),             # authenticate
+    ("categories", "idx_categories_name", ("category_name",)),       # category lookup on add/edit
+    ("books", "idx_books_title", ("title",)),                        # duplicate titles, available books in title order
+    ("borrowed", "idx_borrowed_user", ("user_id", "return_date")),   # a user's loans, open-loan checks
+    ("borrowed", "idx_borrowed_book", ("book_id", "return_date")),   # a book's loans, open-loan checks
+    ("borrowed", "idx_borrowed_date", ("borrow_date", "borrow_id")), # all loans, newest first
+]
+
+
+def _hot_indexes(cur, dialect):
+    for table, name, columns in HOT_INDEXES:
+        _ensure_index(cur, dialect, table, name, columns)
+
+
+def _export_change_tracking(cur, dialect):
+    # Incremental exports pick rows by updated_at, like books already are
+    _add_updated_at(cur, dialect, "users")
+    _add_updated_at(cur, dialect, "borrowed")
+
+
+# Amounts are in cents.  One row per fined loan, rewritten by every assessment
+# until the loan is returned; fine_runs logs each pass and the policy it used
+FINES_TABLES = {
+    "mysql": [
+        """CREATE TABLE IF NOT EXISTS fines (
+            borrow_id INT PRIMARY KEY,
+            user_id INT NOT NULL,
+            days_late INT NOT NULL,
+            amount INT NOT NULL,
+            assessed_on DATE NOT NULL,
+            KEY idx_fines_user (user_id)
+        ) ENGINE=InnoDB""",
+        """CREATE TABLE IF NOT EXISTS fine_runs (
+            assessed_on DATE PRIMARY KEY,
+            grace_days INT NOT NULL,
+            daily_rate INT NOT NULL,
+            cap INT NOT NULL,
+            loans INT NOT NULL,
+            total INT NOT NULL,
+            finished_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB""",
+    ],
+    "sqlite": [
+        """CREATE TABLE IF NOT EXISTS fines (
+            borrow_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            days_late INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            assessed_on DATE NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_fines_user ON fines (user_id)",
+        """CREATE TABLE IF NOT EXISTS fine_runs (
+            assessed_on DATE PRIMARY KEY,
+            grace_days INTEGER NOT NULL,
+            daily_rate INTEGER NOT NULL,
+            cap INTEGER NOT NULL,
+            loans INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            finished_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )""",
+    ],
+}
+
+
+def _fines(cur, dialect):
+    # Open overdue loans are (NULL, due_date < today), loans returned since the
+    # last pass a return_date range: both walk this index instead of the table
+    _ensure_index(cur, dialect, "borrowed", "idx_borrowed_overdue", ("return_date", "due_date"))
+    for statement in FINES_TABLES[dialect]:
+        cur.execute(statement)
+
+
+# Running totals behind the analytics screen, kept by LibraryStore.borrow_book()
+# and return_book() so the screen never has to aggregate the loan history
+CIRCULATION_TABLES = {
+    "mysql": [
+        "CREATE TABLE IF NOT EXISTS book_circulation (book_id INT PRIMARY KEY, loans INT NOT NULL) ENGINE=InnoDB",
+        """CREATE TABLE IF NOT EXISTS user_activity (
+            user_id INT PRIMARY KEY,
+            loans INT NOT NULL,
+            open_loans INT NOT NULL,
+            last_borrowed DATE NULL
+        ) ENGINE=InnoDB""",
+        """CREATE TABLE IF NOT EXISTS daily_circulation (
+            day DATE PRIMARY KEY,
+            loans INT NOT NULL,
+            returns INT NOT NULL
+        ) ENGINE=InnoDB""",
+    ],
+    "sqlite": [
+        "CREATE TABLE IF NOT EXISTS book_circulation (book_id INTEGER PRIMARY KEY, loans INTEGER NOT NULL)",
+        """CREATE TABLE IF NOT EXISTS user_activity (
+            user_id INTEGER PRIMARY KEY,
+            loans INTEGER NOT NULL,
+            open_loans INTEGER NOT NULL,
+            last_borrowed DATE
+        )""",
+        """CREATE TABLE IF NOT EXISTS daily_circulation (
+            day DATE PRIMARY KEY,
+            loans INTEGER NOT NULL,
+            returns INTEGER NOT NULL
+        )""",
+    ],
+}
+
+# Recomputes the running totals from borrowed; the one full pass over the history
+CIRCULATION_REBUILD = [
+    "DELETE FROM book_circulation",
+    "INSERT INTO book_circulation (book_id, loans) SELECT book_id, COUNT(*) FROM borrowed GROUP BY book_id",
+    "DELETE FROM user_activity",
+    """INSERT INTO user_activity (user_id, loans, open_loans, last_borrowed)
+        SELECT user_id, COUNT(*), SUM(CASE WHEN return_date IS NULL THEN 1 ELSE 0 END), MAX(borrow_date)
+        FROM borrowed GROUP BY user_id""",
+    "DELETE FROM daily_circulation",
+    """INSERT INTO daily_circulation (day, loans, returns)
+        SELECT day, SUM(loans), SUM(returns) FROM (
+            SELECT borrow_date AS day, 1 AS loans, 0 AS returns FROM borrowed
+            UNION ALL
+            SELECT return_date, 0, 1 FROM borrowed WHERE return_date IS NOT NULL
+        ) events GROUP BY day""",
+]
+
+
+def _circulation_statistics(cur, dialect):
+    for statement in CIRCULATION_TABLES[dialect] + CIRCULATION_REBUILD:
+        cur.execute(statement)
+    # Top lists read these in order and stop at LIMIT
+    _ensure_index(cur, dialect, "book_circulation", "idx_book_circulation_loans", ("loans", "book_id"))
+    _ensure_index(cur, dialect, "user_activity", "idx_user_activity_open", ("open_loans", "loans", "user_id"))
+
+
+# Holds queue up per title in seq order.  hold_queues hands out the seq
+# numbers; hold_tree is a Fenwick tree over them counting the waiting holds,
+# kept by LibraryStore so a place in the queue is a sum over a few rows
+HOLDS_TABLES = {
+    "mysql": [
+        """CREATE TABLE IF NOT EXISTS holds (
+            hold_id INT AUTO_INCREMENT PRIMARY KEY,
+            book_id INT NOT NULL,
+            user_id INT NOT NULL,
+            seq INT NOT NULL,
+            status VARCHAR(10) NOT NULL DEFAULT 'waiting',
+            placed_on DATE NOT NULL,
+            ready_until DATE NULL,
+            updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+            KEY idx_holds_queue (book_id, status, seq),
+            KEY idx_holds_user (user_id, status),
+            KEY idx_holds_ready (status, ready_until)
+        ) ENGINE=InnoDB""",
+        "CREATE TABLE IF NOT EXISTS hold_queues (book_id INT PRIMARY KEY, placed INT NOT NULL) ENGINE=InnoDB",
+        """CREATE TABLE IF NOT EXISTS hold_tree (
+            book_id INT NOT NULL,
+            node INT NOT NULL,
+            waiting INT NOT NULL,
+            PRIMARY KEY (book_id, node)
+        ) ENGINE=InnoDB""",
+    ],
+    "sqlite": [
+        """CREATE TABLE IF NOT EXISTS holds (
+            hold_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'waiting',
+            placed_on DATE NOT NULL,
+            ready_until DATE,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_holds_queue ON holds (book_id, status, seq)",
+        "CREATE INDEX IF NOT EXISTS idx_holds_user ON holds (user_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_holds_ready ON holds (status, ready_until)",
+        "CREATE TABLE IF NOT EXISTS hold_queues (book_id INTEGER PRIMARY KEY, placed INTEGER NOT NULL)",
+        """CREATE TABLE IF NOT EXISTS hold_tree (
+            book_id INTEGER NOT NULL,
+            node INTEGER NOT NULL,
+            waiting INTEGER NOT NULL,
+            PRIMARY KEY (book_id, node)
+        ) WITHOUT ROWID""",
+    ],
+}
+
+
+def _holds(cur, dialect):
+    for statement in HOLDS_TABLES[dialect]:
+        cur.execute(statement)
+
+
+# One row per physical copy.  books.total_copies and available_copies stay as
+# aggregates of it (copies not withdrawn, copies available), kept by
+# LibraryStore in the same transactions that change a copy's status
+COPIES_TABLES = {
+    "mysql": [
+        """CREATE TABLE IF NOT EXISTS copies (
+            copy_id INT AUTO_INCREMENT PRIMARY KEY,
+            barcode VARCHAR(64) NOT NULL UNIQUE,
+            book_id INT NOT NULL,
+            status VARCHAR(10) NOT NULL DEFAULT 'available',
+            location VARCHAR(255) NULL,
+            updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+            KEY idx_copies_book (book_id, status)
+        ) ENGINE=InnoDB""",
+    ],
+    "sqlite": [
+        """CREATE TABLE IF NOT EXISTS copies (
+            copy_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            barcode TEXT NOT NULL UNIQUE,
+            book_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'available',
+            location TEXT,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_copies_book ON copies (book_id, status)",
+    ],
+}
+
+
+def copy_barcode(book_id, number):
+    """Barcode printed on the number-th copy of a book, unless the library supplies its own"""
+    return f"{book_id:07d}-{number:03d}"
+
+
+def _copies(cur, dialect):
+    for statement in COPIES_TABLES[dialect]:
+        cur.execute(statement)
+    for table in ("borrowed", "holds"):
+        if "copy_id" not in _columns(cur, dialect, table):
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN copy_id {'INTEGER' if dialect == 'sqlite' else 'INT NULL'}")
+    _ensure_index(cur, dialect, "borrowed", "idx_borrowed_copy", ("copy_id", "return_date"))
+    if cur.execute("SELECT COUNT(*) FROM copies").fetchone()[0]:
+        return  # Backfilled by an earlier, interrupted run
+    # Copies for the counters: first the ones out on loan, then those set
+    # aside for ready holds, then the shelf.  Ids are assigned here, the
+    # table being empty, so loans and holds can point at theirs directly.
+    loans, holds = {}, {}
+    for borrow_id, book_id in cur.execute(
+            "SELECT borrow_id, book_id FROM borrowed WHERE return_date IS NULL ORDER BY borrow_id").fetchall():
+        loans.setdefault(book_id, []).append(borrow_id)
+    for hold_id, book_id in cur.execute(
+            "SELECT hold_id, book_id FROM holds WHERE status = 'ready' ORDER BY hold_id").fetchall():
+        holds.setdefault(book_id, []).append(hold_id)
+    copies, loan_copies, hold_copies = [], [], []
+    for book_id, total in cur.execute("SELECT book_id, total_copies FROM books ORDER BY book_id").fetchall():
+        out, held = loans.get(book_id, []), holds.get(book_id, [])
+        for number in range(1, max(total, len(out) + len(held)) + 1):
+            copy_id = len(copies) + 1
+            if number <= len(out):
+                status = "on_loan"
+                loan_copies.append((copy_id, out[number - 1]))
+            elif number <= len(out) + len(held):
+                status = "held"
+                hold_copies.append((copy_id, held[number - len(out) - 1]))
+            else:
+                status = "available"
+            copies.append((copy_id, copy_barcode(book_id, number), book_id, status))
+    for start in range(0, len(copies), 5000):
+        cur.executemany("INSERT INTO copies (copy_id, barcode, book_id, status) VALUES (%s, %s, %s, %s)",
+                        copies[start:start + 5000])
+    cur.executemany("UPDATE borrowed SET copy_id = %s WHERE borrow_id = %s", loan_copies)
+    cur.executemany("UPDATE holds SET copy_id = %s WHERE hold_id = %s", hold_copies)
+    # From here on the counters are aggregates of the copies, so every book is
+    # recounted from them, which also mends counters that had drifted
+    cur.execute("""UPDATE books SET
+        total_copies = (SELECT COUNT(*) FROM copies WHERE copies.book_id = books.book_id),
+        available_copies = (SELECT COUNT(*) FROM copies WHERE copies.book_id = books.book_id AND status = 'available')""")
+
+
+def _drop_login_index(cur, dialect):
+    # Since scrypt, login reads the user by email alone and checks the hash in
+    # Python, so the (email, password) index of migration 4 serves nothing
+    if dialect == "sqlite":
+        cur.execute("DROP INDEX IF EXISTS idx_users_login")
+    elif cur.execute("SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() "
+                     "AND table_name = %s AND index_name = %s", ("users", "idx_users_login")).fetchone():
+        cur.execute("DROP INDEX idx_users_login ON users")
+
+
+# (version, description, step); append new steps, never edit applied ones
+MIGRATIONS = [
+    (1, "users, categories, books and borrowed tables", _create_tables),
+    (2, "books.updated_at change tracking", _books_updated_at),
+    (3, "catalog full-text search index", _search_index),
+    (4, "indexes for login, loan lookups and paging", _hot_indexes),
+    (5, "users.updated_at and borrowed.updated_at for incremental exports", _export_change_tracking),
+    (6, "fines, fine_runs and the overdue loans index", _fines),
+    (7, "circulation summary tables for analytics", _circulation_statistics),
+    (8, "holds, hold_queues and hold_tree for reservations", _holds),
+    (9, "copies with barcodes, and the copy on each loan and hold", _copies),
+    (10, "drop the (email, password) login index", _drop_login_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# MIGRATION RUNNER
+def current_version(store):
+    """Highest migration applied to the store's database, 0 for a new one"""
+    with store.transaction() as cur:
+        cur.execute(SCHEMA_VERSION_TABLE)
+        return cur.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+
+
+def migrate(store, target=LATEST_VERSION):
+    """Apply every migration up to target that has not run yet; returns their versions"""
+    if current_version(store) >= target:
+        return []
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version > target:
+            break
+        with store.transaction() as cur:
+            if store.dialect == "sqlite":
+                # Take the write lock first, so two processes opening a new file
+                # cannot both apply the same step
+                cur.execute("BEGIN IMMEDIATE")
+            cur.execute("SELECT COUNT(*) FROM schema_version WHERE version = %s", (version,))
+            if cur.fetchone()[0]:
+                continue
+            step(cur, store.dialect)
+            cur.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                        (version, description))
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    from teakstore import open_store
+
+    library = open_store()
+    try:
+        versions = migrate(library)
+        for version, description, _ in MIGRATIONS:
+            if version in versions:
+                print(f"applied {version}: {description}")
+        print(f"schema at version {current_version(library)}")
+    finally:
+        library.close()
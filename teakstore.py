@@ -0,0 +1,1418 @@
+"""Data access for the library: every SQL statement the application runs.
+
+LibraryStore holds the queries; MySQLStore and SQLiteStore only differ in how
+they connect and in the placeholder style.  Dates are computed in Python and
+passed as parameters, so no MySQL-only date functions are needed and the
+whole application can run against an embedded SQLite file.
+"""
+import itertools
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from teakpool import ConnectionPool, default_ping
+from teakschema import CIRCULATION_REBUILD, MYSQL_SEARCH_SCHEMA, SQLITE_SEARCH_REBUILD, copy_barcode, migrate
+
+LOAN_DAYS = 14
+PAGE_SIZE = 200
+# Rows per fetchmany() when a report is streamed
+STREAM_BATCH = 500
+# Values per IN (...) list, well below SQLite's limit on bound parameters
+IN_LIST_SIZE = 500
+# Days a copy set aside for a hold waits to be collected
+HOLD_PICKUP_DAYS = 3
+# Queue numbers one title can hand out; hold_tree has log2 of this many levels
+HOLD_QUEUE_LIMIT = 2 ** 30
+# Ready holds expired per transaction
+HOLD_EXPIRY_BATCH = 500
+# Items one desk batch (borrow_books, return_copies, ...) may hold
+BATCH_LIMIT = 100
+
+# Status of a loan as the screens show it; the parameter is today's date
+LOAN_STATUS_SQL = """CASE
+    WHEN br.return_date IS NOT NULL THEN 'Returned'
+    WHEN br.due_date < %s THEN 'Overdue'
+    ELSE 'Borrowed'
+END"""
+
+# Changed-since queries re-read this much history so rows committed by a transaction
+# that started before the previous watermark are not missed
+CHANGE_OVERLAP = timedelta(seconds=2)
+
+# Store dates as ISO text in SQLite (the implicit adapters are deprecated)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+
+
+class LibraryError(Exception):
+    """A request that breaks a library rule (duplicate title, book still on loan, ...)"""
+
+
+class NotFound(LibraryError):
+    """The book, user or loan a request names does not exist"""
+
+
+class NotYours(LibraryError):
+    """The loan a request names belongs to another reader"""
+
+
+# SEARCH TOKENS
+SEARCH_FIELDS = {"Title": 0, "Author": 1, "Category": 2}
+# Search filter on stock: books that can be borrowed, or only held
+IN_STOCK_SQL = {True: "b.available_copies > 0", False: "b.available_copies = 0"}
+
+
+def search_tokens(text):
+    """Lower-cased words of a search entry; every word must match for a hit"""
+    return re.findall(r"\w+", text.lower())
+
+
+def search_matches(query, title, author, category, field="All"):
+    """Python mirror of the full-text match, for checking a single changed row"""
+    texts = (title, author, category)
+    if field in SEARCH_FIELDS:
+        texts = (texts[SEARCH_FIELDS[field]],)
+    words = [word for text in texts for word in search_tokens(str(text))]
+    return all(any(word.startswith(token) for word in words) for token in search_tokens(query))
+
+
+# CURSOR WRAPPER
+class _Cursor:
+    """Translates the %s placeholders used in this module to the backend's style"""
+
+    def __init__(self, cur, translate, log=None):
+        self._cur = cur
+        self._translate = translate
+        self._log = log
+        self.wrote = False  # whether anything but a SELECT ran
+
+    def execute(self, sql, params=()):
+        sql = self._translate(sql)
+        if self._log is not None:
+            self._log.append((sql, params))
+        self.wrote = self.wrote or not sql.lstrip()[:6].upper() == "SELECT"
+        self._cur.execute(sql, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self.wrote = True
+        self._cur.executemany(self._translate(sql), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def fetchmany(self, size):
+        return self._cur.fetchmany(size)
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    def close(self):
+        self._cur.close()
+
+
+# CATEGORY CACHE
+class CategoryCache:
+    """Process-wide category name <-> id map, loaded once.
+
+    Categories are only ever added, so a cached entry never goes stale; a name
+    the cache has not seen falls through to the database and is remembered
+    once its transaction commits.  version changes whenever the contents do,
+    so a screen can tell its category list is out of date.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._lock = threading.Lock()
+        self._ids = None   # name -> id, None until loaded
+        self._names = {}   # id -> name
+        self.version = 0
+
+    def _ensure(self, cur=None):
+        # Called with the lock held; cur reuses the caller's open transaction
+        if self._ids is not None:
+            return
+        sql = "SELECT category_id, category_name FROM categories ORDER BY category_id"
+        if cur is None:
+            rows = self._store._fetchall(sql)
+        else:
+            rows = cur.execute(sql).fetchall()
+        self._names = dict(rows)
+        self._ids = {name: category_id for category_id, name in rows}
+        self.version += 1
+
+    def names(self):
+        with self._lock:
+            self._ensure()
+            return list(self._ids)
+
+    def id_for(self, category_name, cur=None):
+        with self._lock:
+            self._ensure(cur)
+            return self._ids.get(category_name)
+
+    def name_for(self, category_id):
+        with self._lock:
+            self._ensure()
+            return self._names.get(category_id)
+
+    def remember(self, category_id, category_name):
+        """Record a category found or created by a committed transaction"""
+        with self._lock:
+            if self._ids is not None and self._ids.get(category_name) != category_id:
+                self._ids[category_name] = category_id
+                self._names[category_id] = category_name
+                self.version += 1
+
+    def invalidate(self):
+        """Drop everything; the next lookup reloads from the database"""
+        with self._lock:
+            self._ids = None
+            self._names = {}
+            self.version += 1
+
+
+# STORE INTERFACE
+class LibraryStore:
+    """Backend-neutral queries; subclasses provide _connect() and the placeholder style"""
+
+    dialect = "mysql"
+    placeholder = "%s"
+    # Current time with sub-second precision; written to updated_at columns
+    now_sql = "CURRENT_TIMESTAMP(6)"
+    # Insert-or-update tail for a row whose key exists; new_value names the value the INSERT carried
+    upsert_sql = "ON DUPLICATE KEY UPDATE {updates}"
+    new_value = "VALUES({column})"
+    # Appended to a SELECT to read rows as committed now and lock them until commit
+    lock_sql = " FOR UPDATE"
+    # Run first by transactions that read before they write; see _write_lock()
+    begin_write_sql = None
+
+    def __init__(self, pool_size=5, idle_timeout=300.0):
+        self.pool = ConnectionPool(self._connect, size=pool_size, idle_timeout=idle_timeout,
+                                   ping=self._ping)
+        self._translated = {}
+        # Set to a list to record every (sql, params) executed, e.g. to EXPLAIN them
+        self.statement_log = None
+        self.categories = CategoryCache(self)
+        # Bumped by every committed write from this process; screens compare it
+        # with the value they loaded at to know whether they may be stale
+        self._versions = itertools.count(1)
+        self.data_version = 0
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def _ping(self, conn):
+        default_ping(conn)
+
+    def _sql(self, sql):
+        translated = self._translated.get(sql)
+        if translated is None:
+            translated = sql.replace("{now}", self.now_sql)
+            if self.placeholder != "%s":
+                translated = translated.replace("%s", self.placeholder)
+            self._translated[sql] = translated
+        return translated
+
+    def connection(self):
+        """Pooled connection; close() returns it to the pool"""
+        return self.pool.connect()
+
+    @contextmanager
+    def transaction(self):
+        """Cursor whose statements are committed together, or rolled back on error"""
+        db = self.connection()
+        try:
+            cur = _Cursor(db.cursor(), self._sql, self.statement_log)
+            yield cur
+            db.commit()
+            if cur.wrote:
+                self.data_version = next(self._versions)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write_lock(self, cur):
+        """Make the transaction a writer from its first statement, for ones that read before they write"""
+        if self.begin_write_sql:
+            cur.execute(self.begin_write_sql)
+
+    def _fetchall(self, sql, params=()):
+        with self.transaction() as cur:
+            return cur.execute(sql, params).fetchall()
+
+    def _fetchone(self, sql, params=()):
+        with self.transaction() as cur:
+            return cur.execute(sql, params).fetchone()
+
+    def _stream(self, sql, params=(), batch_size=STREAM_BATCH):
+        """Yield the rows of a query in lists of at most batch_size.
+
+        The rows come through an unbuffered (server-side) cursor, so only one
+        batch is ever held in memory however large the result.  The cursor keeps
+        its own pooled connection until the generator is exhausted or closed.
+        """
+        db = self.connection()
+        finished = False
+        try:
+            cur = _Cursor(self._stream_cursor(db), self._sql, self.statement_log)
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+            finished = True
+        finally:
+            if finished:
+                db.rollback()  # Ends the read transaction
+                db.close()
+            else:
+                # Stopped early: the unread rest of the result would have to be
+                # drained before the connection could run anything else
+                db.discard()
+
+    def _stream_cursor(self, db):
+        return db.cursor()
+
+    def close(self):
+        self.pool.close_all()
+
+    # USERS
+    def login_record(self, email):
+        """(user_id, role, full_name, password hash) of the user with this email, else None"""
+        return self._fetchone("SELECT user_id, role, full_name, password FROM users WHERE email=%s", (email,))
+
+    def set_password_hash(self, user_id, old_hash, new_hash):
+        """Store a rehashed password, unless the password has been changed meanwhile"""
+        # Same password, so updated_at stays: exports do not carry it anyway
+        with self.transaction() as cur:
+            cur.execute("UPDATE users SET password=%s WHERE user_id=%s AND password=%s",
+                        (new_hash, user_id, old_hash))
+
+    def user_name(self, user_id):
+        row = self._fetchone("SELECT full_name FROM users WHERE user_id=%s", (user_id,))
+        return row[0] if row else None
+
+    def find_user(self, email):
+        """(user_id, full_name, role) of the user with this email, else None"""
+        return self._fetchone("SELECT user_id, full_name, role FROM users WHERE email=%s", (email,))
+
+    def list_users(self):
+        return self._fetchall("SELECT user_id, full_name, email, role FROM users WHERE role='user'")
+
+    def create_user(self, full_name, email, password_hash, role="user"):
+        with self.transaction() as cur:
+            cur.execute("SELECT email FROM users WHERE email=%s", (email,))
+            if cur.fetchone():
+                raise LibraryError("Email already exists")
+            cur.execute("INSERT INTO users (full_name, email, password, role, updated_at) "
+                        "VALUES (%s, %s, %s, %s, {now})",
+                        (full_name, email, password_hash, role))
+            return cur.lastrowid
+
+    def update_user(self, user_id, full_name, email, password_hash=None):
+        with self.transaction() as cur:
+            cur.execute("SELECT user_id FROM users WHERE email=%s AND user_id != %s", (email, user_id))
+            if cur.fetchone():
+                raise LibraryError("Email already exists")
+            if password_hash:
+                cur.execute("UPDATE users SET full_name=%s, email=%s, password=%s, updated_at={now} WHERE user_id=%s",
+                            (full_name, email, password_hash, user_id))
+            else:
+                cur.execute("UPDATE users SET full_name=%s, email=%s, updated_at={now} WHERE user_id=%s",
+                            (full_name, email, user_id))
+
+    def delete_user(self, user_id):
+        with self.transaction() as cur:
+            cur.execute("SELECT COUNT(*) FROM borrowed WHERE user_id=%s AND return_date IS NULL", (user_id,))
+            if cur.fetchone()[0] > 0:
+                raise LibraryError("Cannot delete user who has borrowed books")
+            cur.execute("SELECT COUNT(*) FROM holds WHERE user_id=%s AND status IN ('waiting', 'ready')", (user_id,))
+            if cur.fetchone()[0] > 0:
+                raise LibraryError("Cannot delete user who has books on hold")
+            cur.execute("DELETE FROM users WHERE user_id=%s", (user_id,))
+
+    # CATEGORIES
+    def category_names(self):
+        """Category names from the cache; only the first call reads the database"""
+        return self.categories.names()
+
+    def _category_id(self, cur, category_name):
+        """Look up a category inside an open transaction, creating it when missing.
+
+        Callers pass the id to categories.remember() after commit, so a
+        category created by a transaction that rolls back is never cached.
+        """
+        category_id = self.categories.id_for(category_name, cur)
+        if category_id is not None:
+            return category_id
+        # Not cached: new, or added by another client since the cache was loaded
+        cur.execute("SELECT category_id FROM categories WHERE category_name=%s", (category_name,))
+        category = cur.fetchone()
+        if category:
+            return category[0]
+        cur.execute("INSERT INTO categories (category_name) VALUES (%s)", (category_name,))
+        return cur.lastrowid
+
+    def _category_ids(self, cur, category_names):
+        """_category_id() for many names at once: one SELECT and one INSERT for all the unknown ones.
+
+        Returns {name: id}; remember() the result after commit as with _category_id().
+        """
+        ids, unknown = {}, []
+        for name in set(category_names):
+            category_id = self.categories.id_for(name, cur)
+            if category_id is None:
+                unknown.append(name)
+            else:
+                ids[name] = category_id
+        found = self._find_categories(cur, unknown)
+        missing = {name.lower(): name for name in unknown if name.lower() not in found}
+        if missing:
+            cur.executemany("INSERT INTO categories (category_name) VALUES (%s)",
+                            [(name,) for name in missing.values()])
+            found.update(self._find_categories(cur, missing.values()))
+        ids.update((name, found[name.lower()]) for name in unknown)
+        return ids
+
+    def _find_categories(self, cur, category_names):
+        # Keyed by lower-cased name: MySQL compares names case-insensitively
+        found = {}
+        for placeholders, part in _in_lists(category_names):
+            cur.execute(f"SELECT category_id, category_name FROM categories WHERE category_name IN ({placeholders})",
+                        part)
+            found.update((name.lower(), category_id) for category_id, name in cur.fetchall())
+        return found
+
+    # BOOKS
+    def books_page(self, after=None, limit=PAGE_SIZE, skip=0):
+        """Every book, including fully borrowed ones, in book_id order.
+
+        Keyset pagination: pass the key of the last row already shown as after,
+        see book_key().  skip jumps further pages ahead without a key.
+        """
+        sql = """
+            SELECT b.book_id, b.title, b.author, c.category_name, b.total_copies, b.available_copies
+            FROM books b
+            JOIN categories c ON b.category_id = c.category_id
+        """
+        params = ()
+        if after is not None:
+            sql += " WHERE b.book_id > %s"
+            params = tuple(after)
+        return self._fetchall(sql + " ORDER BY b.book_id LIMIT %s OFFSET %s", params + (limit, skip))
+
+    @staticmethod
+    def book_key(row):
+        return (row[0],)
+
+    def count_books(self):
+        return self._fetchone("SELECT COUNT(*) FROM books")[0]
+
+    def book(self, book_id):
+        """One book in books_page() row shape, or None"""
+        return self._fetchone("""
+            SELECT b.book_id, b.title, b.author, c.category_name, b.total_copies, b.available_copies
+            FROM books b
+            JOIN categories c ON b.category_id = c.category_id
+            WHERE b.book_id = %s
+        """, (book_id,))
+
+    def books_changed_since(self, since=None):
+        """Books updated at or after the watermark since, in books_page() row shape.
+
+        Returns (rows, watermark); pass the watermark back on the next call.
+        With since=None no rows are read and only the current watermark is
+        returned, which callers take before a full reload.
+        """
+        if since is None:
+            row = self._fetchone("SELECT MAX(updated_at) FROM books")
+            return [], _as_datetime(row[0]) if row and row[0] else datetime.min
+        rows = self._fetchall("""
+            SELECT b.book_id, b.title, b.author, c.category_name, b.total_copies, b.available_copies,
+                   b.updated_at
+            FROM books b
+            JOIN categories c ON b.category_id = c.category_id
+            WHERE b.updated_at >= %s
+            ORDER BY b.updated_at
+        """, (since - min(CHANGE_OVERLAP, since - datetime.min),))
+        if rows:
+            since = max(since, _as_datetime(rows[-1][6]))
+        return [row[:6] for row in rows], since
+
+    def available_books_page(self, after=None, limit=PAGE_SIZE, skip=0):
+        """Books with at least one copy on the shelf, in title order"""
+        where, params = "", ()
+        if after is not None:
+            # Row-value comparison, so the title index can seek straight to the key
+            where = "AND (b.title, b.book_id) > (%s, %s)"
+            params = tuple(after)
+        return self._fetchall(f"""
+            SELECT b.book_id, b.title, b.author, c.category_name, b.available_copies
+            FROM books b
+            JOIN categories c ON b.category_id = c.category_id
+            WHERE b.available_copies > 0 {where}
+            ORDER BY b.title, b.book_id LIMIT %s OFFSET %s
+        """, params + (limit, skip))
+
+    @staticmethod
+    def available_book_key(row):
+        return (row[1], row[0])
+
+    def count_available_books(self):
+        return self._fetchone("SELECT COUNT(*) FROM books WHERE available_copies > 0")[0]
+
+    # CATALOG SEARCH
+    def search_books(self, query, field="All", limit=PAGE_SIZE, offset=0, available=True):
+        """Available books matching every word of query, best matches first.
+
+        Each word also matches as a prefix ("tolk" finds "Tolkien").  Title
+        hits rank above author hits, which rank above category hits; field
+        ("Title", "Author" or "Category") restricts the match to one of them.
+        available=False searches the books with no copies left instead, to hold.
+        """
+        tokens = search_tokens(query)
+        return self._search(tokens, field, limit, offset, available) if tokens else []
+
+    def count_search(self, query, field="All", available=True):
+        tokens = search_tokens(query)
+        return self._count_search(tokens, field, available) if tokens else 0
+
+    def _search(self, tokens, field, limit, offset, available):
+        raise NotImplementedError
+
+    def _count_search(self, tokens, field, available):
+        raise NotImplementedError
+
+    def add_book(self, title, author, category_name, total_copies):
+        with self.transaction() as cur:
+            cur.execute("SELECT book_id FROM books WHERE title=%s", (title,))
+            if cur.fetchone():
+                raise LibraryError("Book title already exists")
+            category_id = self._category_id(cur, category_name)
+            cur.execute("INSERT INTO books (title, author, category_id, total_copies, available_copies, updated_at) "
+                        "VALUES (%s, %s, %s, %s, %s, {now})",
+                        (title, author, category_id, total_copies, total_copies))
+            book_id = cur.lastrowid
+            self._add_copies(cur, [(book_id, 1, total_copies)])
+        self.categories.remember(category_id, category_name)
+        return book_id
+
+    def import_books(self, books):
+        """Add many books in one transaction; returns the titles skipped because they exist.
+
+        books is a list of (title, author, category_name, total_copies).  The
+        catalog is checked for the titles, and missing categories are created,
+        with a handful of statements for the whole list rather than a few per book.
+        """
+        existing = set()
+        with self.transaction() as cur:
+            for placeholders, part in _in_lists([book[0] for book in books]):
+                cur.execute(f"SELECT title FROM books WHERE title IN ({placeholders})", part)
+                existing.update(row[0].lower() for row in cur.fetchall())
+            new = [book for book in books if book[0].lower() not in existing]
+            category_ids = self._category_ids(cur, [book[2] for book in new])
+            cur.executemany("INSERT INTO books (title, author, category_id, total_copies, available_copies, updated_at) "
+                            "VALUES (%s, %s, %s, %s, %s, {now})",
+                            [(title, author, category_ids[category_name], copies, copies)
+                             for title, author, category_name, copies in new])
+            added = []
+            for placeholders, part in _in_lists([book[0] for book in new]):
+                cur.execute(f"SELECT book_id, total_copies FROM books WHERE title IN ({placeholders})", part)
+                added.extend((book_id, 1, copies) for book_id, copies in cur.fetchall())
+            self._add_copies(cur, added)
+        for category_name, category_id in category_ids.items():
+            self.categories.remember(category_id, category_name)
+        return [book[0] for book in books if book[0].lower() in existing]
+
+    def update_book(self, book_id, title, author, category_name, total_copies):
+        """Edit a book; new copies are added to the shelf, fewer withdraws copies from it"""
+        with self.transaction() as cur:
+            self._write_lock(cur)
+            cur.execute("SELECT book_id FROM books WHERE title=%s AND book_id != %s", (title, book_id))
+            if cur.fetchone():
+                raise LibraryError("Book title already exists")
+            category_id = self._category_id(cur, category_name)
+            cur.execute("SELECT total_copies, available_copies FROM books WHERE book_id=%s", (book_id,))
+            row = cur.fetchone()
+            if not row:
+                raise LibraryError("Book no longer exists")
+            old_total, old_available = row
+            if total_copies > old_total:
+                cur.execute("SELECT COUNT(*) FROM copies WHERE book_id = %s", (book_id,))
+                self._add_copies(cur, [(book_id, cur.fetchone()[0] + 1, total_copies - old_total)])
+            elif total_copies < old_total:
+                # Only copies on the shelf can be taken out of stock
+                cur.execute("SELECT copy_id FROM copies WHERE book_id = %s AND status = 'available' "
+                            "ORDER BY copy_id DESC LIMIT %s" + self.lock_sql, (book_id, old_total - total_copies))
+                withdrawn = [row[0] for row in cur.fetchall()]
+                if len(withdrawn) < old_total - total_copies:
+                    raise LibraryError(f"Only {old_available} copies are on the shelf; "
+                                       f"at least {old_total - old_available} must stay in stock")
+                cur.executemany("UPDATE copies SET status = 'withdrawn', updated_at = {now} WHERE copy_id = %s",
+                                [(copy_id,) for copy_id in withdrawn])
+            new_available = old_available + total_copies - old_total
+            cur.execute("UPDATE books SET title=%s, author=%s, category_id=%s, total_copies=%s, "
+                        "available_copies=%s, updated_at={now} WHERE book_id=%s",
+                        (title, author, category_id, total_copies, new_available, book_id))
+            # New copies go to the hold queue before the shelf
+            for _ in range(new_available):
+                if self._allocate(cur, book_id, date.today()) is None:
+                    break
+        self.categories.remember(category_id, category_name)
+
+    def delete_book(self, book_id):
+        """Delete a book nobody has out or on hold, with its copies, closed holds and hold queue"""
+        with self.transaction() as cur:
+            self._write_lock(cur)
+            # Locking the book first keeps a borrow or a new hold from slipping in past the checks
+            cur.execute("SELECT book_id FROM books WHERE book_id=%s" + self.lock_sql, (book_id,))
+            cur.execute("SELECT COUNT(*) FROM borrowed WHERE book_id=%s AND return_date IS NULL", (book_id,))
+            if cur.fetchone()[0] > 0:
+                raise LibraryError("Cannot delete book that is currently borrowed")
+            cur.execute("SELECT COUNT(*) FROM holds WHERE book_id=%s AND status IN ('waiting', 'ready')", (book_id,))
+            if cur.fetchone()[0] > 0:
+                raise LibraryError("Cannot delete book that is on hold")
+            cur.execute("DELETE FROM books WHERE book_id=%s", (book_id,))
+            for table in ("copies", "holds", "hold_tree", "hold_queues", "book_circulation"):
+                cur.execute(f"DELETE FROM {table} WHERE book_id=%s", (book_id,))
+
+    # BORROWING
+    BOOK_BORROWINGS_SQL = f"""
+        SELECT br.borrow_id, u.full_name, u.email, br.borrow_date, br.due_date, {LOAN_STATUS_SQL} as status
+        FROM borrowed br
+        JOIN users u ON br.user_id = u.user_id
+        WHERE br.book_id = %s
+        ORDER BY br.borrow_date DESC, br.borrow_id DESC
+    """
+
+    def book_borrowings(self, book_id, today=None):
+        """Loan history of one book"""
+        return self._fetchall(self.BOOK_BORROWINGS_SQL, (today or date.today(), book_id))
+
+    def stream_book_borrowings(self, book_id, batch_size=STREAM_BATCH, today=None):
+        """book_borrowings() as a generator of row batches, for histories too long to load at once"""
+        return self._stream(self.BOOK_BORROWINGS_SQL, (today or date.today(), book_id), batch_size)
+
+    def count_book_borrowings(self, book_id):
+        return self._fetchone("SELECT COUNT(*) FROM borrowed WHERE book_id = %s", (book_id,))[0]
+
+    def borrowings_page(self, after=None, limit=PAGE_SIZE, skip=0, today=None):
+        """All loans, newest first; after is the borrowing_key() of the last row shown"""
+        where, params = "", ()
+        if after is not None:
+            where = "WHERE (br.borrow_date, br.borrow_id) < (%s, %s)"
+            params = tuple(after)
+        return self._fetchall(f"""
+            SELECT br.borrow_id, b.title, u.full_name, u.email, br.borrow_date, br.due_date,
+                   {LOAN_STATUS_SQL} as status
+            FROM borrowed br
+            JOIN books b ON br.book_id = b.book_id
+            JOIN users u ON br.user_id = u.user_id
+            {where}
+            ORDER BY br.borrow_date DESC, br.borrow_id DESC LIMIT %s OFFSET %s
+        """, (today or date.today(),) + params + (limit, skip))
+
+    @staticmethod
+    def borrowing_key(row):
+        return (row[4], row[0])
+
+    def stream_borrowings(self, batch_size=STREAM_BATCH, today=None):
+        """Every loan in borrowings_page() order, as a generator of row batches"""
+        return self._stream(f"""
+            SELECT br.borrow_id, b.title, u.full_name, u.email, br.borrow_date, br.due_date,
+                   {LOAN_STATUS_SQL} as status
+            FROM borrowed br
+            JOIN books b ON br.book_id = b.book_id
+            JOIN users u ON br.user_id = u.user_id
+            ORDER BY br.borrow_date DESC, br.borrow_id DESC
+        """, (today or date.today(),), batch_size)
+
+    def count_borrowings(self):
+        return self._fetchone("""
+            SELECT COUNT(*) FROM borrowed br
+            JOIN books b ON br.book_id = b.book_id
+            JOIN users u ON br.user_id = u.user_id
+        """)[0]
+
+    def user_borrowings(self, user_id, today=None):
+        """Loan history of one user, flagging loans past their due date"""
+        return self._fetchall(f"""
+            SELECT br.borrow_id, b.title, b.author, br.borrow_date, br.due_date, {LOAN_STATUS_SQL} as status
+            FROM borrowed br
+            JOIN books b ON br.book_id = b.book_id
+            WHERE br.user_id = %s
+            ORDER BY br.borrow_date DESC
+        """, (today or date.today(), user_id))
+
+    def stream_overdue(self, today=None, batch_size=STREAM_BATCH):
+        """Open loans past their due date, longest overdue first, as a generator of row batches"""
+        return self._stream("""
+            SELECT br.borrow_id, u.email, u.full_name, b.title, br.borrow_date, br.due_date
+            FROM borrowed br
+            JOIN users u ON br.user_id = u.user_id
+            JOIN books b ON br.book_id = b.book_id
+            WHERE br.return_date IS NULL AND br.due_date < %s
+            ORDER BY br.due_date, br.borrow_id
+        """, (today or date.today(),), batch_size)
+
+    def loan_user(self, borrow_id):
+        """user_id of the loan's borrower, None for an unknown loan"""
+        row = self._fetchone("SELECT user_id FROM borrowed WHERE borrow_id=%s", (borrow_id,))
+        return row[0] if row else None
+
+    def borrow_book(self, user_id, book_id, today=None):
+        """Lend one copy for LOAN_DAYS days; returns the due date.
+
+        The copy set aside for the user's ready hold is taken if there is one,
+        else the first on the shelf.  Copies are picked with a locking read, so
+        two borrowers never get the same one, and books.available_copies only
+        ever moves with a copy's status, in the same transaction.
+        """
+        with self.transaction() as cur:
+            self._write_lock(cur)
+            return self._borrow(cur, user_id, book_id, today or date.today())
+
+    def _borrow(self, cur, user_id, book_id, today):
+        cur.execute("SELECT hold_id, copy_id FROM holds WHERE user_id = %s AND book_id = %s AND status = 'ready'"
+                    + self.lock_sql, (user_id, book_id))
+        ready = cur.fetchone()
+        if ready is not None:
+            copy_id = ready[1]
+            self._collect(cur, ready[0], copy_id)
+        else:
+            cur.execute("SELECT copy_id FROM copies WHERE book_id = %s AND status = 'available' "
+                        "ORDER BY copy_id LIMIT 1" + self.lock_sql, (book_id,))
+            row = cur.fetchone()
+            if row is None:
+                cur.execute("SELECT 1 FROM books WHERE book_id = %s", (book_id,))
+                if cur.fetchone() is None:
+                    raise NotFound("Book not found")
+                raise LibraryError("No copies available")
+            copy_id = row[0]
+            self._take_off_shelf(cur, user_id, book_id, copy_id, today)
+        return self._lend(cur, user_id, book_id, copy_id, today)
+
+    def borrow_copy(self, user_id, barcode, today=None):
+        """Lend the copy with this barcode, as scanned at the desk; returns (book_id, due date)"""
+        with self.transaction() as cur:
+            self._write_lock(cur)
+            return self._borrow_copy(cur, user_id, barcode, today or date.today())
+
+    def _borrow_copy(self, cur, user_id, barcode, today):
+        cur.execute("SELECT copy_id, book_id, status FROM copies WHERE barcode = %s" + self.lock_sql, (barcode,))
+        row = cur.fetchone()
+        if row is None:
+            raise NotFound(f"No copy has barcode {barcode}")
+        copy_id, book_id, status = row
+        if status == "held":
+            cur.execute("SELECT hold_id FROM holds WHERE copy_id = %s AND status = 'ready' AND user_id = %s",
+                        (copy_id, user_id))
+            hold = cur.fetchone()
+            if hold is None:
+                raise LibraryError("This copy is set aside for another reader's hold")
+            self._collect(cur, hold[0], copy_id)
+        elif status == "available":
+            self._take_off_shelf(cur, user_id, book_id, copy_id, today)
+        else:
+            raise LibraryError(f"This copy is {status.replace('_', ' ')}")
+        return book_id, self._lend(cur, user_id, book_id, copy_id, today)
+
+    def _set_copy(self, cur, copy_id, status):
+        cur.execute("UPDATE copies SET status = %s, updated_at = {now} WHERE copy_id = %s", (status, copy_id))
+
+    def _take_off_shelf(self, cur, user_id, book_id, copy_id, today):
+        self._set_copy(cur, copy_id, "on_loan")
+        cur.execute("UPDATE books SET available_copies = available_copies - 1, updated_at = {now} "
+                    "WHERE book_id = %s AND available_copies > 0", (book_id,))
+        if cur.rowcount == 0:
+            raise LibraryError("No copies available")
+        self._leave_queue(cur, user_id, book_id, today)
+
+    def _collect(self, cur, hold_id, copy_id):
+        # The copy was off the shelf since the hold became ready
+        cur.execute("UPDATE holds SET status = 'collected', updated_at = {now} WHERE hold_id = %s", (hold_id,))
+        self._set_copy(cur, copy_id, "on_loan")
+
+    def _lend(self, cur, user_id, book_id, copy_id, today):
+        cur.execute("SELECT COUNT(*) FROM borrowed WHERE user_id=%s AND book_id=%s AND return_date IS NULL",
+                    (user_id, book_id))
+        if cur.fetchone()[0] > 0:
+            # Rolling back puts the copy back
+            raise LibraryError("You already have this book borrowed")
+        due_date = today + timedelta(days=LOAN_DAYS)
+        cur.execute("INSERT INTO borrowed (user_id, book_id, copy_id, borrow_date, due_date, updated_at) "
+                    "VALUES (%s, %s, %s, %s, %s, {now})",
+                    (user_id, book_id, copy_id, today, due_date))
+        self._count_loan(cur, user_id, book_id, today)
+        return due_date
+
+    def return_book(self, borrow_id, today=None):
+        """Close a loan and put its copy back; a loan can only be returned once"""
+        with self.transaction() as cur:
+            self._return(cur, borrow_id, today or date.today())
+
+    def return_copy(self, barcode, today=None, user_id=None):
+        """Close the open loan of the copy with this barcode, as scanned at the desk; returns its borrow_id.
+
+        With user_id, only a loan of that user's is closed.
+        """
+        with self.transaction() as cur:
+            self._write_lock(cur)
+            return self._return_copy(cur, barcode, today or date.today(), user_id)
+
+    def _return_copy(self, cur, barcode, today, user_id=None):
+        cur.execute("""
+            SELECT br.borrow_id, br.user_id FROM copies c
+            JOIN borrowed br ON br.copy_id = c.copy_id AND br.return_date IS NULL
+            WHERE c.barcode = %s
+        """, (barcode,))
+        row = cur.fetchone()
+        if row is None:
+            cur.execute("SELECT 1 FROM copies WHERE barcode = %s", (barcode,))
+            if cur.fetchone() is None:
+                raise NotFound(f"No copy has barcode {barcode}")
+            raise LibraryError("This copy is not on loan")
+        if user_id is not None and row[1] != user_id:
+            raise NotYours("This copy is on loan to another reader")
+        self._return(cur, row[0], today)
+        return row[0]
+
+    def _return(self, cur, borrow_id, today, user_id=None):
+        if user_id is not None:
+            cur.execute("SELECT user_id FROM borrowed WHERE borrow_id = %s", (borrow_id,))
+            owner = cur.fetchone()
+            if owner is not None and owner[0] != user_id:
+                raise NotYours("This loan belongs to another reader")
+        cur.execute("UPDATE borrowed SET return_date = %s, updated_at = {now} "
+                    "WHERE borrow_id = %s AND return_date IS NULL",
+                    (today, borrow_id))
+        if cur.rowcount == 0:
+            cur.execute("SELECT 1 FROM borrowed WHERE borrow_id = %s", (borrow_id,))
+            if cur.fetchone() is None:
+                raise NotFound("Loan not found")
+            raise LibraryError("Book is already returned")
+        cur.execute("SELECT user_id, book_id, copy_id FROM borrowed WHERE borrow_id = %s", (borrow_id,))
+        user_id, book_id, copy_id = cur.fetchone()
+        self._put_back(cur, book_id, copy_id, today)
+        self._count_return(cur, user_id, today)
+
+    # DESK BATCHES
+    # A reader at the desk with a pile of books: every item of a batch is lent
+    # or returned in one transaction, and an item that breaks a library rule is
+    # rolled back to its savepoint and reported without holding up the rest.
+    def borrow_books(self, user_id, book_ids, today=None):
+        """borrow_book() for several books; returns [(book_id, due date, None) or (book_id, None, error)]"""
+        return self._batch(book_ids, lambda cur, book_id, today: self._borrow(cur, user_id, book_id, today), today)
+
+    def borrow_copies(self, user_id, barcodes, today=None):
+        """borrow_copy() for a pile of scanned copies; returns [(barcode, (book_id, due date), None) or (barcode, None, error)]"""
+        return self._batch(barcodes, lambda cur, barcode, today: self._borrow_copy(cur, user_id, barcode, today), today)
+
+    def return_books(self, borrow_ids, today=None, user_id=None):
+        """return_book() for several loans, with user_id only that user's; returns [(borrow_id, True, None) or (borrow_id, None, error)]"""
+        return self._batch(borrow_ids, lambda cur, borrow_id, today: self._return(cur, borrow_id, today, user_id) or True,
+                           today)
+
+    def return_copies(self, barcodes, today=None, user_id=None):
+        """return_copy() for a pile of scanned copies, with user_id only that user's; returns [(barcode, borrow_id, None) or (barcode, None, error)]"""
+        return self._batch(barcodes, lambda cur, barcode, today: self._return_copy(cur, barcode, today, user_id), today)
+
+    def _batch(self, items, step, today=None):
+        if len(items) > BATCH_LIMIT:
+            raise LibraryError(f"A batch holds at most {BATCH_LIMIT} items")
+        today = today or date.today()
+        results = []
+        with self.transaction() as cur:
+            self._write_lock(cur)
+            for item in items:
+                cur.execute("SAVEPOINT batch_item")
+                try:
+                    results.append((item, step(cur, item, today), None))
+                except LibraryError as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT batch_item")
+                    results.append((item, None, str(e)))
+                cur.execute("RELEASE SAVEPOINT batch_item")
+        return results
+
+    def copies_of(self, book_id):
+        """(copy_id, barcode, status, location) of every copy of a book, withdrawn ones included"""
+        return self._fetchall("SELECT copy_id, barcode, status, location FROM copies WHERE book_id = %s "
+                              "ORDER BY copy_id", (book_id,))
+
+    def _add_copies(self, cur, runs):
+        """New copies on the shelf: runs of (book_id, first number, how many), barcoded by copy_barcode()"""
+        cur.executemany("INSERT INTO copies (barcode, book_id, status, updated_at) VALUES (%s, %s, 'available', {now})",
+                        [(copy_barcode(book_id, number), book_id)
+                         for book_id, first, count in runs for number in range(first, first + count)])
+
+    # HOLDS
+    # Each title has a first-come first-served queue of holds, numbered by seq
+    # in the order they were placed.  hold_tree is a Fenwick tree over those
+    # numbers counting the holds still waiting: a hold's place in the queue is
+    # the sum of at most log2(HOLD_QUEUE_LIMIT) of its rows, and joining or
+    # leaving the queue updates as many, however long the queue is.  A copy
+    # coming back goes to the first waiting hold in the same transaction and
+    # waits HOLD_PICKUP_DAYS for its reader; expire_holds() frees it after that.
+    def _tree_add(self, cur, book_id, seq, delta):
+        nodes = []
+        while seq <= HOLD_QUEUE_LIMIT:
+            nodes.append(seq)
+            seq += seq & -seq
+        waiting = self.new_value.format(column="waiting")
+        cur.executemany("INSERT INTO hold_tree (book_id, node, waiting) VALUES (%s, %s, %s) "
+                        + self.upsert_sql.format(key="book_id, node", updates=f"waiting = waiting + {waiting}"),
+                        [(book_id, node, delta) for node in nodes])
+
+    def _waiting_up_to(self, cur, book_id, seq):
+        """Waiting holds on the title numbered seq or lower"""
+        nodes = []
+        while seq > 0:
+            nodes.append(seq)
+            seq -= seq & -seq
+        cur.execute(f"SELECT COALESCE(SUM(waiting), 0) FROM hold_tree WHERE book_id = %s "
+                    f"AND node IN ({', '.join(['%s'] * len(nodes))})", (book_id, *nodes))
+        return cur.fetchone()[0]
+
+    def _put_back(self, cur, book_id, copy_id, today):
+        """A copy is back: it goes to the first waiting hold, or on the shelf"""
+        self._set_copy(cur, copy_id, "available")
+        cur.execute("UPDATE books SET available_copies = available_copies + 1, updated_at = {now} "
+                    "WHERE book_id = %s", (book_id,))
+        self._allocate(cur, book_id, today, copy_id)
+
+    def _allocate(self, cur, book_id, today, copy_id=None):
+        """Set a copy on the shelf (copy_id, or any) aside for the first waiting hold; returns its hold_id, None if nobody waits"""
+        cur.execute("SELECT hold_id, seq FROM holds WHERE book_id = %s AND status = 'waiting' "
+                    "ORDER BY seq LIMIT 1" + self.lock_sql, (book_id,))
+        head = cur.fetchone()
+        if head is None:
+            return None
+        if copy_id is None:
+            cur.execute("SELECT copy_id FROM copies WHERE book_id = %s AND status = 'available' "
+                        "ORDER BY copy_id LIMIT 1" + self.lock_sql, (book_id,))
+            copy_id = cur.fetchone()[0]
+        self._set_copy(cur, copy_id, "held")
+        cur.execute("UPDATE books SET available_copies = available_copies - 1 WHERE book_id = %s", (book_id,))
+        cur.execute("UPDATE holds SET status = 'ready', copy_id = %s, ready_until = %s, updated_at = {now} "
+                    "WHERE hold_id = %s", (copy_id, today + timedelta(days=HOLD_PICKUP_DAYS), head[0]))
+        self._tree_add(cur, book_id, head[1], -1)
+        return head[0]
+
+    def _leave_queue(self, cur, user_id, book_id, today):
+        # A reader who got a copy off the shelf no longer needs their hold, nor a copy set aside
+        cur.execute("SELECT hold_id, seq, status, copy_id FROM holds WHERE user_id = %s AND book_id = %s "
+                    "AND status IN ('waiting', 'ready')" + self.lock_sql, (user_id, book_id))
+        for hold_id, seq, status, copy_id in cur.fetchall():
+            cur.execute("UPDATE holds SET status = 'collected', updated_at = {now} WHERE hold_id = %s", (hold_id,))
+            if status == "waiting":
+                self._tree_add(cur, book_id, seq, -1)
+            else:
+                self._put_back(cur, book_id, copy_id, today)
+
+    def place_hold(self, user_id, book_id, today=None):
+        """Queue the user for a title with no copies left; returns (hold_id, place in the queue)"""
+        today = today or date.today()
+        with self.transaction() as cur:
+            # Like borrow_book, the conditional UPDATE checks and locks the book at
+            # once, so a copy cannot come back unseen while the hold is queued
+            cur.execute("UPDATE books SET updated_at = {now} WHERE book_id = %s AND available_copies = 0",
+                        (book_id,))
+            if cur.rowcount == 0:
+                cur.execute("SELECT 1 FROM books WHERE book_id = %s", (book_id,))
+                if cur.fetchone() is None:
+                    raise NotFound("Book not found")
+                raise LibraryError("Copies are available, borrow it instead")
+            cur.execute("SELECT COUNT(*) FROM holds WHERE user_id=%s AND book_id=%s AND status IN ('waiting', 'ready')",
+                        (user_id, book_id))
+            if cur.fetchone()[0] > 0:
+                raise LibraryError("You already have this book on hold")
+            cur.execute("SELECT COUNT(*) FROM borrowed WHERE user_id=%s AND book_id=%s AND return_date IS NULL",
+                        (user_id, book_id))
+            if cur.fetchone()[0] > 0:
+                raise LibraryError("You already have this book borrowed")
+            self._add_counts(cur, "hold_queues", "book_id", book_id, {"placed": 1})
+            seq = cur.execute("SELECT placed FROM hold_queues WHERE book_id = %s", (book_id,)).fetchone()[0]
+            if seq > HOLD_QUEUE_LIMIT:
+                raise LibraryError("The hold queue for this book is full")
+            cur.execute("INSERT INTO holds (book_id, user_id, seq, status, placed_on, updated_at) "
+                        "VALUES (%s, %s, %s, 'waiting', %s, {now})", (book_id, user_id, seq, today))
+            hold_id = cur.lastrowid
+            self._tree_add(cur, book_id, seq, 1)
+            return hold_id, self._waiting_up_to(cur, book_id, seq)
+
+    def cancel_hold(self, hold_id, user_id=None, today=None):
+        """Give up a waiting or ready hold; with user_id, only that user's.  A set-aside copy goes to the next in line"""
+        today = today or date.today()
+        with self.transaction() as cur:
+            self._write_lock(cur)
+            cur.execute("SELECT book_id, user_id, seq, status, copy_id FROM holds WHERE hold_id = %s" + self.lock_sql,
+                        (hold_id,))
+            row = cur.fetchone()
+            if row is None or (user_id is not None and row[1] != user_id):
+                raise NotFound("Hold not found")
+            book_id, _, seq, status, copy_id = row
+            if status not in ("waiting", "ready"):
+                raise LibraryError(f"Hold is already {status}")
+            cur.execute("UPDATE holds SET status = 'cancelled', updated_at = {now} WHERE hold_id = %s", (hold_id,))
+            if status == "waiting":
+                self._tree_add(cur, book_id, seq, -1)
+            else:
+                self._put_back(cur, book_id, copy_id, today)
+
+    def expire_holds(self, today=None, batch_size=HOLD_EXPIRY_BATCH):
+        """Expire ready holds not collected in time, passing their copies on; returns how many expired.
+
+        Runs batch_size holds per transaction, so a large backlog does not hold
+        locks for long.
+        """
+        today = today or date.today()
+        expired = 0
+        while True:
+            with self.transaction() as cur:
+                self._write_lock(cur)
+                cur.execute("SELECT hold_id, book_id, copy_id FROM holds WHERE status = 'ready' AND ready_until < %s "
+                            "ORDER BY ready_until, hold_id LIMIT %s" + self.lock_sql, (today, batch_size))
+                batch = cur.fetchall()
+                for hold_id, book_id, copy_id in batch:
+                    cur.execute("UPDATE holds SET status = 'expired', updated_at = {now} WHERE hold_id = %s",
+                                (hold_id,))
+                    # The next reader's pickup window starts today, so this loop never sees it again
+                    self._put_back(cur, book_id, copy_id, today)
+            expired += len(batch)
+            if len(batch) < batch_size:
+                return expired
+
+    def hold_position(self, hold_id):
+        """Place of a waiting hold in its title's queue (1 is next), else None"""
+        with self.transaction() as cur:
+            row = cur.execute("SELECT book_id, seq, status FROM holds WHERE hold_id = %s", (hold_id,)).fetchone()
+            if row is None or row[2] != "waiting":
+                return None
+            return self._waiting_up_to(cur, row[0], row[1])
+
+    def queue_length(self, book_id):
+        """Holds waiting for the title"""
+        with self.transaction() as cur:
+            return self._waiting_up_to(cur, book_id, HOLD_QUEUE_LIMIT)
+
+    def user_holds(self, user_id):
+        """(hold_id, book_id, title, author, status, place in queue, ready until) of the user's open holds"""
+        with self.transaction() as cur:
+            rows = cur.execute("""
+                SELECT h.hold_id, h.book_id, b.title, b.author, h.status, h.seq, h.ready_until
+                FROM holds h
+                JOIN books b ON h.book_id = b.book_id
+                WHERE h.user_id = %s AND h.status IN ('waiting', 'ready')
+                ORDER BY h.hold_id
+            """, (user_id,)).fetchall()
+            return [row[:5] + (self._waiting_up_to(cur, row[1], row[5]) if row[4] == "waiting" else None, row[6])
+                    for row in rows]
+
+    # CIRCULATION STATISTICS
+    # Summary tables the analytics screen reads instead of the loan history.
+    # Kept in step inside the borrow and return transactions; see teakschema
+    # for the tables and for CIRCULATION_REBUILD, which recomputes them.
+    def _add_counts(self, cur, table, key_column, key, counts, assign=None):
+        """Add counts ({column: n}) to the row for key, creating it if missing; assign sets columns outright"""
+        assign = assign or {}
+        columns = [key_column] + list(counts) + list(assign)
+        updates = [f"{column} = {column} + {self.new_value.format(column=column)}" for column in counts]
+        updates += [f"{column} = {self.new_value.format(column=column)}" for column in assign]
+        cur.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                    + self.upsert_sql.format(key=key_column, updates=", ".join(updates)),
+                    (key,) + tuple(counts.values()) + tuple(assign.values()))
+
+    def _count_loan(self, cur, user_id, book_id, day):
+        self._add_counts(cur, "book_circulation", "book_id", book_id, {"loans": 1})
+        self._add_counts(cur, "user_activity", "user_id", user_id, {"loans": 1, "open_loans": 1},
+                         {"last_borrowed": day})
+        self._add_counts(cur, "daily_circulation", "day", day, {"loans": 1, "returns": 0})
+
+    def _count_return(self, cur, user_id, day):
+        self._add_counts(cur, "user_activity", "user_id", user_id, {"loans": 0, "open_loans": -1})
+        self._add_counts(cur, "daily_circulation", "day", day, {"loans": 0, "returns": 1})
+
+    def rebuild_statistics(self):
+        """Recompute the summary tables from the loan history, e.g. after loans were edited by hand"""
+        with self.transaction() as cur:
+            for statement in CIRCULATION_REBUILD:
+                cur.execute(statement)
+
+    def most_borrowed(self, limit=10):
+        """(book_id, title, author, loans) of the most borrowed titles"""
+        return self._fetchall("""
+            SELECT b.book_id, b.title, b.author, bc.loans
+            FROM book_circulation bc
+            JOIN books b ON bc.book_id = b.book_id
+            ORDER BY bc.loans DESC, bc.book_id DESC LIMIT %s
+        """, (limit,))
+
+    def category_circulation(self):
+        """(category, titles, copies, copies on loan, loans ever) per category, busiest first"""
+        # Copies off the shelf are on loan or set aside for a ready hold; the
+        # ready holds are few and found through idx_holds_ready
+        return self._fetchall("""
+            SELECT c.category_name, COUNT(*), SUM(b.total_copies),
+                   SUM(b.total_copies - b.available_copies - COALESCE(h.held, 0)), COALESCE(SUM(bc.loans), 0)
+            FROM books b
+            JOIN categories c ON b.category_id = c.category_id
+            LEFT JOIN book_circulation bc ON bc.book_id = b.book_id
+            LEFT JOIN (SELECT book_id, COUNT(*) AS held FROM holds WHERE status = 'ready' GROUP BY book_id) h
+                ON h.book_id = b.book_id
+            GROUP BY c.category_name
+            ORDER BY COALESCE(SUM(bc.loans), 0) DESC, c.category_name
+        """)
+
+    def count_active_borrowers(self):
+        """Users with at least one book out"""
+        return self._fetchone("SELECT COUNT(*) FROM user_activity WHERE open_loans > 0")[0]
+
+    def active_borrowers(self, limit=10):
+        """(user_id, full_name, email, open loans, loans ever, last borrowed) of the users with most books out"""
+        return self._fetchall("""
+            SELECT u.user_id, u.full_name, u.email, ua.open_loans, ua.loans, ua.last_borrowed
+            FROM user_activity ua
+            JOIN users u ON ua.user_id = u.user_id
+            WHERE ua.open_loans > 0
+            ORDER BY ua.open_loans DESC, ua.loans DESC, ua.user_id DESC LIMIT %s
+        """, (limit,))
+
+    def daily_circulation(self, since):
+        """(day, loans, returns) for every day since that saw any, oldest first"""
+        return self._fetchall("SELECT day, loans, returns FROM daily_circulation WHERE day >= %s ORDER BY day",
+                              (since,))
+
+    # FINES
+    def stream_late_loans(self, cutoff, returned_since, batch_size=STREAM_BATCH):
+        """Loans a fine may be due on, as batches of (borrow_id, user_id, due_date, return_date).
+
+        Open loans due before cutoff, and loans returned late on or after
+        returned_since, whose fines can now be settled at their final amount.
+        Both halves are ranges of the (return_date, due_date) index, so the
+        pass never reads the loans that are on time.
+        """
+        return self._stream("""
+            SELECT borrow_id, user_id, due_date, return_date FROM borrowed
+            WHERE return_date IS NULL AND due_date < %s
+            UNION ALL
+            SELECT borrow_id, user_id, due_date, return_date FROM borrowed
+            WHERE return_date >= %s AND return_date > due_date
+        """, (cutoff, returned_since), batch_size)
+
+    def save_fines(self, fines, assessed_on):
+        """Store (borrow_id, user_id, days_late, amount) fines, replacing earlier amounts for the same loans"""
+        with self.transaction() as cur:
+            existing = set()
+            for placeholders, ids in _in_lists(fine[0] for fine in fines):
+                cur.execute(f"SELECT borrow_id FROM fines WHERE borrow_id IN ({placeholders})", ids)
+                existing.update(row[0] for row in cur.fetchall())
+            cur.executemany("UPDATE fines SET days_late = %s, amount = %s, assessed_on = %s WHERE borrow_id = %s",
+                            [(days_late, amount, assessed_on, borrow_id)
+                             for borrow_id, _, days_late, amount in fines if borrow_id in existing])
+            cur.executemany("INSERT INTO fines (borrow_id, user_id, days_late, amount, assessed_on) "
+                            "VALUES (%s, %s, %s, %s, %s)",
+                            [(borrow_id, user_id, days_late, amount, assessed_on)
+                             for borrow_id, user_id, days_late, amount in fines if borrow_id not in existing])
+
+    def last_fine_run(self):
+        """Date of the latest fine assessment, or None before the first"""
+        row = self._fetchone("SELECT MAX(assessed_on) FROM fine_runs")
+        return _as_date(row[0]) if row and row[0] else None
+
+    def record_fine_run(self, assessed_on, policy, loans, total):
+        """Log one assessment pass; policy is (grace_days, daily_rate, cap)"""
+        with self.transaction() as cur:
+            cur.execute("DELETE FROM fine_runs WHERE assessed_on = %s", (assessed_on,))
+            cur.execute("INSERT INTO fine_runs (assessed_on, grace_days, daily_rate, cap, loans, total) "
+                        "VALUES (%s, %s, %s, %s, %s, %s)", (assessed_on,) + tuple(policy) + (loans, total))
+
+    def users_with_overdue(self, today=None):
+        """(user_id, full_name, email, overdue loans, oldest due date, fines) for every user with a loan overdue.
+
+        Fines are the user's whole materialized total, returned loans included,
+        as of the last assessment.
+        """
+        return self._fetchall("""
+            SELECT u.user_id, u.full_name, u.email, COUNT(*), MIN(br.due_date),
+                   COALESCE((SELECT SUM(f.amount) FROM fines f WHERE f.user_id = u.user_id), 0)
+            FROM borrowed br
+            JOIN users u ON br.user_id = u.user_id
+            WHERE br.return_date IS NULL AND br.due_date < %s
+            GROUP BY u.user_id, u.full_name, u.email
+            ORDER BY MIN(br.due_date), u.user_id
+        """, (today or date.today(),))
+
+    # EXPORTS
+    def export_watermark(self, table):
+        """Newest updated_at in an exported table; rows changed after it are new to an export taken now"""
+        if table not in EXPORTS:
+            raise KeyError(table)
+        row = self._fetchone(f"SELECT MAX(updated_at) FROM {table}")
+        return _as_datetime(row[0]) if row and row[0] else datetime.min
+
+    def count_export(self, table, since=None):
+        source, _, _ = EXPORTS[table]
+        where, params = _changed_since(since)
+        return self._fetchone(f"SELECT COUNT(*) FROM {source} {where}", params)[0]
+
+    def stream_export(self, table, since=None, batch_size=STREAM_BATCH):
+        """Rows of an export (see EXPORTS) in primary key order, as a generator of batches.
+
+        With since, only rows updated after it, re-reading CHANGE_OVERLAP
+        before it as books_changed_since() does; deleted rows are not reported.
+        """
+        source, columns, key = EXPORTS[table]
+        where, params = _changed_since(since)
+        return self._stream(f"SELECT {', '.join(expression for _, _, expression in columns)} "
+                            f"FROM {source} {where} ORDER BY {key}", params, batch_size)
+
+
+# table -> (FROM clause, [(column, type, expression)], order); password hashes never leave the database
+EXPORTS = {
+    "books": ("books b JOIN categories c ON b.category_id = c.category_id", [
+        ("book_id", "int", "b.book_id"),
+        ("title", "str", "b.title"),
+        ("author", "str", "b.author"),
+        ("category", "str", "c.category_name"),
+        ("total_copies", "int", "b.total_copies"),
+        ("available_copies", "int", "b.available_copies"),
+        ("updated_at", "timestamp", "b.updated_at"),
+    ], "b.book_id"),
+    "users": ("users", [
+        ("user_id", "int", "user_id"),
+        ("full_name", "str", "full_name"),
+        ("email", "str", "email"),
+        ("role", "str", "role"),
+        ("updated_at", "timestamp", "updated_at"),
+    ], "user_id"),
+    "borrowed": ("borrowed", [
+        ("borrow_id", "int", "borrow_id"),
+        ("user_id", "int", "user_id"),
+        ("book_id", "int", "book_id"),
+        ("borrow_date", "date", "borrow_date"),
+        ("due_date", "date", "due_date"),
+        ("return_date", "date", "return_date"),
+        ("updated_at", "timestamp", "updated_at"),
+    ], "borrow_id"),
+}
+
+
+def _changed_since(since):
+    # updated_at is unambiguous in every export's FROM clause
+    if since is None:
+        return "", ()
+    return "WHERE updated_at >= %s", (since - min(CHANGE_OVERLAP, since - datetime.min),)
+
+
+def _in_lists(values):
+    """(placeholders, values) for IN (...) lists of at most IN_LIST_SIZE values"""
+    values = list(values)
+    for start in range(0, len(values), IN_LIST_SIZE):
+        part = values[start:start + IN_LIST_SIZE]
+        yield ", ".join(["%s"] * len(part)), part
+
+
+def _as_date(value):
+    # SQLite hands dates back as text, MySQL as date
+    return date.fromisoformat(value[:10]) if isinstance(value, str) else value
+
+
+def _as_datetime(value):
+    # SQLite hands timestamps back as text, MySQL as datetime
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+# MYSQL BACKEND
+class MySQLStore(LibraryStore):
+    def __init__(self, config, **pool_options):
+        self.config = dict(config)
+        # Pooled connections are reused, so drop unread rows instead of failing the next query
+        self.config.setdefault("consume_results", True)
+        super().__init__(**pool_options)
+
+    def _connect(self):
+        import mysql.connector
+        return mysql.connector.connect(**self.config)
+
+    def _ping(self, conn):
+        conn.ping(reconnect=False)
+
+    def _stream_cursor(self, db):
+        # Explicitly unbuffered: rows stay on the server until fetchmany() asks for them
+        return db.cursor(buffered=False)
+
+    def _search_sql(self, tokens, field, available):
+        # Boolean mode: every word required, trailing * for prefix matches.  Words
+        # shorter than innodb_ft_min_token_size (default 3) are not indexed.
+        query = " ".join(f"+{token}*" for token in tokens)
+        columns = ("s.title", "s.author", "s.category_name")
+        matched = columns[SEARCH_FIELDS[field]] if field in SEARCH_FIELDS else ", ".join(columns)
+        select = f"""
+            SELECT b.book_id, b.title, b.author, s.category_name, b.available_copies
+            FROM book_search s
+            JOIN books b ON b.book_id = s.book_id
+            WHERE MATCH({matched}) AGAINST (%s IN BOOLEAN MODE) AND {IN_STOCK_SQL[available]}
+        """
+        return select, query
+
+    def _search(self, tokens, field, limit, offset, available):
+        select, query = self._search_sql(tokens, field, available)
+        return self._fetchall(f"""
+            {select}
+            ORDER BY 10 * MATCH(s.title) AGAINST (%s IN BOOLEAN MODE)
+                   + 5 * MATCH(s.author) AGAINST (%s IN BOOLEAN MODE)
+                   + MATCH(s.category_name) AGAINST (%s IN BOOLEAN MODE) DESC, b.book_id
+            LIMIT %s OFFSET %s
+        """, (query, query, query, query, limit, offset))
+
+    def _count_search(self, tokens, field, available):
+        select, query = self._search_sql(tokens, field, available)
+        return self._fetchone(f"SELECT COUNT(*) FROM ({select}) hits", (query,))[0]
+
+    def build_search_index(self):
+        """Create the book_search FULLTEXT table and its triggers, then fill it (migration 3 does this too)"""
+        db = self.connection()
+        try:
+            cur = db.cursor()
+            for statement in MYSQL_SEARCH_SCHEMA:
+                cur.execute(statement)
+            db.commit()
+        finally:
+            db.close()
+
+
+# SQLITE BACKEND
+class SQLiteStore(LibraryStore):
+    """Embedded backend for branch kiosks, benchmarks and offline runs"""
+
+    dialect = "sqlite"
+    placeholder = "?"
+    now_sql = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+    upsert_sql = "ON CONFLICT({key}) DO UPDATE SET {updates}"
+    new_value = "excluded.{column}"
+    lock_sql = ""  # A write transaction already has the whole file to itself
+    # sqlite3 only begins a transaction at the first write, so reads before it
+    # would not be part of it
+    begin_write_sql = "BEGIN IMMEDIATE"
+
+    def __init__(self, path, **pool_options):
+        self.path = path
+        super().__init__(**pool_options)
+        # Creates a new file, or brings an older one up to date (see teakschema)
+        migrate(self)
+
+    def build_search_index(self):
+        """Rebuild the FTS5 index from the books table"""
+        with self.transaction() as cur:
+            for statement in SQLITE_SEARCH_REBUILD:
+                cur.execute(statement)
+
+    def _search_tiers(self, tokens, field):
+        """FTS5 queries for each relevance tier, best first.
+
+        Ranking every hit with bm25() costs a full pass over all matches, which
+        is far too slow for a two-letter prefix on a large catalog.  Instead
+        hits are tiered by where the words matched, and each tier is read in
+        rowid order with LIMIT, so a page touches only the rows it returns.
+        """
+        words = _fts_words(tokens)
+        if field in SEARCH_FIELDS:
+            return [f"{('title', 'author', 'category_name')[SEARCH_FIELDS[field]]} : ({words})"]
+        title, author, category = (f"{column} : ({words})" for column in ("title", "author", "category_name"))
+        return [
+            title,
+            f"{author} NOT {title}",
+            f"{category} NOT ({title} OR {author})",
+            # Words spread over several fields, e.g. "tolkien hobbit"
+            f"({words}) NOT ({title} OR {author} OR {category})",
+        ]
+
+    def _search(self, tokens, field, limit, offset, available):
+        rows = []
+        for tier in self._search_tiers(tokens, field):
+            if len(rows) >= limit:
+                break
+            found = self._fetchall(f"""
+                SELECT b.book_id, b.title, b.author, books_fts.category_name, b.available_copies
+                FROM books_fts
+                JOIN books b ON b.book_id = books_fts.rowid
+                WHERE books_fts MATCH %s AND {IN_STOCK_SQL[available]}
+                ORDER BY books_fts.rowid LIMIT %s OFFSET %s
+            """, (tier, limit - len(rows), offset))
+            if found:
+                rows.extend(found)
+                offset = 0
+            elif offset:
+                # The whole tier lies before the requested page
+                offset = max(offset - self._count_tier(tier, available), 0)
+        return rows
+
+    def _count_tier(self, tier, available):
+        return self._fetchone(f"""
+            SELECT COUNT(*) FROM books_fts
+            JOIN books b ON b.book_id = books_fts.rowid
+            WHERE books_fts MATCH %s AND {IN_STOCK_SQL[available]}
+        """, (tier,))[0]
+
+    def _count_search(self, tokens, field, available):
+        # The tiers split the plain match into disjoint parts, so count that once
+        if field in SEARCH_FIELDS:
+            return self._count_tier(self._search_tiers(tokens, field)[0], available)
+        return self._count_tier(_fts_words(tokens), available)
+
+    def _connect(self):
+        # The sqlite3 module keeps a per-connection cache of prepared statements;
+        # every query here is parameterised so repeated calls reuse them.
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+
+def _fts_words(tokens):
+    # Every word required, each also matching as a prefix
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+# STORE SELECTION
+MYSQL_CONFIG = {
+    "host": os.environ.get("LIBRARY_DB_HOST", "localhost"),
+    "user": os.environ.get("LIBRARY_DB_USER", "root"),
+    "password": os.environ.get("LIBRARY_DB_PASSWORD", ""),
+    "database": os.environ.get("LIBRARY_DB_NAME", "library_system"),
+}
+
+
+def open_store(backend=None, **pool_options):
+    """Store selected by LIBRARY_DB_BACKEND ("mysql", the default, or "sqlite")"""
+    backend = (backend or os.environ.get("LIBRARY_DB_BACKEND", "mysql")).lower()
+    pool_options.setdefault("pool_size", int(os.environ.get("LIBRARY_DB_POOL_SIZE", 5)))
+    pool_options.setdefault("idle_timeout", float(os.environ.get("LIBRARY_DB_POOL_IDLE", 300)))
+    if backend == "sqlite":
+        return SQLiteStore(os.environ.get("LIBRARY_SQLITE_PATH", "library.db"), **pool_options)
+    if backend == "mysql":
+        return MySQLStore(MYSQL_CONFIG, **pool_options)
+    raise ValueError(f"Unknown database backend: {backend}")
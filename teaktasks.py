@@ -0,0 +1,222 @@
+"""Background work for the Tk interface.
+
+Tk widgets may only be touched from the thread running the mainloop, so the
+slow part of a handler (a query) runs on a worker thread and its result is
+handed back through a queue that the mainloop drains with after().
+"""
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TaskTimeout(Exception):
+    """Passed to on_error when a task has not finished within its timeout"""
+
+
+class Task:
+    """Handle for submitted work; cancel() drops the result if it arrives later"""
+
+    def __init__(self, runner, future):
+        self.future = future
+        self.cancelled = False
+        self.settled = False  # result delivered, cancelled or timed out
+        self._runner = runner
+        self._timer = None
+
+    def cancel(self):
+        self.cancelled = True
+        self.future.cancel()
+        self._runner._settle(self)
+
+    def done(self):
+        return self.future.done()
+
+
+class StreamTask(Task):
+    """Handle for a stream; batches wait in a bounded queue until the Tk thread takes them"""
+
+    def __init__(self, runner, buffer):
+        super().__init__(runner, None)
+        self.rows = 0  # rows delivered so far
+        self._batches = queue.Queue(buffer)
+
+    def cancel(self):
+        self.cancelled = True  # The worker notices before its next batch
+        self._runner._settle(self)
+
+    def _offer(self, batch):
+        # Blocks while the queue is full, so a slow window throttles the reader
+        while not (self.cancelled or self._runner._stopped):
+            try:
+                self._batches.put(batch, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+# TASK RUNNER
+class TaskRunner:
+    """Runs callables on a thread pool and calls back on the Tk thread.
+
+    root is any Tk widget; its after() drives delivery of results.  on_busy(busy)
+    is called with True when work starts while nothing else is running and with
+    False once every task has been settled, e.g. to show a busy cursor.
+    """
+
+    def __init__(self, root, workers=4, poll_ms=15, on_busy=None):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.on_busy = on_busy
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="library-db")
+        self._results = queue.Queue()
+        self._pending = 0  # results not yet taken off the queue
+        self._active = 0   # tasks whose callbacks are still owed
+        self._polling = False
+        self._stopped = False
+
+    @property
+    def busy(self):
+        return self._active > 0
+
+    def submit(self, func, *args, on_done=None, on_error=None, timeout_ms=None):
+        """Run func(*args) in the background; on_done(result) or on_error(exc) run on the Tk thread.
+
+        With timeout_ms, on_error gets a TaskTimeout if no result has arrived by
+        then and a late result is dropped.  The worker itself cannot be stopped;
+        it finishes in the background.
+        """
+        future = self._executor.submit(func, *args)
+        task = Task(self, future)
+        self._pending += 1
+        self._active += 1
+        if self._active == 1 and self.on_busy:
+            self.on_busy(True)
+        future.add_done_callback(lambda f: self._results.put((task, on_done, on_error)))
+        if timeout_ms is not None:
+            task._timer = self.root.after(timeout_ms, lambda: self._expire(task, timeout_ms, on_error))
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+        return task
+
+    def stream(self, batches, *args, on_batch=None, on_done=None, on_error=None, buffer=4):
+        """Iterate batches(*args) in the background, handing each item to on_batch on the Tk thread.
+
+        batches is a generator function (e.g. a store's stream_* query).  At most
+        buffer batches wait to be shown; the worker blocks until the window has
+        caught up, so memory stays bounded whatever the result size.  on_done(rows)
+        follows the last batch with the number of rows delivered.  cancel() stops
+        the worker before its next batch and closes the generator.
+        """
+        task = StreamTask(self, buffer)
+
+        def produce():
+            generator = batches(*args)
+            try:
+                for batch in generator:
+                    if not task._offer(batch):
+                        break
+            finally:
+                generator.close()
+
+        task.future = self._executor.submit(produce)
+        self._active += 1
+        if self._active == 1 and self.on_busy:
+            self.on_busy(True)
+        self.root.after(self.poll_ms, lambda: self._drain(task, on_batch, on_done, on_error))
+        return task
+
+    def _drain(self, task, on_batch, on_done, on_error):
+        if task.cancelled:
+            return
+        # A few batches per tick keeps the window responsive while rows pour in
+        for _ in range(2):
+            try:
+                batch = task._batches.get_nowait()
+            except queue.Empty:
+                break
+            task.rows += len(batch)
+            if on_batch:
+                on_batch(batch)
+            if task.cancelled:
+                return
+        # done() first: once the worker has finished, an empty queue means nothing is left
+        if task.future.done() and task._batches.empty():
+            self._settle(task)
+            error = task.future.exception()
+            if error is not None:
+                if on_error:
+                    on_error(error)
+            elif on_done:
+                on_done(task.rows)
+            return
+        self.root.after(self.poll_ms, lambda: self._drain(task, on_batch, on_done, on_error))
+
+    def _expire(self, task, timeout_ms, on_error):
+        task._timer = None
+        if task.settled:
+            return
+        task.cancel()
+        if on_error:
+            on_error(TaskTimeout(f"No answer after {timeout_ms / 1000:g} seconds"))
+
+    def _settle(self, task):
+        if task.settled:
+            return
+        task.settled = True
+        if task._timer is not None:
+            self.root.after_cancel(task._timer)
+            task._timer = None
+        self._active -= 1
+        if not self._active and self.on_busy:
+            self.on_busy(False)
+
+    def _poll(self):
+        while True:
+            try:
+                task, on_done, on_error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if task.cancelled:
+                continue
+            self._settle(task)
+            error = task.future.exception()
+            if error is not None:
+                if on_error:
+                    on_error(error)
+            elif on_done:
+                on_done(task.future.result())
+        if self._pending:
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
+
+    def shutdown(self):
+        self._stopped = True  # Releases stream workers waiting for the window
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# DEBOUNCER
+class Debouncer:
+    """Calls callback once input has been quiet for delay_ms"""
+
+    def __init__(self, root, delay_ms, callback):
+        self.root = root
+        self.delay_ms = delay_ms
+        self.callback = callback
+        self._after_id = None
+
+    def trigger(self, *_):
+        self.cancel()
+        self._after_id = self.root.after(self.delay_ms, self.flush)
+
+    def flush(self, *_):
+        """Run the callback now, dropping any pending delayed call"""
+        self.cancel()
+        self.callback()
+
+    def cancel(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None